@@ -0,0 +1,145 @@
+"""
+Broadcast throughput against a flood-limited fake Bot API.
+
+First replays a wave of /start commands (each user several times) through
+the user registry and compares it with one INSERT transaction per /start.
+Then broadcasts to every recorded user through BroadcastEngine with the
+send queue installed; FloodLimitedBotAPI answers 429 past 30 messages per
+second and every tenth user has blocked the bot. Reports messages per second,
+429s, delivered/blocked counts and, with --interrupt, how many users got the
+message twice when delivery is stopped midway and resumed from the checkpoint.
+
+    python -m benchmarks.broadcast --users 600 [--interrupt 5] [--latency 0.05]
+"""
+import argparse
+import asyncio
+import logging
+import time
+from collections import Counter
+
+from benchmarks.seed import reset_database
+
+from aiogram import Bot
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.client.telegram import TelegramAPIServer
+from sqlalchemy import func, select
+
+from benchmarks.fake_bot_api import FloodLimitedBotAPI
+from middlewares.send_queue import SendQueueMiddleware
+from utils.broadcast import BroadcastEngine, claim_broadcast, create_broadcast
+from utils.database import BotUser, async_session, dialect_insert, engine
+from utils.send_queue import SendScheduler
+from utils.user_registry import UserRegistry
+
+TOKEN = "123456:BENCHMARK-TOKEN"
+ADMIN_CHAT = 42
+FIRST_USER = 100000
+
+
+class BlockedUsersBotAPI(FloodLimitedBotAPI):
+    """FloodLimitedBotAPI where every blocked_every-th user has blocked the bot"""
+
+    def __init__(self, blocked_every: int = 10, **kwargs):
+        super().__init__(**kwargs)
+        self.blocked_every = blocked_every
+
+    async def respond(self, method, params):
+        chat_id = int(params.get("chat_id") or 0)
+        if method == "sendmessage" and chat_id >= FIRST_USER and chat_id % self.blocked_every == 0:
+            return {"ok": False, "error_code": 403, "description": "Forbidden: bot was blocked by the user"}
+        return await super().respond(method, params)
+
+
+async def bench_registry(users: int, repeats: int) -> None:
+    starts = [FIRST_USER + number % users for number in range(users * repeats)]
+
+    await reset_database()
+    started = time.perf_counter()
+    async with async_session() as session:
+        stmt = dialect_insert(session, BotUser.__table__).on_conflict_do_nothing()
+    for user_id in starts[:2000]:
+        async with async_session() as session:
+            await session.execute(stmt, [{"user_id": user_id}])
+            await session.commit()
+    per_start = (time.perf_counter() - started) / 2000
+
+    await reset_database()
+    registry = UserRegistry(flush_interval=0.05, batch_size=500)
+    started = time.perf_counter()
+    for number, user_id in enumerate(starts):
+        registry.remember(user_id)
+        if number % 100 == 0:
+            # Let flushes run between bursts of updates, as the dispatcher would
+            await asyncio.sleep(0)
+    await registry.close()
+    elapsed = time.perf_counter() - started
+    async with async_session() as session:
+        recorded = await session.scalar(select(func.count()).select_from(BotUser))
+
+    print(f"Registry: {len(starts)} /start from {users} users, {recorded} recorded")
+    print(f"  one INSERT per /start: {1 / per_start:>10.0f} /start per second (measured on 2000)")
+    print(f"  batched registry:      {len(starts) / elapsed:>10.0f} /start per second ({elapsed:.2f} s)")
+
+
+async def deliver(bot: Bot, broadcast_engine: BroadcastEngine, interrupt: float) -> dict:
+    broadcast = await claim_broadcast(broadcast_engine.lease)
+    task = asyncio.create_task(broadcast_engine.deliver(bot, broadcast))
+    if interrupt:
+        await asyncio.sleep(interrupt)
+        task.cancel()
+        try:
+            await task
+        except asyncio.CancelledError:
+            pass
+        print(f"  stopped after {interrupt:.1f} s, resuming from the checkpoint")
+        broadcast = await claim_broadcast(broadcast_engine.lease)
+        task = asyncio.create_task(broadcast_engine.deliver(bot, broadcast))
+    return await task
+
+
+async def bench_broadcast(args) -> None:
+    api = await BlockedUsersBotAPI(latency=args.latency, global_limit=30).start()
+    bot = Bot(token=TOKEN, session=AiohttpSession(api=TelegramAPIServer.from_base(api.base_url)))
+    scheduler = SendScheduler(args.rate, 1, 3)
+    bot.session.middleware(SendQueueMiddleware(scheduler))
+    broadcast_engine = BroadcastEngine(workers=args.workers, chunk_size=args.chunk_size, lease=60, poll_interval=60)
+
+    await create_broadcast("<b>Скидка 20%</b> на все жидкости до конца недели!", ADMIN_CHAT)
+    started = time.perf_counter()
+    try:
+        report = await deliver(bot, broadcast_engine, args.interrupt)
+    finally:
+        elapsed = time.perf_counter() - started
+        await scheduler.close()
+        await bot.session.close()
+        await api.stop()
+
+    received = Counter(item["chat_id"] for item in api.sent if item["chat_id"] != ADMIN_CHAT)
+    handled = report["delivered"] + report["blocked"] + report["failed"]
+    print(f"Broadcast to {report['recipients']} users, {args.workers} workers, chunks of {args.chunk_size}")
+    print(f"  {elapsed:.2f} s, {handled / elapsed:.1f} messages per second, {sum(api.rejected.values())} answered 429")
+    print(f"  delivered {report['delivered']}, blocked {report['blocked']}, failed {report['failed']}")
+    print(f"  users who got it twice: {sum(1 for count in received.values() if count > 1)}")
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=600)
+    parser.add_argument("--repeats", type=int, default=5, help="/start commands per user")
+    parser.add_argument("--workers", type=int, default=30)
+    parser.add_argument("--chunk-size", type=int, default=100)
+    parser.add_argument("--rate", type=float, default=30, help="send queue global rate")
+    parser.add_argument("--latency", type=float, default=0.05, help="fake API latency, seconds")
+    parser.add_argument("--interrupt", type=float, default=0.0, help="stop delivery after this many seconds and resume")
+    args = parser.parse_args()
+    logging.getLogger("middlewares.send_queue").setLevel(logging.ERROR)
+
+    try:
+        await bench_registry(args.users, args.repeats)
+        await bench_broadcast(args)
+    finally:
+        await engine.dispose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
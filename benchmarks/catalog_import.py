@@ -0,0 +1,85 @@
+"""
+Bulk catalog import throughput.
+
+Writes a generated supplier price list (CSV with category names, as suppliers
+send them) and imports it into an empty catalog, re-imports an export of the
+result to measure the update path, and compares both with the per-row
+add_product() calls the admin FSM flow makes.
+
+    python -m benchmarks.catalog_import --products 50000
+"""
+import argparse
+import asyncio
+import csv
+import os
+import random
+import tempfile
+import time
+
+from benchmarks.seed import reset_database
+
+from utils.catalog_io import export_catalog, import_catalog
+from utils.database import add_category, add_product, engine
+
+BRANDS = ["Elf", "Vaporesso", "Geekvape", "Smok", "Voopoo", "Lost Mary", "Husky", "Brusko", "Pasito", "Xros"]
+KINDS = ["жидкость", "картридж", "испаритель", "под", "одноразка", "аккумулятор", "зарядка", "чехол", "койл", "набор"]
+
+
+def write_price_list(path: str, products: int, categories: int) -> None:
+    rng = random.Random(1)
+    with open(path, "w", encoding="utf-8", newline="") as f:
+        writer = csv.writer(f, delimiter=";")
+        writer.writerow(["name", "description", "price", "category"])
+        for number in range(products):
+            writer.writerow([
+                f"{rng.choice(BRANDS)} {rng.choice(KINDS)} {number}",
+                f"Описание товара {number}",
+                f"{rng.randint(100, 5000)},{rng.randint(0, 99):02d}",
+                f"Категория {number % categories + 1}",
+            ])
+
+
+def print_report(name: str, rows: int, seconds: float) -> None:
+    print(f"{name:<34}{rows:>10}{seconds:>10.2f}{rows / seconds:>14.0f}")
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--products", type=int, default=50000)
+    parser.add_argument("--categories", type=int, default=20)
+    parser.add_argument("--per-row", type=int, default=500, help="rows added one by one for comparison")
+    args = parser.parse_args()
+
+    directory = tempfile.mkdtemp()
+    price_list = os.path.join(directory, "price_list.csv")
+    export_path = os.path.join(directory, "catalog.json")
+    write_price_list(price_list, args.products, args.categories)
+    print(f"{'run':<34}{'rows':>10}{'seconds':>10}{'rows/s':>14}")
+
+    try:
+        await reset_database()
+        report = await import_catalog(price_list)
+        print_report("import CSV, new products", report["products"], report["seconds"])
+
+        report = await export_catalog(export_path)
+        print_report("export JSON", report["products"], report["seconds"])
+
+        report = await import_catalog(export_path)
+        print_report("import JSON, update by id", report["products"], report["seconds"])
+
+        await reset_database()
+        category_id = await add_category("Категория")
+        started = time.perf_counter()
+        for number in range(args.per_row):
+            await add_product(f"Товар {number}", "Описание", 100.0, category_id)
+        print_report("add_product() per row", args.per_row, time.perf_counter() - started)
+    finally:
+        for path in (price_list, export_path):
+            if os.path.exists(path):
+                os.remove(path)
+        os.rmdir(directory)
+        await engine.dispose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,243 @@
+"""
+Minimal offline stand-in for the Telegram Bot API.
+
+Serves getUpdates from an in-memory queue and answers every other method with
+a plausible result built from the request parameters, counting calls per
+method. Point a Bot at it with TelegramAPIServer.from_base(fake.base_url).
+FloodLimitedBotAPI additionally enforces Telegram-like flood limits.
+"""
+import asyncio
+import itertools
+import json
+import random
+import time
+from collections import Counter, defaultdict, deque
+from typing import Any, Deque, Dict, Iterator, List, Optional
+
+from aiohttp import web
+
+BOT_USER = {"id": 1, "is_bot": True, "first_name": "ShopBot", "username": "shop_bot"}
+
+# Methods whose successful result is a plain True
+TRUE_METHODS = {
+    "answercallbackquery", "deletemessage", "setwebhook", "deletewebhook",
+    "setmycommands", "answerinlinequery", "sendchataction",
+}
+
+_update_ids = itertools.count(1)
+_message_ids = itertools.count(1000)
+_FILE_CHUNK = b"\xff\xd8\xff" + bytes(64 * 1024 - 3)
+
+
+def file_chunks(size: int) -> Iterator[bytes]:
+    """Content of a file served by FakeBotAPI, as chunks of one reused buffer"""
+    while size > 0:
+        chunk = _FILE_CHUNK[:size] if size < len(_FILE_CHUNK) else _FILE_CHUNK
+        yield chunk
+        size -= len(chunk)
+
+
+def make_user(user_id: int) -> dict:
+    return {"id": user_id, "is_bot": False, "first_name": f"user{user_id}"}
+
+
+def make_message(user_id: int, text: Optional[str] = None, message_id: Optional[int] = None, **extra: Any) -> dict:
+    message = {
+        "message_id": message_id or next(_message_ids),
+        "date": int(time.time()),
+        "chat": {"id": user_id, "type": "private"},
+        "from": make_user(user_id),
+    }
+    if text is not None:
+        message["text"] = text
+        if text.startswith("/"):
+            message["entities"] = [{"type": "bot_command", "offset": 0, "length": len(text.split()[0])}]
+    message.update(extra)
+    return message
+
+
+def make_message_update(user_id: int, text: str) -> dict:
+    return {"update_id": next(_update_ids), "message": make_message(user_id, text)}
+
+
+def make_callback_update(user_id: int, data: str, message: Optional[dict] = None) -> dict:
+    return {
+        "update_id": next(_update_ids),
+        "callback_query": {
+            "id": str(next(_update_ids)),
+            "from": make_user(user_id),
+            "chat_instance": str(user_id),
+            "data": data,
+            "message": message or make_message(user_id, "menu", **{"from": BOT_USER}),
+        },
+    }
+
+
+def _payload_size(params: Dict[str, Any]) -> int:
+    """Approximate size of a chunked multipart request from its parsed fields"""
+    size = 0
+    for value in params.values():
+        if isinstance(value, web.FileField):
+            value.file.seek(0, 2)
+            size += value.file.tell()
+        else:
+            size += len(str(value).encode())
+    return size
+
+
+class FakeBotAPI:
+    """aiohttp server imitating api.telegram.org for benchmarks"""
+
+    def __init__(self, latency: float = 0.0, upload_mbps: Optional[float] = None):
+        self.latency = latency
+        # Simulated client -> API bandwidth: requests are delayed by their size
+        self.upload_mbps = upload_mbps
+        self.bytes_received: Counter = Counter()
+        # Size of files served by the /file endpoint; see file_chunks()
+        self.file_size = 1027
+        self.calls: Counter = Counter()
+        self.sent: List[dict] = []
+        self.updates: asyncio.Queue = asyncio.Queue()
+        self.base_url = ""
+        self._runner: Optional[web.AppRunner] = None
+
+    async def start(self, host: str = "127.0.0.1", port: int = 0) -> "FakeBotAPI":
+        app = web.Application(client_max_size=64 * 1024 * 1024)
+        app.router.add_post("/bot{token}/{method}", self._handle)
+        app.router.add_get("/file/bot{token}/{path:.*}", self._handle_file)
+        self._runner = web.AppRunner(app)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, host, port)
+        await site.start()
+        port = site._server.sockets[0].getsockname()[1]
+        self.base_url = f"http://{host}:{port}"
+        return self
+
+    async def stop(self) -> None:
+        if self._runner:
+            await self._runner.cleanup()
+
+    def push_update(self, update: dict) -> None:
+        self.updates.put_nowait(update)
+
+    async def _params(self, request: web.Request) -> Dict[str, Any]:
+        if request.content_type == "application/json":
+            return await request.json()
+        form = await request.post()
+        params = {}
+        for key, value in form.items():
+            # Nested objects (reply_markup, media, ...) arrive JSON-encoded
+            if isinstance(value, str) and value[:1] in ("{", "["):
+                value = json.loads(value)
+            params[key] = value
+        return params
+
+    async def _handle(self, request: web.Request) -> web.Response:
+        method = request.match_info["method"].lower()
+        params = await self._params(request)
+        self.calls[method] += 1
+        size = request.content_length or _payload_size(params)
+        self.bytes_received[method] += size
+        delay = self.latency + (size * 8 / (self.upload_mbps * 1e6) if self.upload_mbps else 0.0)
+        if delay:
+            await asyncio.sleep(delay)
+        response = await self.respond(method, params)
+        # Telegram answers errors with their error_code as the HTTP status, which aiogram maps to exceptions
+        return web.json_response(response, status=200 if response["ok"] else response["error_code"])
+
+    async def _handle_file(self, request: web.Request) -> web.StreamResponse:
+        self.calls["file"] += 1
+        # Streamed from one reused chunk so the server side allocates nothing per file
+        response = web.StreamResponse(headers={"Content-Type": "image/jpeg"})
+        response.content_length = self.file_size
+        await response.prepare(request)
+        for chunk in file_chunks(self.file_size):
+            await response.write(chunk)
+        await response.write_eof()
+        return response
+
+    async def respond(self, method: str, params: Dict[str, Any]) -> dict:
+        """Build the API response for a call; override to inject errors"""
+        if method == "getupdates":
+            return {"ok": True, "result": await self._get_updates(params)}
+        if method == "getme":
+            return {"ok": True, "result": BOT_USER}
+        if method in TRUE_METHODS:
+            return {"ok": True, "result": True}
+        if method == "getfile":
+            file_id = str(params.get("file_id"))
+            return {"ok": True, "result": {"file_id": file_id, "file_unique_id": file_id, "file_path": f"photos/{file_id}.jpg", "file_size": self.file_size}}
+        return {"ok": True, "result": self._message_result(method, params)}
+
+    async def _get_updates(self, params: Dict[str, Any]) -> List[dict]:
+        limit = int(params.get("limit") or 100)
+        timeout = float(params.get("timeout") or 0)
+        try:
+            first = await asyncio.wait_for(self.updates.get(), timeout=max(timeout, 0.01))
+        except asyncio.TimeoutError:
+            return []
+        batch = [first]
+        while len(batch) < limit and not self.updates.empty():
+            batch.append(self.updates.get_nowait())
+        return batch
+
+    def _message_result(self, method: str, params: Dict[str, Any]) -> dict:
+        chat_id = int(params.get("chat_id") or 0)
+        extra: Dict[str, Any] = {"from": BOT_USER}
+        if "photo" in params or "media" in params:
+            file_id = f"file{next(_message_ids)}"
+            extra["photo"] = [{"file_id": file_id, "file_unique_id": file_id, "width": 800, "height": 800}]
+            if params.get("caption"):
+                extra["caption"] = params["caption"]
+        message_id = int(params["message_id"]) if params.get("message_id") else None
+        message = make_message(chat_id, params.get("text"), message_id=message_id, **extra)
+        self.sent.append({"method": method, "chat_id": chat_id})
+        return message
+
+
+class FloodLimitedBotAPI(FakeBotAPI):
+    """FakeBotAPI answering 429 Too Many Requests like Telegram's flood control
+
+    Chat-bound methods are limited to global_limit per rolling second overall
+    and chat_limit per rolling second per chat; rejected requests are counted
+    in self.rejected. With chaos, any chat-bound request is also rejected with
+    that probability, to exercise retries.
+    """
+
+    def __init__(self, global_limit: int = 30, chat_limit: int = 4, retry_after: int = 1, chaos: float = 0.0, **kwargs):
+        super().__init__(**kwargs)
+        self.global_limit = global_limit
+        self.chat_limit = chat_limit
+        self.retry_after = retry_after
+        self.chaos = chaos
+        self.rejected: Counter = Counter()
+        self._global: Deque[float] = deque()
+        self._chats: Dict[Any, Deque[float]] = defaultdict(deque)
+        self._rng = random.Random(1)
+
+    @staticmethod
+    def _admit(window: Deque[float], limit: int, now: float) -> bool:
+        while window and window[0] <= now - 1.0:
+            window.popleft()
+        return len(window) < limit
+
+    async def respond(self, method: str, params: Dict[str, Any]) -> dict:
+        chat_id = params.get("chat_id")
+        if chat_id is not None:
+            now = time.monotonic()
+            chat = self._chats[str(chat_id)]
+            if (
+                not self._admit(self._global, self.global_limit, now)
+                or not self._admit(chat, self.chat_limit, now)
+                or self._rng.random() < self.chaos
+            ):
+                self.rejected[method] += 1
+                return {
+                    "ok": False,
+                    "error_code": 429,
+                    "description": f"Too Many Requests: retry after {self.retry_after}",
+                    "parameters": {"retry_after": self.retry_after},
+                }
+            self._global.append(now)
+            chat.append(now)
+        return await super().respond(method, params)
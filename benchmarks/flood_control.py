@@ -0,0 +1,149 @@
+"""
+Outbound rate limiting against a flood-limited fake Bot API.
+
+Users send bursts of interactive replies while a broadcast pushes messages to
+other chats at bulk priority, all against FloodLimitedBotAPI, which answers
+429 Too Many Requests past 30 messages per second or 4 per chat per second.
+"raw" sends directly, like handlers did before; "queue" goes through
+SendQueueMiddleware. Reports delivered and failed requests, 429s returned by
+the server, latency per traffic class and the deepest queue seen.
+
+    python -m benchmarks.flood_control --users 20 --broadcast 300 [--chaos 0.05]
+"""
+import argparse
+import asyncio
+import logging
+import time
+
+from aiogram import Bot
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.client.telegram import TelegramAPIServer
+from aiogram.exceptions import TelegramRetryAfter
+
+from benchmarks.fake_bot_api import FloodLimitedBotAPI
+from middlewares.send_queue import SendQueueMiddleware
+from utils.send_queue import Priority, SendScheduler, send_priority
+
+TOKEN = "123456:BENCHMARK-TOKEN"
+BROADCAST_WORKERS = 30
+
+
+def percentile(values, pct):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(int(len(values) * pct / 100), len(values) - 1)]
+
+
+class Stats:
+    def __init__(self):
+        self.latencies = []
+        self.failed = 0
+
+    async def send(self, bot: Bot, chat_id: int, text: str) -> None:
+        started = time.perf_counter()
+        try:
+            await bot.send_message(chat_id, text)
+        except TelegramRetryAfter:
+            self.failed += 1
+            return
+        self.latencies.append(time.perf_counter() - started)
+
+
+async def interactive_user(bot: Bot, chat_id: int, burst: int, rounds: int, stats: Stats) -> None:
+    for round_number in range(rounds):
+        for number in range(burst):
+            await stats.send(bot, chat_id, f"Ответ {round_number}-{number}")
+        await asyncio.sleep(1.0)
+
+
+async def broadcast(bot: Bot, chat_ids, stats: Stats) -> None:
+    send_priority.set(Priority.BULK)
+    queue = asyncio.Queue()
+    for chat_id in chat_ids:
+        queue.put_nowait(chat_id)
+
+    async def worker():
+        while not queue.empty():
+            await stats.send(bot, queue.get_nowait(), "Рассылка")
+
+    await asyncio.gather(*(worker() for _ in range(BROADCAST_WORKERS)))
+
+
+async def run(mode: str, args) -> dict:
+    api = await FloodLimitedBotAPI(chaos=args.chaos, latency=args.latency).start()
+    bot = Bot(token=TOKEN, session=AiohttpSession(api=TelegramAPIServer.from_base(api.base_url)))
+    scheduler = None
+    if mode == "queue":
+        scheduler = SendScheduler(args.global_rate, args.chat_rate, args.chat_burst)
+        bot.session.middleware(SendQueueMiddleware(scheduler))
+
+    deepest = 0
+    sampling = True
+
+    async def sample_depth():
+        nonlocal deepest
+        while sampling:
+            if scheduler is not None:
+                deepest = max(deepest, scheduler.depth())
+            await asyncio.sleep(0.01)
+
+    interactive, bulk = Stats(), Stats()
+    sampler = asyncio.create_task(sample_depth())
+    started = time.perf_counter()
+    try:
+        await asyncio.gather(
+            broadcast(bot, range(100000, 100000 + args.broadcast), bulk),
+            *(interactive_user(bot, user_id, args.burst, args.rounds, interactive) for user_id in range(1, args.users + 1))
+        )
+    finally:
+        elapsed = time.perf_counter() - started
+        sampling = False
+        await sampler
+        if scheduler is not None:
+            await scheduler.close()
+        await bot.session.close()
+        await api.stop()
+    return {
+        "mode": mode,
+        "seconds": elapsed,
+        "interactive": interactive,
+        "bulk": bulk,
+        "rejected": sum(api.rejected.values()),
+        "deepest": deepest,
+    }
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=20)
+    parser.add_argument("--burst", type=int, default=3, help="replies each user triggers back to back")
+    parser.add_argument("--rounds", type=int, default=3)
+    parser.add_argument("--broadcast", type=int, default=300, help="broadcast recipients")
+    parser.add_argument("--chaos", type=float, default=0.0, help="probability of a spurious 429")
+    parser.add_argument("--latency", type=float, default=0.0, help="fake API latency, seconds")
+    parser.add_argument("--global-rate", type=float, default=30)
+    parser.add_argument("--chat-rate", type=float, default=1)
+    parser.add_argument("--chat-burst", type=float, default=3)
+    args = parser.parse_args()
+    # Retries are expected here; keep their warnings out of the report
+    logging.getLogger("middlewares.send_queue").setLevel(logging.ERROR)
+
+    print(
+        f"{'mode':<8}{'seconds':>9}{'429s':>7}{'queue max':>11}"
+        f"{'inter ok':>10}{'failed':>8}{'p50 ms':>9}{'p95 ms':>9}"
+        f"{'bulk ok':>9}{'failed':>8}{'p50 ms':>9}{'p95 ms':>9}"
+    )
+    for mode in ("raw", "queue"):
+        result = await run(mode, args)
+        row = f"{mode:<8}{result['seconds']:>9.2f}{result['rejected']:>7}{result['deepest']:>11}"
+        for stats, width in ((result["interactive"], 10), (result["bulk"], 9)):
+            row += (
+                f"{len(stats.latencies):>{width}}{stats.failed:>8}"
+                f"{percentile(stats.latencies, 50) * 1000:>9.0f}{percentile(stats.latencies, 95) * 1000:>9.0f}"
+            )
+        print(row)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,165 @@
+"""
+Behaviour and write cost of the persistent FSM storage backends.
+
+Checks SQLiteStorage: buffered writes are readable before the flush and
+reach disk in one transaction, close() flushes what is still buffered, state
+survives reopening the file, flows expire after state_ttl, and changes made
+during a slow or failed flush still reach disk. Runs the same round trip and
+expiry against aiogram's RedisStorage on fakeredis. Finally times a burst of
+state changes against SQLiteStorage and reports commits.
+
+    python -m benchmarks.fsm_storage [--writes 2000]
+"""
+import argparse
+import asyncio
+import os
+import shutil
+import sqlite3
+import tempfile
+import time
+
+import benchmarks.seed  # noqa: F401  sets DATABASE_URL and BOT_TOKEN defaults
+
+from aiogram.fsm.storage.base import DefaultKeyBuilder, StorageKey
+from aiogram.fsm.storage.redis import RedisStorage
+from fakeredis import FakeAsyncRedis
+
+from utils.fsm_storage import SQLiteStorage
+
+BOT_ID = 1
+
+
+def key(user_id: int, destiny: str = "default") -> StorageKey:
+    return StorageKey(bot_id=BOT_ID, chat_id=user_id, user_id=user_id, destiny=destiny)
+
+
+def rows_on_disk(path: str) -> int:
+    with sqlite3.connect(path) as conn:
+        return conn.execute("SELECT count(*) FROM fsm").fetchone()[0]
+
+
+async def check_sqlite(directory: str) -> None:
+    path = os.path.join(directory, "fsm.sqlite3")
+
+    storage = SQLiteStorage(path, flush_interval=0.05)
+    await storage.set_state(key(1), "AdminStates:waiting_product_name")
+    await storage.set_data(key(1), {"category_id": 3, "name": "Жидкость"})
+    assert await storage.get_state(key(1)) == "AdminStates:waiting_product_name"
+    assert await storage.get_data(key(1)) == {"category_id": 3, "name": "Жидкость"}
+    assert rows_on_disk(path) == 0, "written before the flush interval"
+    await asyncio.sleep(0.2)
+    assert rows_on_disk(path) == 1, "buffered writes were not flushed"
+
+    # Still buffered when the bot stops
+    await storage.set_data(key(2, "navigation"), {"messages": {"10": {"parent": None}}})
+    await storage.close()
+
+    storage = SQLiteStorage(path, flush_interval=0.05)
+    assert await storage.get_state(key(1)) == "AdminStates:waiting_product_name", "state lost on reopen"
+    assert await storage.get_data(key(1)) == {"category_id": 3, "name": "Жидкость"}, "data lost on reopen"
+    assert await storage.get_data(key(2, "navigation")) == {"messages": {"10": {"parent": None}}}, "close() did not flush"
+    assert await storage.get_data(key(2)) == {}, "destinies share data"
+    await storage.set_state(key(1), None)
+    await storage.set_data(key(1), {})
+    await storage.close()
+    assert rows_on_disk(path) == 1, "finished flow was kept"
+
+    storage = SQLiteStorage(path, state_ttl=1, flush_interval=0.05)
+    await storage.set_state(key(3), "AdminStates:waiting_product_price")
+    await storage.flush()
+    await asyncio.sleep(1.1)
+    assert await storage.get_state(key(3)) is None, "expired state was returned"
+    await storage.set_state(key(4), "AdminStates:waiting_category_name")
+    await storage.flush()
+    await storage.close()
+    with sqlite3.connect(path) as conn:
+        keys = [row[0] for row in conn.execute("SELECT key FROM fsm WHERE state IS NOT NULL")]
+    assert len(keys) == 1 and ":4:4:" in keys[0], f"expired rows were not deleted: {keys}"
+    print("sqlite: buffering, close flush, reopen, ttl: ok")
+
+
+async def check_sqlite_in_flight(directory: str) -> None:
+    path = os.path.join(directory, "in-flight.sqlite3")
+    storage = SQLiteStorage(path, flush_interval=0.05)
+    write = storage._write
+    failures = 1
+
+    def slow_write(changes):
+        nonlocal failures
+        time.sleep(0.2)
+        if failures:
+            failures -= 1
+            raise sqlite3.OperationalError("database is locked")
+        write(changes)
+
+    storage._write = slow_write
+    await storage.set_state(key(1), "AdminStates:waiting_product_name")
+    await asyncio.sleep(0.1)
+    # The first flush is still writing, and will fail
+    await storage.set_state(key(2), "AdminStates:waiting_product_price")
+    assert await storage.get_state(key(1)) == "AdminStates:waiting_product_name", "in-flight change not readable"
+    await asyncio.sleep(0.8)
+    assert rows_on_disk(path) == 2, "changes made during or put back after a flush were not flushed"
+    await storage.close()
+    print("sqlite: writes during a flush, retry after a failed flush: ok")
+
+
+async def check_redis() -> None:
+    redis = FakeAsyncRedis()
+    key_builder = DefaultKeyBuilder(with_bot_id=True, with_destiny=True)
+    storage = RedisStorage(redis, key_builder=key_builder, state_ttl=1, data_ttl=1)
+    await storage.set_state(key(1), "AdminStates:waiting_product_name")
+    await storage.set_data(key(1), {"category_id": 3})
+    await storage.set_data(key(1, "navigation"), {"messages": {}})
+    assert await storage.get_state(key(1)) == "AdminStates:waiting_product_name"
+    assert await storage.get_data(key(1)) == {"category_id": 3}
+    assert await redis.ttl(key_builder.build(key(1), "state")) > 0, "state has no TTL"
+    await asyncio.sleep(1.1)
+    assert await storage.get_state(key(1)) is None, "expired state was returned"
+    assert await storage.get_data(key(1)) == {}, "expired data was returned"
+    await storage.close()
+    print("redis (fakeredis): round trip, destinies, ttl: ok")
+
+
+async def bench_sqlite(directory: str, writes: int) -> None:
+    path = os.path.join(directory, "bench.sqlite3")
+    storage = SQLiteStorage(path, flush_interval=0.05)
+    commits = 0
+    write = storage._write
+
+    def counting_write(changes):
+        nonlocal commits
+        commits += 1
+        write(changes)
+
+    storage._write = counting_write
+    started = time.perf_counter()
+    for number in range(writes):
+        user_id = number % 50
+        await storage.set_state(key(user_id), f"AdminStates:step{number % 5}")
+        await storage.set_data(key(user_id), {"step": number})
+        if number % 100 == 0:
+            # Let flushes run between bursts of updates, as the dispatcher would
+            await asyncio.sleep(0)
+    await storage.close()
+    elapsed = time.perf_counter() - started
+    print(f"sqlite: {writes} state changes of 50 users in {elapsed:.2f} s, {commits} commits")
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--writes", type=int, default=2000)
+    args = parser.parse_args()
+
+    directory = tempfile.mkdtemp(prefix="fsm-")
+    try:
+        await check_sqlite(directory)
+        await check_sqlite_in_flight(directory)
+        await check_redis()
+        await bench_sqlite(directory, args.writes)
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
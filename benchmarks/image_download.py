@@ -0,0 +1,103 @@
+"""
+Peak memory of saving an admin photo upload.
+
+Serves photos of several sizes from the fake Bot API and compares the old
+path (bot.download_file into BytesIO, .read(), write) with download_photo,
+which streams chunks into the image store. Also checks the streamed file's
+SHA-256 and that oversized photos are rejected without leaving files behind.
+
+    python -m benchmarks.image_download --sizes 1 8 19
+"""
+import argparse
+import asyncio
+import hashlib
+import os
+import tempfile
+import tracemalloc
+
+import benchmarks.seed  # noqa: F401  sets DATABASE_URL and BOT_TOKEN defaults
+
+from aiogram import Bot
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.client.telegram import TelegramAPIServer
+from aiogram.types import PhotoSize
+
+from benchmarks.fake_bot_api import FakeBotAPI, file_chunks
+
+import utils.telegram_media as telegram_media
+from utils.image_storage import ImageStore, ImageTooLarge
+
+MB = 1024 * 1024
+
+
+async def buffered_save(bot, photo, store):
+    file_info = await bot.get_file(photo.file_id)
+    file_data = await bot.download_file(file_info.file_path)
+    return await store.save(file_data.read(), ".jpg")
+
+
+async def streamed_save(bot, photo, store):
+    return (await telegram_media.download_photo(bot, photo, max_size=64 * MB)).path
+
+
+async def peak_memory(save, bot, photo, store):
+    tracemalloc.start()
+    tracemalloc.reset_peak()
+    path = await save(bot, photo, store)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    await store.delete(path)
+    return peak
+
+
+def expected_sha256(size):
+    digest = hashlib.sha256()
+    for chunk in file_chunks(size):
+        digest.update(chunk)
+    return digest.hexdigest()
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1, 8, 19], help="photo sizes in MiB")
+    args = parser.parse_args()
+
+    api = await FakeBotAPI().start()
+    bot = Bot(os.environ["BOT_TOKEN"], session=AiohttpSession(api=TelegramAPIServer.from_base(api.base_url)))
+    store = ImageStore(tempfile.mkdtemp(prefix="images-"))
+    telegram_media.image_store = store
+    photo = PhotoSize(file_id="photo", file_unique_id="photo", width=1280, height=1280)
+
+    try:
+        print(f"{'photo MiB':>10}{'buffered peak MiB':>20}{'streamed peak MiB':>20}")
+        for size in args.sizes:
+            api.file_size = size * MB
+            await store.delete(await streamed_save(bot, photo, store))  # warm up the connection pool
+            buffered = await peak_memory(buffered_save, bot, photo, store)
+            streamed = await peak_memory(streamed_save, bot, photo, store)
+            print(f"{size:>10}{buffered / MB:>20.2f}{streamed / MB:>20.2f}")
+
+        api.file_size = 3 * MB + 17
+        stored = await telegram_media.download_photo(bot, photo)
+        assert stored.size == api.file_size, stored
+        assert stored.sha256 == expected_sha256(api.file_size), "checksum mismatch"
+        with open(stored.path, "rb") as f:
+            assert hashlib.sha256(f.read()).hexdigest() == stored.sha256, "file content mismatch"
+
+        try:
+            await telegram_media.download_photo(bot, photo, max_size=MB)
+        except ImageTooLarge:
+            pass
+        else:
+            raise AssertionError("oversized photo was accepted")
+        # Only files count: variants/ and .quarantine/ live here too, temp files would be leftovers
+        leftovers = [entry.name for entry in os.scandir(store.directory) if not entry.is_dir()]
+        assert leftovers == [os.path.basename(stored.path)], leftovers
+        print("checksum and size cap: ok")
+    finally:
+        await bot.session.close()
+        await api.stop()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,96 @@
+"""
+Bytes and latency of a product view with and without the display variant.
+
+Stores a product photo, renders its variants in the process pool, then sends
+the original and the display variant through the fake Bot API the way an
+uncached product view does (multipart sendPhoto upload). The fake API delays
+each request by its size at --upload-mbps to model the bot's uplink.
+
+    python -m benchmarks.image_variants --views 20 --upload-mbps 20
+"""
+import argparse
+import asyncio
+import io
+import os
+import tempfile
+import time
+
+import benchmarks.seed  # noqa: F401  sets DATABASE_URL and BOT_TOKEN defaults
+
+from aiogram import Bot
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.client.telegram import TelegramAPIServer
+from aiogram.types import FSInputFile
+from PIL import Image
+
+from benchmarks.fake_bot_api import FakeBotAPI
+
+from utils.image_processing import shutdown_image_workers
+from utils.image_storage import ImageStore
+
+SAMPLE_PHOTO = "images/02660228-7221-4b61-ac75-71767e3a9b94.jpg"
+
+
+def camera_photo(width=4000, height=3000):
+    """A noisy full-resolution JPEG similar to what phones upload"""
+    image = Image.effect_noise((width, height), 40).convert("RGB")
+    gradient = Image.linear_gradient("L").resize((width, height)).convert("RGB")
+    buffer = io.BytesIO()
+    Image.blend(image, gradient, 0.6).save(buffer, format="JPEG", quality=92)
+    return buffer.getvalue()
+
+
+def percentile(values, pct):
+    values = sorted(values)
+    return values[min(int(len(values) * pct / 100), len(values) - 1)]
+
+
+async def measure_views(bot, api, path, views):
+    api.bytes_received.clear()
+    latencies = []
+    for _ in range(views):
+        started = time.perf_counter()
+        await bot.send_photo(chat_id=1, photo=FSInputFile(path), caption="Товар")
+        latencies.append(time.perf_counter() - started)
+    return api.bytes_received["sendphoto"] / views, latencies
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--views", type=int, default=20)
+    parser.add_argument("--upload-mbps", type=float, default=20.0)
+    args = parser.parse_args()
+
+    api = await FakeBotAPI(upload_mbps=args.upload_mbps).start()
+    bot = Bot(os.environ["BOT_TOKEN"], session=AiohttpSession(api=TelegramAPIServer.from_base(api.base_url)))
+    store = ImageStore(tempfile.mkdtemp(prefix="images-"))
+
+    with open(SAMPLE_PHOTO, "rb") as f:
+        sources = {"telegram photo 1280px": f.read(), "camera photo 4000px": await asyncio.to_thread(camera_photo)}
+
+    try:
+        # Start the worker processes before timing anything
+        await store.create_variants(await store.save(camera_photo(64, 64)))
+
+        print(f"{'photo':<24}{'sent':<10}{'KiB/view':>10}{'p50 ms':>10}{'p95 ms':>10}{'render ms':>11}")
+        for name, data in sources.items():
+            original = await store.save(data)
+            started = time.perf_counter()
+            variants = await store.create_variants(original)
+            render_ms = (time.perf_counter() - started) * 1000
+
+            for label, path in (("original", original), ("display", variants["display"])):
+                per_view, latencies = await measure_views(bot, api, path, args.views)
+                print(
+                    f"{name:<24}{label:<10}{per_view / 1024:>10.1f}"
+                    f"{percentile(latencies, 50) * 1000:>10.1f}{percentile(latencies, 95) * 1000:>10.1f}"
+                    f"{render_ms if label == 'display' else 0:>11.0f}"
+                )
+    finally:
+        await bot.session.close()
+        await api.stop()
+        shutdown_image_workers()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,313 @@
+"""
+End-to-end load test of the bot.
+
+Runs the real dispatcher from main.py (user and admin routers, middlewares,
+FSM storage) against FakeBotAPI and the benchmark database. Simulated users
+concurrently run realistic flows, e.g. /start -> catalog -> category ->
+product -> back. The report covers throughput, update latency percentiles,
+and DB statements and Bot API calls per flow, including the commit the
+unit-of-work middleware issues at the end of each update.
+
+Users, flow mix and catalog are generated from --seed, so runs are
+reproducible offline. Save a run with --output and compare later runs against
+it with --baseline.
+
+    python -m benchmarks.load --users 50 --flows 20
+    python -m benchmarks.load --output baseline.json
+    python -m benchmarks.load --baseline baseline.json
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import random
+import time
+from collections import defaultdict
+from contextvars import ContextVar
+from typing import Callable, Dict, List, Optional, Tuple
+
+from benchmarks.seed import seed_catalog
+
+from aiogram import Bot, Dispatcher
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware
+from aiogram.client.telegram import TelegramAPIServer
+from aiogram.types import Update
+from sqlalchemy import event, select, update
+
+import main as app
+from benchmarks.fake_bot_api import BOT_USER, FakeBotAPI, make_callback_update, make_message, make_message_update
+from config import ADMIN_ID, CATALOG_PAGE_SIZE, SEARCH_PAGE_SIZE
+from utils.database import Product, async_session, engine
+from utils.image_storage import IMAGES_DIR, image_store, list_image_files
+from utils.search import remember_query
+
+TOKEN = "123456:BENCHMARK-TOKEN"
+CATALOG_BUTTON = "🛍️ Каталог товаров"
+
+
+def percentile(values, pct):
+    values = sorted(values)
+    return values[min(int(len(values) * pct / 100), len(values) - 1)] if values else 0.0
+
+
+class Catalog:
+    """Ids of the seeded catalog that flows navigate through"""
+
+    def __init__(self, categories: Dict[int, List[int]], photo_ids: set):
+        self.categories = categories
+        self.photo_ids = photo_ids
+
+    def category(self, rng: random.Random) -> int:
+        return rng.choice(list(self.categories))
+
+    def product(self, rng: random.Random, category_id: int) -> int:
+        return rng.choice(self.categories[category_id][:CATALOG_PAGE_SIZE])
+
+
+def photo_message(user_id: int) -> dict:
+    photo = [{"file_id": "photo", "file_unique_id": "photo", "width": 800, "height": 800}]
+    return make_message(user_id, None, **{"from": BOT_USER, "photo": photo, "caption": "товар"})
+
+
+def bot_message(user_id: int) -> dict:
+    return make_message(user_id, "menu", **{"from": BOT_USER})
+
+
+# A flow turns (catalog, rng, user id) into the updates one user sends in order
+def browse_flow(catalog: Catalog, rng: random.Random, user_id: int) -> List[dict]:
+    category_id = catalog.category(rng)
+    product_id = catalog.product(rng, category_id)
+    # Back buttons sit under the product card, which is a photo when the product has one
+    card = photo_message(user_id) if product_id in catalog.photo_ids else bot_message(user_id)
+    return [
+        make_message_update(user_id, "/start"),
+        make_message_update(user_id, CATALOG_BUTTON),
+        make_callback_update(user_id, f"category_{category_id}"),
+        make_callback_update(user_id, f"product_{product_id}"),
+        make_callback_update(user_id, f"back_to_category_{category_id}", card),
+        make_callback_update(user_id, "back_to_categories"),
+    ]
+
+
+def paginate_flow(catalog: Catalog, rng: random.Random, user_id: int) -> List[dict]:
+    category_id = catalog.category(rng)
+    ids = catalog.categories[category_id]
+    updates = [make_callback_update(user_id, f"category_{category_id}")]
+    for page in range(1, min(len(ids) // CATALOG_PAGE_SIZE, 3)):
+        updates.append(make_callback_update(user_id, f"category_{category_id}_n{ids[page * CATALOG_PAGE_SIZE - 1]}"))
+    if len(updates) > 1:
+        updates.append(make_callback_update(user_id, f"category_{category_id}_p{ids[CATALOG_PAGE_SIZE]}"))
+    return updates
+
+
+def search_flow(catalog: Catalog, rng: random.Random, user_id: int) -> List[dict]:
+    query = f"Товар {rng.randint(1, len(catalog.categories))}"
+    return [
+        make_message_update(user_id, query),
+        make_callback_update(user_id, f"search_{remember_query(query)}_{SEARCH_PAGE_SIZE}"),
+        make_callback_update(user_id, f"product_{catalog.product(rng, catalog.category(rng))}"),
+    ]
+
+
+def admin_flow(catalog: Catalog, rng: random.Random, user_id: int) -> List[dict]:
+    category_id = catalog.category(rng)
+    return [
+        make_message_update(ADMIN_ID, "/admin"),
+        make_callback_update(ADMIN_ID, "admin_products"),
+        make_callback_update(ADMIN_ID, f"admin_category_products_{category_id}"),
+        make_callback_update(ADMIN_ID, f"view_product_{catalog.product(rng, category_id)}"),
+        make_callback_update(ADMIN_ID, "back_to_admin"),
+    ]
+
+
+FLOWS: Dict[str, Tuple[Callable[[Catalog, random.Random, int], List[dict]], float]] = {
+    "browse": (browse_flow, 0.6),
+    "paginate": (paginate_flow, 0.2),
+    "search": (search_flow, 0.15),
+    "admin": (admin_flow, 0.05),
+}
+
+
+class FlowStats:
+    """Measurements of one flow type"""
+
+    def __init__(self):
+        self.flows = 0
+        self.latencies: List[float] = []
+        self.queries = 0
+        self.api_calls = 0
+
+    def summary(self) -> dict:
+        return {
+            "flows": self.flows,
+            "updates": len(self.latencies),
+            "p50_ms": percentile(self.latencies, 50) * 1000,
+            "p95_ms": percentile(self.latencies, 95) * 1000,
+            "p99_ms": percentile(self.latencies, 99) * 1000,
+            "queries_per_flow": self.queries / self.flows if self.flows else 0.0,
+            "api_calls_per_flow": self.api_calls / self.flows if self.flows else 0.0,
+        }
+
+
+_current_flow: ContextVar[Optional[FlowStats]] = ContextVar("current_flow", default=None)
+
+
+def _count_statement(*args) -> None:
+    stats = _current_flow.get()
+    if stats is not None:
+        stats.queries += 1
+
+
+class FlowApiCounter(BaseRequestMiddleware):
+    """Count Bot API requests of the running flow"""
+
+    async def __call__(self, make_request, bot: Bot, method):
+        stats = _current_flow.get()
+        if stats is not None:
+            stats.api_calls += 1
+        return await make_request(bot, method)
+
+
+async def seed(categories: int, products: int, photo_ratio: float, rng: random.Random) -> Catalog:
+    category_ids = await seed_catalog([products] * categories, description_length=300)
+    images = sorted(list_image_files(IMAGES_DIR))
+    async with async_session() as session:
+        rows = (await session.execute(select(Product.id, Product.category_id).order_by(Product.id))).all()
+        ids: Dict[int, List[int]] = {category_id: [] for category_id in category_ids}
+        photo_ids = set()
+        for product_id, category_id in rows:
+            ids[category_id].append(product_id)
+            if images and rng.random() < photo_ratio:
+                photo_ids.add(product_id)
+                await session.execute(
+                    update(Product).where(Product.id == product_id).values(image_path=rng.choice(images))
+                )
+        await session.commit()
+    return Catalog(ids, photo_ids)
+
+
+async def feed(dp: Dispatcher, bot: Bot, payload: dict) -> float:
+    started = time.perf_counter()
+    await dp.feed_update(bot, Update.model_validate(payload, context={"bot": bot}))
+    return time.perf_counter() - started
+
+
+async def simulate_user(
+    dp: Dispatcher,
+    bot: Bot,
+    catalog: Catalog,
+    stats: Dict[str, FlowStats],
+    user_id: int,
+    flows: int,
+    seed_value: int,
+    think: float
+) -> None:
+    rng = random.Random(seed_value * 100003 + user_id)
+    names = list(FLOWS)
+    weights = [weight for _, weight in FLOWS.values()]
+    for _ in range(flows):
+        name = rng.choices(names, weights)[0]
+        flow_stats = stats[name]
+        _current_flow.set(flow_stats)
+        for payload in FLOWS[name][0](catalog, rng, user_id):
+            flow_stats.latencies.append(await feed(dp, bot, payload))
+            if think:
+                await asyncio.sleep(rng.uniform(0, 2 * think))
+        flow_stats.flows += 1
+
+
+def print_report(results: dict, baseline: Optional[dict]) -> None:
+    header = f"{'flow':<10}{'flows':>7}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'queries':>9}{'api':>7}"
+    print(header + (f"{'Δp95':>9}{'Δqueries':>10}" if baseline else ""))
+    for name, row in results["flows"].items():
+        line = (
+            f"{name:<10}{row['flows']:>7}{row['p50_ms']:>9.2f}{row['p95_ms']:>9.2f}{row['p99_ms']:>9.2f}"
+            f"{row['queries_per_flow']:>9.1f}{row['api_calls_per_flow']:>7.1f}"
+        )
+        base = (baseline or {}).get("flows", {}).get(name)
+        if base:
+            p95_change = (row["p95_ms"] / base["p95_ms"] - 1) * 100 if base["p95_ms"] else 0.0
+            line += f"{p95_change:>+8.0f}%{row['queries_per_flow'] - base['queries_per_flow']:>+10.1f}"
+        print(line)
+    total = results["total"]
+    print(
+        f"{total['updates']} updates in {total['seconds']:.2f}s: {total['updates_per_sec']:.0f} updates/s, "
+        f"{total['flows_per_sec']:.1f} flows/s"
+    )
+    if baseline:
+        change = (total["updates_per_sec"] / baseline["total"]["updates_per_sec"] - 1) * 100
+        print(f"throughput vs baseline: {change:+.1f}%")
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=50, help="concurrent simulated users")
+    parser.add_argument("--flows", type=int, default=20, help="flows run by each user")
+    parser.add_argument("--categories", type=int, default=10)
+    parser.add_argument("--products", type=int, default=200, help="products per category")
+    parser.add_argument("--photo-ratio", type=float, default=0.3, help="share of products with a photo")
+    parser.add_argument("--latency", type=float, default=0.0, help="simulated Bot API latency per call, seconds")
+    parser.add_argument("--think", type=float, default=0.0, help="mean pause between a user's updates, seconds")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--output", help="write results as JSON")
+    parser.add_argument("--baseline", help="compare with results written by --output")
+    args = parser.parse_args()
+
+    # main.py logs at INFO: one line per handled update and per fake API request
+    logging.getLogger().setLevel(logging.WARNING)
+    catalog = await seed(args.categories, args.products, args.photo_ratio, random.Random(args.seed))
+    await image_store.load()
+
+    api = await FakeBotAPI(latency=args.latency).start()
+    bot = Bot(token=TOKEN, session=AiohttpSession(api=TelegramAPIServer.from_base(api.base_url)))
+    # Installs the API metrics middleware on bot, as in main()
+    dp = app.create_dispatcher(bot)
+    bot.session.middleware(FlowApiCounter())
+    event.listen(engine.sync_engine, "after_cursor_execute", _count_statement)
+
+    # Warm-up: load the catalog snapshot and upload every photo once
+    warmup = defaultdict(FlowStats)
+    await simulate_user(dp, bot, catalog, warmup, 10 ** 6, len(FLOWS) * 3, args.seed, 0.0)
+    for product_id in sorted(catalog.photo_ids):
+        if any(product_id in ids[:CATALOG_PAGE_SIZE] for ids in catalog.categories.values()):
+                await feed(dp, bot, make_callback_update(10 ** 6, f"product_{product_id}"))
+
+    stats: Dict[str, FlowStats] = {name: FlowStats() for name in FLOWS}
+    started = time.perf_counter()
+    await asyncio.gather(*(
+        simulate_user(dp, bot, catalog, stats, user_id, args.flows, args.seed, args.think)
+        for user_id in range(1, args.users + 1)
+    ))
+    elapsed = time.perf_counter() - started
+
+    updates = sum(len(flow.latencies) for flow in stats.values())
+    flows = sum(flow.flows for flow in stats.values())
+    results = {
+        "flows": {name: flow.summary() for name, flow in stats.items()},
+        "total": {
+            "updates": updates,
+            "seconds": elapsed,
+            "updates_per_sec": updates / elapsed,
+            "flows_per_sec": flows / elapsed,
+        },
+        "args": vars(args),
+    }
+    baseline = None
+    if args.baseline and os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+    print_report(results, baseline)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+    await dp.storage.close()
+    await bot.session.close()
+    await api.stop()
+    await engine.dispose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
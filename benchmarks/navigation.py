@@ -0,0 +1,216 @@
+"""
+Bot API calls per navigation flow.
+
+Runs user and admin flows through the real dispatcher from main.py against
+ChatBotAPI, a FakeBotAPI that keeps each chat's messages and rejects edits
+Telegram would reject (text into photo and back, unchanged content, deleted
+messages). Every step presses a button of the lowest message in the chat
+that has it, as a user would. Reports Bot API calls per flow without
+callback answers, by method, the calls Telegram rejected, the steps whose
+handler failed and how many bot messages are left in the chat.
+
+    python -m benchmarks.navigation [--verbose]
+"""
+import argparse
+import asyncio
+import copy
+import itertools
+import logging
+import os
+import shutil
+import tempfile
+from collections import Counter, defaultdict
+from typing import Any, Dict, List, Optional
+
+from benchmarks.seed import seed_catalog
+
+from aiogram import Bot, Dispatcher
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.client.telegram import TelegramAPIServer
+from aiogram.exceptions import TelegramBadRequest
+from aiogram.types import Update
+from sqlalchemy import update
+
+import main as app
+from benchmarks.fake_bot_api import FakeBotAPI, make_callback_update, make_message_update
+from config import ADMIN_ID
+from utils.database import Product, async_session, engine
+
+TOKEN = "123456:BENCHMARK-TOKEN"
+CATALOG_BUTTON = "🛍️ Каталог товаров"
+EDIT_METHODS = {"editmessagetext", "editmessagecaption", "editmessagemedia", "editmessagereplymarkup"}
+
+
+def _error(description: str) -> dict:
+    return {"ok": False, "error_code": 400, "description": f"Bad Request: {description}"}
+
+
+class ChatBotAPI(FakeBotAPI):
+    """FakeBotAPI that keeps the messages of every chat and edits them like Telegram"""
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.chats: Dict[int, Dict[int, dict]] = defaultdict(dict)
+        self.rejected: Counter = Counter()
+        # Message ids are sequential per private chat, user messages included
+        self.message_ids = itertools.count(1)
+
+    async def respond(self, method: str, params: Dict[str, Any]) -> dict:
+        response = self._chat_respond(method, params)
+        if response is None:
+            return await super().respond(method, params)
+        if not response["ok"]:
+            self.rejected[method] += 1
+        return response
+
+    def _chat_respond(self, method: str, params: Dict[str, Any]) -> Optional[dict]:
+        chat = self.chats[int(params.get("chat_id") or 0)]
+        markup = params.get("reply_markup")
+
+        if method in ("sendmessage", "sendphoto"):
+            message = self._message_result(method, params)
+            message["message_id"] = next(self.message_ids)
+            if markup:
+                message["reply_markup"] = markup
+            chat[message["message_id"]] = message
+            return {"ok": True, "result": message}
+
+        if method == "deletemessage":
+            if chat.pop(int(params["message_id"]), None) is None:
+                return _error("message to delete not found")
+            return {"ok": True, "result": True}
+
+        if method not in EDIT_METHODS:
+            return None
+        message = chat.get(int(params["message_id"]))
+        if message is None:
+            return _error("message to edit not found")
+        if method == "editmessagetext":
+            if "text" not in message:
+                return _error("there is no text in the message to edit")
+            changes = {"text": params["text"]}
+        elif method == "editmessagecaption":
+            if "photo" not in message:
+                return _error("there is no caption in the message to edit")
+            changes = {"caption": params.get("caption")}
+        elif method == "editmessagemedia":
+            if "photo" not in message:
+                return _error("there is no media in the message to edit")
+            media = params["media"]
+            changes = {"photo": [{"file_id": str(media["media"]), "file_unique_id": str(media["media"]), "width": 800, "height": 800}]}
+            changes["caption"] = media.get("caption")
+        else:
+            changes = {}
+        changes["reply_markup"] = markup
+        if method != "editmessagemedia" and all(message.get(key) == value for key, value in changes.items()):
+            return _error("message is not modified: specified new message content and reply markup are exactly the same")
+        message.update(changes)
+        if message["reply_markup"] is None:
+            del message["reply_markup"]
+        return {"ok": True, "result": message}
+
+    def find_button(self, chat_id: int, data: str) -> dict:
+        """Lowest message in the chat with a button whose callback data is data, or starts with it"""
+        for exact in (True, False):
+            for message in reversed(list(self.chats[chat_id].values())):
+                for row in message.get("reply_markup", {}).get("inline_keyboard", []):
+                    for button in row:
+                        callback_data = button.get("callback_data") or ""
+                        if callback_data == data if exact else callback_data.startswith(data):
+                            return message, callback_data
+        raise LookupError(f"No button {data!r} in chat {chat_id}")
+
+
+async def run_flow(dp: Dispatcher, bot: Bot, api: ChatBotAPI, user_id: int, steps: List[str], verbose: bool) -> dict:
+    navigation = Counter()
+    failed = 0
+    for step in steps:
+        if step.startswith("/") or step == CATALOG_BUTTON:
+            payload = make_message_update(user_id, step)
+            payload["message"]["message_id"] = next(api.message_ids)
+        else:
+            message, data = api.find_button(user_id, step)
+            payload = make_callback_update(user_id, data, copy.deepcopy(message))
+        api.calls.clear()
+        try:
+            await dp.feed_update(bot, Update.model_validate(payload, context={"bot": bot}))
+        except TelegramBadRequest:
+            # The handler gave up: the user is left without the screen
+            failed += 1
+        calls = Counter({method: count for method, count in api.calls.items() if method != "answercallbackquery"})
+        if "callback_query" in payload:
+            navigation += calls
+        if verbose:
+            print(f"    {step:<32} {dict(calls)}")
+    return {
+        "steps": sum(1 for step in steps if not (step.startswith("/") or step == CATALOG_BUTTON)),
+        "calls": navigation,
+        "rejected": sum(api.rejected.values()),
+        "failed": failed,
+        "messages": len(api.chats[user_id]),
+    }
+
+
+async def seed(photos: int) -> dict:
+    category_ids = await seed_catalog([30, 3], description_length=300)
+    directory = tempfile.mkdtemp(prefix="images-")
+    image_path = os.path.join(directory, "product.jpg")
+    with open(image_path, "wb") as f:
+        f.write(b"\xff\xd8\xff" + bytes(2048))
+    async with async_session() as session:
+        await session.execute(update(Product).where(Product.id <= photos).values(image_path=image_path))
+        await session.commit()
+    return {"categories": category_ids, "directory": directory}
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--verbose", action="store_true", help="print the calls of every step")
+    args = parser.parse_args()
+    # main.py configures INFO logging
+    logging.getLogger().setLevel(logging.WARNING)
+
+    # Products 1 and 2 have a photo, the rest of the first category does not
+    catalog = await seed(photos=2)
+    category = catalog["categories"][0]
+    flows = {
+        "browse with photos": (1001, [
+            CATALOG_BUTTON, f"category_{category}", "product_1", f"back_to_category_{category}",
+            "product_2", "back_to_categories",
+        ]),
+        "browse without photos": (1002, [
+            CATALOG_BUTTON, f"category_{category}", f"category_{category}_n", "product_25",
+            f"back_to_category_{category}", "product_3", "back_to_categories",
+        ]),
+        "admin products": (ADMIN_ID, [
+            "/admin", "admin_products", f"admin_category_products_{category}", "view_product_1",
+            f"admin_category_products_{category}", "view_product_2", "delete_product_image_2",
+            f"admin_category_products_{category}", "admin_products", "back_to_admin",
+        ]),
+    }
+
+    api = await ChatBotAPI().start()
+    bot = Bot(token=TOKEN, session=AiohttpSession(api=TelegramAPIServer.from_base(api.base_url)))
+    dp = app.create_dispatcher(bot)
+    try:
+        print(f"{'flow':<22}{'steps':>6}{'calls':>7}{'per step':>10}{'rejected':>10}{'failed':>8}{'messages':>10}  by method")
+        for name, (user_id, steps) in flows.items():
+            if args.verbose:
+                print(f"  {name}")
+            api.rejected.clear()
+            result = await run_flow(dp, bot, api, user_id, steps, args.verbose)
+            total = sum(result["calls"].values())
+            print(
+                f"{name:<22}{result['steps']:>6}{total:>7}{total / result['steps']:>10.2f}"
+                f"{result['rejected']:>10}{result['failed']:>8}{result['messages']:>10}  {dict(sorted(result['calls'].items()))}"
+            )
+    finally:
+        await dp.storage.close()
+        await bot.session.close()
+        await api.stop()
+        await engine.dispose()
+        shutil.rmtree(catalog["directory"], ignore_errors=True)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
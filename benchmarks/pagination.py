@@ -0,0 +1,63 @@
+"""
+Render time and payload size of category keyboards: unpaginated vs paged.
+
+"full" is the previous behaviour (every product of the category in one
+markup); "page" fetches one keyset page and renders it. Both read straight
+from the database (catalog snapshot disabled) so the query cost is included.
+
+    python -m benchmarks.pagination --sizes 10 1000 10000
+"""
+import argparse
+import asyncio
+import time
+
+from benchmarks.seed import seed_catalog
+
+import utils.database as database
+from keyboards.inline import build_products_keyboard
+
+
+def payload_size(markup) -> int:
+    return len(markup.model_dump_json(exclude_none=True).encode()) if markup else 0
+
+
+async def measure(fetch, category_id: int, repeat: int):
+    fetch_time = render_time = 0.0
+    markup = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        page = await fetch()
+        fetched = time.perf_counter()
+        markup = build_products_keyboard(category_id, page)
+        fetch_time += fetched - started
+        render_time += time.perf_counter() - fetched
+    return fetch_time / repeat * 1000, render_time / repeat * 1000, payload_size(markup)
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10, 1000, 10000])
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    database.CATALOG_CACHE_ENABLED = False
+    category_ids = await seed_catalog(args.sizes)
+
+    print(f"{'products':>9} {'mode':<5}{'fetch ms':>10}{'render ms':>11}{'payload B':>11}")
+    for size, category_id in zip(args.sizes, category_ids):
+        async def fetch_full():
+            products = await database.get_products_by_category(category_id)
+            return {"products": products, "has_prev": False, "has_next": False}
+
+        async def fetch_page():
+            return await database.get_products_page(category_id)
+
+        for mode, fetch in (("full", fetch_full), ("page", fetch_page)):
+            fetch_ms, render_ms, size_bytes = await measure(fetch, category_id, args.repeat)
+            print(f"{size:>9} {mode:<5}{fetch_ms:>10.2f}{render_ms:>11.2f}{size_bytes:>11}")
+
+    await database.engine.dispose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,79 @@
+"""
+Handler latency under concurrent callbacks for different pool settings.
+
+Each simulated callback does the database work of a category tap followed by
+a product tap with the catalog snapshot disabled (two session checkouts).
+For every pool configuration the benchmark reports p50/p99 callback latency
+and checkout waits from the instrumented pool.
+
+    python -m benchmarks.pool --clients 50 --callbacks 20
+"""
+import argparse
+import asyncio
+import random
+import time
+
+from benchmarks.seed import seed_catalog
+
+import utils.database as database
+
+SETTINGS = {
+    "size 5, pre-ping": {"pool_size": 5, "max_overflow": 0, "pool_pre_ping": True},
+    "size 5": {"pool_size": 5, "max_overflow": 0, "pool_pre_ping": False},
+    "size 5 + overflow 15": {"pool_size": 5, "max_overflow": 15, "pool_pre_ping": False},
+    "size 20": {"pool_size": 20, "max_overflow": 0, "pool_pre_ping": False},
+    "size 20, no stmt cache": {"pool_size": 20, "max_overflow": 0, "pool_pre_ping": False, "statement_cache_size": 0},
+}
+
+
+def percentile(values, pct):
+    values = sorted(values)
+    return values[min(int(len(values) * pct / 100), len(values) - 1)]
+
+
+async def simulated_callback(category_ids, product_count):
+    started = time.perf_counter()
+    await database.get_category_with_products(random.choice(category_ids))
+    await database.get_product(random.randint(1, product_count))
+    return time.perf_counter() - started
+
+
+async def run(clients, callbacks, category_ids, product_count):
+    latencies = []
+
+    async def client():
+        for _ in range(callbacks):
+            latencies.append(await simulated_callback(category_ids, product_count))
+
+    await asyncio.gather(*(client() for _ in range(clients)))
+    return latencies
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--clients", type=int, default=50, help="concurrent simulated users")
+    parser.add_argument("--callbacks", type=int, default=20, help="callbacks per user")
+    args = parser.parse_args()
+
+    database.CATALOG_CACHE_ENABLED = False
+    category_ids = await seed_catalog([200] * 10, description_length=200)
+    await database.engine.dispose()
+
+    print(f"{'pool':<24}{'p50 ms':>9}{'p99 ms':>9}{'wait p99':>10}{'wait max':>10}{'overflow':>10}")
+    for name, options in SETTINGS.items():
+        engine = database.create_database_engine(**options)
+        database.async_session.configure(bind=engine)
+        await run(5, 2, category_ids, 2000)  # open connections before measuring
+        engine.pool.metrics.__init__()
+
+        latencies = await run(args.clients, args.callbacks, category_ids, 2000)
+        stats = database.get_pool_stats(engine)
+        print(
+            f"{name:<24}{percentile(latencies, 50) * 1000:>9.2f}{percentile(latencies, 99) * 1000:>9.2f}"
+            f"{stats['wait_p99_ms']:>10.2f}{stats['wait_max_ms']:>10.2f}{stats['overflow_peak']:>10}"
+        )
+        await engine.dispose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
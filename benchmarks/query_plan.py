@@ -0,0 +1,94 @@
+"""
+Query-plan check for the catalog indexes.
+
+Seeds the catalog, drops the indexes to reproduce a pre-migration deployment,
+prints plans and timings of the hot catalog queries, then runs init_database
+(which applies the pending migration) and repeats. Exits non-zero if any
+query still scans a whole table afterwards. Works on the default SQLite
+database or on Postgres via DATABASE_URL=postgresql://...
+
+    python -m benchmarks.query_plan --categories 20 --products 5000
+"""
+import argparse
+import asyncio
+import sys
+import time
+
+from benchmarks.seed import seed_catalog
+
+from sqlalchemy import text
+
+from utils.database import engine, init_database
+
+QUERIES = {
+    "category products": (
+        "SELECT id, name, price FROM products WHERE category_id = :category_id ORDER BY id",
+        {"category_id": 7}
+    ),
+    "keyset page": (
+        "SELECT id, name, price FROM products WHERE category_id = :category_id AND id > :after_id ORDER BY id LIMIT 21",
+        {"category_id": 7, "after_id": 0}
+    ),
+    "category by name": (
+        "SELECT id FROM categories WHERE name = :name",
+        {"name": "Категория 7"}
+    ),
+}
+
+FULL_SCAN_MARKERS = ("SCAN products", "SCAN categories", "Seq Scan")
+
+
+async def explain(conn, sql: str, params: dict) -> str:
+    if conn.dialect.name == "sqlite":
+        rows = await conn.execute(text(f"EXPLAIN QUERY PLAN {sql}"), params)
+        return "\n".join(str(row[-1]) for row in rows)
+    rows = await conn.execute(text(f"EXPLAIN {sql}"), params)
+    return "\n".join(str(row[0]) for row in rows)
+
+
+async def report(title: str, repeat: int) -> bool:
+    """Print plans and timings, return True if no full scans were found"""
+    print(f"=== {title} ===")
+    clean = True
+    async with engine.connect() as conn:
+        await conn.execute(text("ANALYZE"))
+        for name, (sql, params) in QUERIES.items():
+            plan = await explain(conn, sql, params)
+            started = time.perf_counter()
+            for _ in range(repeat):
+                (await conn.execute(text(sql), params)).all()
+            elapsed_ms = (time.perf_counter() - started) / repeat * 1000
+            scans = any(marker in plan for marker in FULL_SCAN_MARKERS)
+            clean = clean and not scans
+            print(f"-- {name}: {elapsed_ms:.3f} ms{'  [FULL SCAN]' if scans else ''}")
+            print("   " + plan.replace("\n", "\n   "))
+    return clean
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--categories", type=int, default=20)
+    parser.add_argument("--products", type=int, default=5000, help="products per category")
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    await seed_catalog([args.products] * args.categories, description_length=100)
+
+    # Simulate a deployment created before the indexes existed
+    async with engine.begin() as conn:
+        await conn.execute(text("DROP INDEX IF EXISTS ix_products_category_id_id"))
+        await conn.execute(text("DROP INDEX IF EXISTS ix_categories_name"))
+        await conn.execute(text("DELETE FROM schema_migrations"))
+    await report("before migration", args.repeat)
+
+    await init_database()
+    clean = await report("after migration", args.repeat)
+    await engine.dispose()
+
+    if not clean:
+        print("Full table scans remain on catalog queries", file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,96 @@
+"""
+Microbenchmark of catalog read paths.
+
+Compares the previous pattern (full ORM entities + dict comprehension) with
+the Core projections used by utils.database: full rows as mappings, and the
+(id, name, price) list projection as mappings and as bare tuples. Reports
+rows/sec and the memory allocated while materializing one result.
+
+    python -m benchmarks.read_paths --products 10000
+"""
+import argparse
+import asyncio
+import time
+import tracemalloc
+
+from benchmarks.seed import seed_catalog
+
+from sqlalchemy import select
+
+from utils.database import PRODUCT_LIST_COLUMNS, Product, _select_products, async_session, engine
+
+
+async def orm_dicts(session, category_id):
+    result = await session.execute(select(Product).where(Product.category_id == category_id))
+    return [
+        {
+            "id": prod.id,
+            "name": prod.name,
+            "description": prod.description,
+            "price": prod.price,
+            "category_id": prod.category_id,
+            "image_path": prod.image_path
+        }
+        for prod in result.scalars().all()
+    ]
+
+
+async def core_full_mappings(session, category_id):
+    result = await session.execute(_select_products().where(Product.category_id == category_id))
+    return [dict(row) for row in result.mappings()]
+
+
+async def core_list_mappings(session, category_id):
+    result = await session.execute(select(*PRODUCT_LIST_COLUMNS).where(Product.category_id == category_id))
+    return list(result.mappings())
+
+
+async def core_list_tuples(session, category_id):
+    result = await session.execute(select(*PRODUCT_LIST_COLUMNS).where(Product.category_id == category_id))
+    return result.all()
+
+
+READERS = {
+    "orm entities + dicts": orm_dicts,
+    "core full mappings": core_full_mappings,
+    "core list mappings": core_list_mappings,
+    "core list tuples": core_list_tuples,
+}
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--products", type=int, default=10000)
+    parser.add_argument("--repeat", type=int, default=10)
+    args = parser.parse_args()
+
+    category_id = (await seed_catalog([args.products]))[0]
+
+    print(f"{'read path':<22}{'rows/s':>12}{'alloc KiB':>12}{'blocks':>10}")
+    for name, reader in READERS.items():
+        async with async_session() as session:
+            await reader(session, category_id)  # warm up statement compilation
+
+            started = time.perf_counter()
+            for _ in range(args.repeat):
+                rows = await reader(session, category_id)
+                session.expunge_all()
+            rows_per_sec = len(rows) * args.repeat / (time.perf_counter() - started)
+
+            tracemalloc.start()
+            before = tracemalloc.take_snapshot()
+            rows = await reader(session, category_id)
+            after = tracemalloc.take_snapshot()
+            tracemalloc.stop()
+            stats = after.compare_to(before, "filename")
+            allocated = sum(stat.size_diff for stat in stats if stat.size_diff > 0)
+            blocks = sum(stat.count_diff for stat in stats if stat.count_diff > 0)
+            del rows
+
+        print(f"{name:<22}{rows_per_sec:>12.0f}{allocated / 1024:>12.0f}{blocks:>10}")
+
+    await engine.dispose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,68 @@
+"""
+Bulk repricing against per-row updates.
+
+Seeds a catalog, then times a dry-run preview and a catalog-wide +5% change
+through utils.repricing (one set-based UPDATE), a price list applied by id,
+and the per-product update_product() calls the admin FSM flow makes.
+
+    python -m benchmarks.repricing --products 50000
+"""
+import argparse
+import asyncio
+import csv
+import os
+import tempfile
+import time
+
+from benchmarks.seed import seed_catalog
+
+from utils.database import engine, update_product
+from utils.repricing import apply_price_list, reprice
+
+
+def print_report(name: str, rows: int, seconds: float) -> None:
+    print(f"{name:<34}{rows:>10}{seconds:>10.2f}{rows / seconds:>14.0f}")
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--products", type=int, default=50000)
+    parser.add_argument("--categories", type=int, default=20)
+    parser.add_argument("--per-row", type=int, default=500, help="products updated one by one for comparison")
+    args = parser.parse_args()
+
+    sizes = [args.products // args.categories] * args.categories
+    await seed_catalog(sizes, description_length=100)
+    products = sum(sizes)
+    print(f"{'run':<34}{'rows':>10}{'seconds':>10}{'rows/s':>14}")
+
+    fd, price_list = tempfile.mkstemp(suffix=".csv")
+    os.close(fd)
+    try:
+        started = time.perf_counter()
+        report = await reprice("percent", 5, dry_run=True)
+        print_report("reprice +5%, dry run", report["matched"], time.perf_counter() - started)
+
+        started = time.perf_counter()
+        report = await reprice("percent", 5)
+        print_report("reprice +5%", report["updated"], time.perf_counter() - started)
+
+        with open(price_list, "w", newline="") as f:
+            writer = csv.writer(f)
+            writer.writerow(["id", "price"])
+            writer.writerows((product_id, 99.9) for product_id in range(1, products + 1))
+        started = time.perf_counter()
+        report = await apply_price_list(price_list)
+        print_report("price list by id", report["updated"], time.perf_counter() - started)
+
+        started = time.perf_counter()
+        for product_id in range(1, args.per_row + 1):
+            await update_product(product_id, f"Товар {product_id}", "Описание", 100.0 + product_id)
+        print_report("update_product() per row", args.per_row, time.perf_counter() - started)
+    finally:
+        os.remove(price_list)
+        await engine.dispose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,116 @@
+"""
+Product search latency on a large catalog.
+
+Seeds a catalog with generated names and descriptions, then reports p50/p99
+query latency for a naive scan over get_products(), the configured search
+backend without its result cache, and cached repeats of the same queries.
+Point DATABASE_URL at Postgres with pg_trgm to measure the trigram backend.
+
+    python -m benchmarks.search --products 100000
+"""
+import argparse
+import asyncio
+import random
+import time
+
+from benchmarks.seed import reset_database
+
+from sqlalchemy import insert
+
+import utils.search as search
+from utils.database import Category, Product, async_session, engine, get_products
+from utils.search_index import product_index, tokenize
+
+BRANDS = ["Elf", "Vaporesso", "Geekvape", "Smok", "Voopoo", "Lost Mary", "Husky", "Brusko", "Pasito", "Xros"]
+KINDS = ["жидкость", "картридж", "испаритель", "под", "одноразка", "аккумулятор", "зарядка", "чехол", "койл", "набор"]
+FLAVORS = [
+    "манго", "арбуз", "клубника", "мята", "виноград", "персик", "черника", "лимон", "кола", "банан",
+    "ананас", "малина", "яблоко", "вишня", "энергетик", "дыня", "смородина", "грейпфрут", "киви", "табак"
+]
+WORDS = ["крепкий", "мягкий", "холодок", "солевой", "новинка", "хит", "ледяной", "сладкий", "кислый", "лимитированный"]
+QUERIES = ["манго", "жидкость клубника", "elf", "испар", "ледяной арбуз", "vaporesso картридж", "ки", "смородина мята"]
+
+
+def percentile(values, pct):
+    values = sorted(values)
+    return values[min(int(len(values) * pct / 100), len(values) - 1)]
+
+
+async def seed(products: int) -> None:
+    await reset_database()
+    rng = random.Random(1)
+    async with async_session() as session:
+        category = Category(name="Поиск")
+        session.add(category)
+        await session.flush()
+        for start in range(0, products, 5000):
+            rows = [
+                {
+                    "name": f"{rng.choice(BRANDS)} {rng.choice(KINDS)} {rng.choice(FLAVORS)} {number}",
+                    "description": " ".join(rng.choices(FLAVORS + WORDS + KINDS, k=30)),
+                    "price": float(rng.randint(100, 5000)),
+                    "category_id": category.id,
+                    "image_path": None,
+                }
+                for number in range(start, min(start + 5000, products))
+            ]
+            await session.execute(insert(Product), rows)
+        await session.commit()
+
+
+async def naive_search(query):
+    terms = tokenize(query)
+    return [
+        product for product in await get_products()
+        if all(term in f"{product['name']} {product['description']}".lower() for term in terms)
+    ][:10]
+
+
+async def measure(run, repeat):
+    latencies = []
+    for _ in range(repeat):
+        for query in QUERIES:
+            started = time.perf_counter()
+            await run(query)
+            latencies.append(time.perf_counter() - started)
+    return latencies
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--products", type=int, default=100000)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    await seed(args.products)
+    backend = await search._resolve_backend()
+
+    started = time.perf_counter()
+    await get_products()
+    load_time = time.perf_counter() - started
+    started = time.perf_counter()
+    await search._ensure_index()
+    build_time = time.perf_counter() - started
+    print(f"{args.products} products: snapshot load {load_time:.2f}s, index build {build_time:.2f}s")
+
+    async def uncached(query):
+        search._results.clear()
+        await search.search_products(query)
+
+    runs = {
+        "naive scan": (naive_search, max(args.repeat // 10, 1)),
+        f"{backend} backend": (uncached, args.repeat),
+        f"{backend} backend, cached": (search.search_products, args.repeat),
+    }
+    print(f"{'search':<26}{'p50 ms':>10}{'p99 ms':>10}")
+    for name, (run, repeat) in runs.items():
+        await measure(run, 1)
+        latencies = await measure(run, repeat)
+        print(f"{name:<26}{percentile(latencies, 50) * 1000:>10.2f}{percentile(latencies, 99) * 1000:>10.2f}")
+
+    print(f"indexed products: {len(product_index)}")
+    await engine.dispose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
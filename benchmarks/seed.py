@@ -0,0 +1,50 @@
+"""
+Seeding helpers for benchmarks.
+
+Benchmarks run against a throwaway SQLite database unless DATABASE_URL is
+already set; import this module before anything from utils.database.
+"""
+import os
+
+BENCHMARK_DB = "benchmarks.sqlite3"
+os.environ.setdefault("DATABASE_URL", f"sqlite+aiosqlite:///{BENCHMARK_DB}")
+os.environ.setdefault("BOT_TOKEN", "123456:BENCHMARK-TOKEN")
+
+from typing import List
+
+from sqlalchemy import insert
+
+from utils.database import Base, Category, Product, async_session, engine, init_database
+
+
+async def reset_database() -> None:
+    """Drop and recreate all tables"""
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.drop_all)
+    await init_database()
+
+
+async def seed_catalog(category_sizes: List[int], description_length: int = 1000) -> List[int]:
+    """Create one category per size with that many products, return category ids"""
+    await reset_database()
+    category_ids = []
+    async with async_session() as session:
+        for index, size in enumerate(category_sizes):
+            category = Category(name=f"Категория {index + 1}")
+            session.add(category)
+            await session.flush()
+            category_ids.append(category.id)
+            rows = [
+                {
+                    "name": f"Товар {index + 1}-{number}",
+                    "description": ("Описание товара " * 70)[:description_length],
+                    "price": 100.0 + number,
+                    "category_id": category.id,
+                    "image_path": None,
+                }
+                for number in range(size)
+            ]
+            for start in range(0, len(rows), 5000):
+                await session.execute(insert(Product), rows[start:start + 5000])
+        await session.commit()
+    return category_ids
@@ -0,0 +1,126 @@
+"""
+Updates/sec in polling mode versus webhook mode.
+
+Both modes run the same dispatcher with a trivial echo router against the fake
+Bot API, so the numbers isolate the update delivery path from handler cost.
+Polling pulls queued updates through getUpdates; in webhook mode a stand-in
+client POSTs the updates to WebhookUpdateHandler with the given concurrency.
+
+    python -m benchmarks.updates_throughput --updates 5000 --latency 0.02
+"""
+import argparse
+import asyncio
+import time
+
+import aiohttp
+from aiohttp import web
+from aiogram import Bot, Dispatcher, Router
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.client.telegram import TelegramAPIServer
+from aiogram.types import Message
+
+from benchmarks.fake_bot_api import FakeBotAPI, make_message_update
+from utils.webhook import WebhookUpdateHandler
+
+TOKEN = "123456:BENCHMARK-TOKEN"
+SECRET = "benchmark-secret"
+
+
+def build_dispatcher(expected: int):
+    router = Router()
+    done = asyncio.Event()
+    handled = 0
+
+    @router.message()
+    async def echo(message: Message):
+        nonlocal handled
+        await message.answer(message.text)
+        handled += 1
+        if handled == expected:
+            done.set()
+
+    dp = Dispatcher()
+    dp.include_router(router)
+    return dp, done
+
+
+def make_bot(api: FakeBotAPI) -> Bot:
+    return Bot(token=TOKEN, session=AiohttpSession(api=TelegramAPIServer.from_base(api.base_url)))
+
+
+async def run_polling(updates: int, users: int, latency: float) -> float:
+    api = await FakeBotAPI(latency=latency).start()
+    bot = make_bot(api)
+    dp, done = build_dispatcher(updates)
+    for i in range(updates):
+        api.push_update(make_message_update(i % users + 1, f"ping {i}"))
+
+    started = time.perf_counter()
+    polling = asyncio.create_task(dp.start_polling(bot, handle_signals=False, polling_timeout=1))
+    await done.wait()
+    elapsed = time.perf_counter() - started
+
+    await dp.stop_polling()
+    await polling
+    await bot.session.close()
+    await api.stop()
+    return elapsed
+
+
+async def run_webhook(updates: int, users: int, latency: float, concurrency: int, max_in_flight: int) -> float:
+    api = await FakeBotAPI(latency=latency).start()
+    bot = make_bot(api)
+    dp, done = build_dispatcher(updates)
+
+    handler = WebhookUpdateHandler(dp, bot, secret_token=SECRET, max_concurrent_updates=max_in_flight)
+    app = web.Application()
+    handler.register(app, "/webhook")
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    url = f"http://127.0.0.1:{site._server.sockets[0].getsockname()[1]}/webhook"
+
+    payloads = [make_message_update(i % users + 1, f"ping {i}") for i in range(updates)]
+    headers = {"X-Telegram-Bot-Api-Secret-Token": SECRET}
+    queue: asyncio.Queue = asyncio.Queue()
+    for payload in payloads:
+        queue.put_nowait(payload)
+
+    async def client(session: aiohttp.ClientSession):
+        while not queue.empty():
+            payload = queue.get_nowait()
+            async with session.post(url, json=payload, headers=headers) as response:
+                assert response.status == 200, response.status
+
+    started = time.perf_counter()
+    async with aiohttp.ClientSession() as session:
+        await asyncio.gather(*(client(session) for _ in range(concurrency)))
+    await done.wait()
+    elapsed = time.perf_counter() - started
+
+    await runner.cleanup()
+    await bot.session.close()
+    await api.stop()
+    return elapsed
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--updates", type=int, default=2000)
+    parser.add_argument("--users", type=int, default=100)
+    parser.add_argument("--latency", type=float, default=0.0, help="simulated Bot API latency per call, seconds")
+    parser.add_argument("--concurrency", type=int, default=20, help="parallel webhook connections")
+    parser.add_argument("--max-in-flight", type=int, default=100, help="webhook concurrent handler limit")
+    args = parser.parse_args()
+
+    polling = await run_polling(args.updates, args.users, args.latency)
+    webhook = await run_webhook(args.updates, args.users, args.latency, args.concurrency, args.max_in_flight)
+
+    print(f"{'mode':<10}{'updates':>10}{'seconds':>10}{'updates/s':>12}")
+    for mode, elapsed in (("polling", polling), ("webhook", webhook)):
+        print(f"{mode:<10}{args.updates:>10}{elapsed:>10.2f}{args.updates / elapsed:>12.0f}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
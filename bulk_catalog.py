@@ -0,0 +1,100 @@
+"""
+Bulk catalog import, export and repricing
+Run this file to load a supplier price list, dump the catalog to a file or
+change many prices at once
+
+Import reads JSON or CSV files incrementally and upserts them in batches
+inside one transaction; products with a known id are updated, the rest are
+added. Without arguments the legacy data/categories.json and
+data/products.json are imported. Export writes a file import accepts.
+Reprice applies one adjustment to a category or the whole catalog, prices
+sets prices by product id from a file; both show the diff first and only
+report it with --dry-run.
+
+    python bulk_catalog.py import [FILE ...] [--format json|csv] [--batch-size N]
+    python bulk_catalog.py export FILE [--format json|csv]
+    python bulk_catalog.py reprice --change=+10% [--category ID] [--dry-run]
+    python bulk_catalog.py prices FILE [--format json|csv] [--dry-run]
+"""
+import argparse
+import asyncio
+
+from config import CATALOG_IMPORT_BATCH_SIZE, CATEGORIES_FILE, PRODUCTS_FILE
+from utils.catalog_io import FORMATS, export_catalog, import_catalog
+from utils.database import async_session, engine, init_database
+from utils.repricing import apply_price_list, describe_adjustment, format_price_diff, parse_adjustment, reprice
+from utils.unit_of_work import commit_session
+
+def print_import_report(path: str, report: dict) -> None:
+    print(
+        f"{path}: прочитано {report['read']}, категорий {report['categories']} "
+        f"(создано по названию {report['categories_created']}), товаров {report['products']}, "
+        f"пропущено {report['skipped']} — {report['seconds']:.2f} с, {report['rows_per_second']:.0f} строк/с"
+    )
+    for error in report["errors"]:
+        print(f"  ⚠️ {error}")
+
+async def run_import(paths, file_format, batch_size) -> None:
+    # All files share one transaction: either the whole set lands or nothing does
+    async with async_session() as session:
+        for path in paths:
+            report = await import_catalog(path, file_format, batch_size, session=session)
+            print_import_report(path, report)
+        await commit_session(session)
+    print("✅ Импорт завершен, изменения сохранены.")
+
+async def run_export(path, file_format, batch_size) -> None:
+    report = await export_catalog(path, file_format, batch_size)
+    print(
+        f"✅ Выгружено категорий: {report['categories']}, товаров: {report['products']} "
+        f"в {path} — {report['seconds']:.2f} с, {report['rows_per_second']:.0f} строк/с"
+    )
+
+async def run_reprice(change, category_id, dry_run) -> None:
+    mode, value = parse_adjustment(change)
+    print(f"Изменение цен: {describe_adjustment(mode, value)}" + (f", категория {category_id}" if category_id else ""))
+    report = await reprice(mode, value, category_id, dry_run=dry_run)
+    print(format_price_diff(report, dry_run))
+
+async def run_price_list(path, file_format, dry_run, batch_size) -> None:
+    report = await apply_price_list(path, file_format, dry_run=dry_run, batch_size=batch_size)
+    print(format_price_diff(report, dry_run))
+
+async def main():
+    """Import or export the catalog"""
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("command", choices=("import", "export", "reprice", "prices"))
+    parser.add_argument("files", nargs="*", help="files to import, the file to export to, or the price list")
+    parser.add_argument("--format", choices=FORMATS, help="file format (default: by extension)")
+    parser.add_argument("--batch-size", type=int, default=CATALOG_IMPORT_BATCH_SIZE, help="rows per INSERT batch")
+    parser.add_argument("--change", help="price adjustment for reprice, e.g. +10%% or -50")
+    parser.add_argument("--category", type=int, help="reprice only this category")
+    parser.add_argument("--dry-run", action="store_true", help="only show what would change")
+    args = parser.parse_args()
+
+    try:
+        await init_database()
+        if args.command == "import":
+            print("Импорт каталога...")
+            await run_import(args.files or [CATEGORIES_FILE, PRODUCTS_FILE], args.format, args.batch_size)
+        elif args.command == "export":
+            if len(args.files) != 1:
+                parser.error("export expects exactly one file")
+            print("Экспорт каталога...")
+            await run_export(args.files[0], args.format, args.batch_size)
+        elif args.command == "reprice":
+            if not args.change:
+                parser.error("reprice expects --change")
+            await run_reprice(args.change, args.category, args.dry_run)
+        else:
+            if len(args.files) != 1:
+                parser.error("prices expects exactly one file")
+            print("Применение прайс-листа...")
+            await run_price_list(args.files[0], args.format, args.dry_run, args.batch_size)
+    except Exception as e:
+        print(f"❌ Ошибка: {e}")
+    finally:
+        await engine.dispose()
+
+if __name__ == "__main__":
+    asyncio.run(main())
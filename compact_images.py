@@ -0,0 +1,110 @@
+"""
+One-off image compaction
+Run this file to deduplicate images/ into content-addressed files
+
+Every image is renamed to the SHA-256 of its bytes, so byte-identical copies
+collapse into one file. Product.image_path and telegram_files rows are
+rewritten in one transaction; old files are removed only after it commits,
+so an interrupted run leaves every referenced file in place and can simply
+be repeated.
+
+Stop the bot before compacting and start it again afterwards: a running bot
+serves product paths from its in-memory catalog snapshot, which this script
+cannot invalidate, and would keep pointing at the removed files.
+
+    python compact_images.py [--dry-run]
+"""
+import argparse
+import asyncio
+import os
+import shutil
+from collections import defaultdict
+from typing import Dict, List
+
+from sqlalchemy import delete, select, update
+
+from utils.database import Product, TelegramFile, async_session, engine, init_database
+from utils.image_storage import IMAGES_DIR, file_sha256, image_store, list_image_files
+
+def plan_compaction(directory: str) -> Dict[str, str]:
+    """Map every image path to its content-addressed path"""
+    moves = {}
+    for path in sorted(list_image_files(directory)):
+        extension = os.path.splitext(path)[1].lower() or ".jpg"
+        moves[path] = image_store.content_path(file_sha256(path), extension)
+    return moves
+
+def materialize(moves: Dict[str, str]) -> None:
+    """Create content-addressed files next to the originals"""
+    for source, target in moves.items():
+        if source == target or os.path.exists(target):
+            continue
+        try:
+            os.link(source, target)
+        except OSError:
+            shutil.copy2(source, target)
+
+async def rewrite_references(moves: Dict[str, str]) -> int:
+    """Point products and cached file_ids at the new paths, return updated products"""
+    changed = {source: target for source, target in moves.items() if source != target}
+    if not changed:
+        return 0
+
+    updated = 0
+    async with async_session() as session:
+        result = await session.execute(
+            select(TelegramFile.image_path, TelegramFile.file_id).where(TelegramFile.image_path.in_(list(changed)))
+        )
+        file_ids = dict(result.all())
+        for source, target in changed.items():
+            result = await session.execute(
+                update(Product).where(Product.image_path == source).values(image_path=target)
+            )
+            updated += result.rowcount
+            # Same bytes, so a file_id uploaded for the old name is valid for the new one
+            if source in file_ids:
+                await session.merge(TelegramFile(image_path=target, file_id=file_ids[source]))
+        await session.execute(delete(TelegramFile).where(TelegramFile.image_path.in_(list(changed))))
+        await session.commit()
+    return updated
+
+async def main():
+    """Deduplicate the images directory"""
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--dry-run", action="store_true", help="only report what would change")
+    args = parser.parse_args()
+
+    print("Сжатие каталога изображений...")
+    try:
+        await init_database()
+        moves = await asyncio.to_thread(plan_compaction, IMAGES_DIR)
+        groups: Dict[str, List[str]] = defaultdict(list)
+        for source, target in moves.items():
+            groups[target].append(source)
+        # Identical files have identical sizes; one inode per group survives
+        reclaimed = sum(
+            os.path.getsize(sources[0]) * (len({os.stat(source).st_ino for source in sources}) - 1)
+            for sources in groups.values()
+        )
+        duplicates = len(moves) - len(groups)
+        print(f"Файлов: {len(moves)}, уникальных: {len(groups)}, дубликатов: {duplicates}")
+
+        if args.dry_run:
+            print(f"Будет освобождено: {reclaimed / 1024:.0f} КБ (пробный запуск, ничего не изменено)")
+            return
+
+        await asyncio.to_thread(materialize, moves)
+        updated = await rewrite_references(moves)
+        removed = 0
+        for source, target in moves.items():
+            if source != target:
+                await image_store.delete(source)
+                removed += 1
+        print(f"✅ Обновлено товаров: {updated}, удалено файлов: {removed}, освобождено: {reclaimed / 1024:.0f} КБ")
+    except Exception as e:
+        print(f"❌ Ошибка при сжатии изображений: {e}")
+    finally:
+        await engine.dispose()
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -3,10 +3,107 @@ import os
 # Bot configuration
 BOT_TOKEN = os.getenv("BOT_TOKEN", "YOUR_BOT_TOKEN_HERE")
 ADMIN_ID = int(os.getenv("ADMIN_ID", "123456789"))  # Replace with actual admin user ID
+# Custom Bot API server base URL (e.g. a local server or a fake one for benchmarks)
+TELEGRAM_API_URL = os.getenv("TELEGRAM_API_URL", "")
+
+# Update delivery: "polling" or "webhook"
+BOT_MODE = os.getenv("BOT_MODE", "polling")
+# Public HTTPS URL Telegram should call; the webhook is registered on startup when set
+WEBHOOK_BASE_URL = os.getenv("WEBHOOK_BASE_URL", "")
+WEBHOOK_PATH = os.getenv("WEBHOOK_PATH", "/webhook")
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET", "")
+WEBHOOK_HOST = os.getenv("WEBHOOK_HOST", "0.0.0.0")
+WEBHOOK_PORT = int(os.getenv("WEBHOOK_PORT", "8080"))
+WEBHOOK_MAX_CONCURRENT_UPDATES = int(os.getenv("WEBHOOK_MAX_CONCURRENT_UPDATES", "100"))
+WEBHOOK_DRAIN_TIMEOUT = float(os.getenv("WEBHOOK_DRAIN_TIMEOUT", "10"))
+
+# Outbound rate limits (messages per second; 0 disables a limit). Telegram allows
+# about 30 per second overall and about one per second per chat, with short bursts
+SEND_GLOBAL_RATE = float(os.getenv("SEND_GLOBAL_RATE", "30"))
+SEND_CHAT_RATE = float(os.getenv("SEND_CHAT_RATE", "1"))
+SEND_CHAT_BURST = float(os.getenv("SEND_CHAT_BURST", "3"))
+# Requests answered with 429 Too Many Requests are retried this many times
+SEND_MAX_RETRIES = int(os.getenv("SEND_MAX_RETRIES", "3"))
+
+# Prometheus metrics endpoint (GET /metrics); 0 disables it
+METRICS_HOST = os.getenv("METRICS_HOST", "127.0.0.1")
+METRICS_PORT = int(os.getenv("METRICS_PORT", "0"))
+
+# FSM storage: "memory", "sqlite" (single node) or "redis" (several workers)
+FSM_STORAGE = os.getenv("FSM_STORAGE", "memory")
+FSM_SQLITE_PATH = os.getenv("FSM_SQLITE_PATH", "data/fsm.sqlite3")
+REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379/0")
+# Abandoned admin flows expire after this many seconds (0 = never)
+FSM_STATE_TTL = int(os.getenv("FSM_STATE_TTL", "3600"))
+# SQLite storage buffers writes and commits them in batches at this interval
+FSM_FLUSH_INTERVAL = float(os.getenv("FSM_FLUSH_INTERVAL", "0.05"))
 
 # Seller contact information
 SELLER_CONTACT = os.getenv("SELLER_CONTACT", "@seller_username")
 GROUP = os.getenv("GROUP", "null")
+
+# Database connection pool
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "5"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "10"))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "30"))
+# Pinging on checkout costs a round trip per checkout; recycling old connections is usually enough
+DB_POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "0") == "1"
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))
+# asyncpg prepared statement cache per connection (0 disables, e.g. behind pgbouncer)
+DB_STATEMENT_CACHE_SIZE = int(os.getenv("DB_STATEMENT_CACHE_SIZE", "100"))
+# Statements one update may execute before it is flagged (0 disables the check)
+DB_QUERY_BUDGET = int(os.getenv("DB_QUERY_BUDGET", "5"))
+# Log statement counts of every update and the statements repeated within one (N+1)
+DB_QUERY_DEBUG = os.getenv("DB_QUERY_DEBUG", "0") == "1"
+
+# Serve catalog reads from the in-process snapshot (see utils/catalog_cache.py)
+CATALOG_CACHE_ENABLED = os.getenv("CATALOG_CACHE_ENABLED", "1") == "1"
+# Seconds between checks for catalog writes made by other processes (workers, bulk_catalog.py)
+CATALOG_CACHE_CHECK_INTERVAL = float(os.getenv("CATALOG_CACHE_CHECK_INTERVAL", "5"))
+# Products per page in catalog keyboards
+CATALOG_PAGE_SIZE = int(os.getenv("CATALOG_PAGE_SIZE", "20"))
+
+# Product search: "auto" (Postgres pg_trgm when installed), "postgres" or "memory"
+SEARCH_BACKEND = os.getenv("SEARCH_BACKEND", "auto")
+SEARCH_PAGE_SIZE = int(os.getenv("SEARCH_PAGE_SIZE", "10"))
+
+# Largest product photo accepted from admins, in bytes
+IMAGE_MAX_SIZE = int(os.getenv("IMAGE_MAX_SIZE", str(10 * 1024 * 1024)))
+# Uploads are re-encoded into a display image (sent in product views) and a thumbnail
+IMAGE_DISPLAY_SIZE = int(os.getenv("IMAGE_DISPLAY_SIZE", "1024"))
+IMAGE_THUMB_SIZE = int(os.getenv("IMAGE_THUMB_SIZE", "320"))
+# "JPEG" or "WEBP"
+IMAGE_VARIANT_FORMAT = os.getenv("IMAGE_VARIANT_FORMAT", "JPEG").upper()
+IMAGE_VARIANT_QUALITY = int(os.getenv("IMAGE_VARIANT_QUALITY", "82"))
+# Processes rendering variants
+IMAGE_WORKERS = int(os.getenv("IMAGE_WORKERS", "1"))
+
+# Orphaned image collection: seconds between background runs (0 disables)
+IMAGE_GC_INTERVAL = float(os.getenv("IMAGE_GC_INTERVAL", "86400"))
+# Files younger than this may belong to an upload still in progress
+IMAGE_GC_GRACE = float(os.getenv("IMAGE_GC_GRACE", "3600"))
+# "quarantine" moves orphans to images/.quarantine, "delete" removes them
+IMAGE_GC_MODE = os.getenv("IMAGE_GC_MODE", "quarantine")
+IMAGE_GC_QUARANTINE_TTL = float(os.getenv("IMAGE_GC_QUARANTINE_TTL", str(7 * 86400)))
+IMAGE_GC_BATCH_SIZE = int(os.getenv("IMAGE_GC_BATCH_SIZE", "100"))
+IMAGE_GC_BATCH_DELAY = float(os.getenv("IMAGE_GC_BATCH_DELAY", "1.0"))
+
+# Bulk catalog import/export: rows per INSERT batch, largest uploaded file in bytes
+CATALOG_IMPORT_BATCH_SIZE = int(os.getenv("CATALOG_IMPORT_BATCH_SIZE", "1000"))
+CATALOG_IMPORT_MAX_SIZE = int(os.getenv("CATALOG_IMPORT_MAX_SIZE", str(20 * 1024 * 1024)))
+
+# Users who /start the bot are recorded in batches: at most this often, or once this many are buffered
+USER_REGISTRY_FLUSH_INTERVAL = float(os.getenv("USER_REGISTRY_FLUSH_INTERVAL", "1.0"))
+USER_REGISTRY_BATCH_SIZE = int(os.getenv("USER_REGISTRY_BATCH_SIZE", "500"))
+
+# Broadcasts: concurrent sends (the pace is set by SEND_GLOBAL_RATE), recipients per
+# checkpoint, seconds a crashed worker's broadcast stays locked, seconds between
+# checks for broadcasts queued by other processes
+BROADCAST_WORKERS = int(os.getenv("BROADCAST_WORKERS", "30"))
+BROADCAST_CHUNK_SIZE = int(os.getenv("BROADCAST_CHUNK_SIZE", "100"))
+BROADCAST_LEASE = float(os.getenv("BROADCAST_LEASE", "120"))
+BROADCAST_POLL_INTERVAL = float(os.getenv("BROADCAST_POLL_INTERVAL", "30"))
+
 # Data file paths
 CATEGORIES_FILE = "data/categories.json"
 PRODUCTS_FILE = "data/products.json"
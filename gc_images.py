@@ -0,0 +1,58 @@
+"""
+Orphaned image collection
+Run this file to remove images no product references
+
+Files under images/ that no product row points at are moved to
+images/.quarantine (or deleted with --delete) in small batches. Files younger
+than the grace period are left alone, so it is safe to run while the bot is
+serving admin uploads. The bot runs the same collection in the background
+every IMAGE_GC_INTERVAL seconds.
+
+    python gc_images.py [--dry-run] [--delete] [--grace SECONDS]
+"""
+import argparse
+import asyncio
+
+from config import IMAGE_GC_BATCH_DELAY, IMAGE_GC_BATCH_SIZE, IMAGE_GC_GRACE, IMAGE_GC_MODE
+from utils.database import engine, init_database
+from utils.image_gc import collect_orphaned_images
+
+async def main():
+    """Collect orphaned images"""
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--dry-run", action="store_true", help="only report what would be removed")
+    parser.add_argument("--delete", action="store_true", help="delete orphans instead of quarantining them")
+    parser.add_argument("--grace", type=float, default=IMAGE_GC_GRACE, help="skip files younger than this, seconds")
+    parser.add_argument("--batch-size", type=int, default=IMAGE_GC_BATCH_SIZE)
+    parser.add_argument("--batch-delay", type=float, default=IMAGE_GC_BATCH_DELAY)
+    args = parser.parse_args()
+
+    print("Поиск неиспользуемых изображений...")
+    try:
+        await init_database()
+        report = await collect_orphaned_images(
+            grace=args.grace,
+            mode="delete" if args.delete else IMAGE_GC_MODE,
+            batch_size=args.batch_size,
+            batch_delay=args.batch_delay,
+            dry_run=args.dry_run
+        )
+        print(
+            f"Файлов проверено: {report['scanned']}, используется: {report['referenced']}, "
+            f"без ссылок: {report['orphaned']}"
+        )
+        if args.dry_run:
+            print(f"Будет освобождено: {report['bytes_reclaimed'] / 1024:.0f} КБ (пробный запуск, ничего не изменено)")
+            return
+        print(
+            f"✅ Удалено: {report['removed']}, в карантине: {report['quarantined']}, "
+            f"пропущено: {report['skipped']}, очищено из карантина: {report['purged']}, "
+            f"освобождено: {report['bytes_reclaimed'] / 1024:.0f} КБ"
+        )
+    except Exception as e:
+        print(f"❌ Ошибка при очистке изображений: {e}")
+    finally:
+        await engine.dispose()
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -1,18 +1,35 @@
-from aiogram import Router, F
+import asyncio
+import logging
+import os
+import tempfile
+
+from aiogram import Router, F, html
 from aiogram.filters import Command
-from aiogram.types import Message, CallbackQuery
+from aiogram.types import Message, CallbackQuery, Document, FSInputFile
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import State, StatesGroup
 from aiogram.utils.markdown import hbold
-import os
-from config import ADMIN_ID, ADMIN_WELCOME_MESSAGE
-from keyboards.inline import get_admin_keyboard, get_admin_categories_keyboard, get_admin_products_keyboard
+from config import ADMIN_ID, ADMIN_WELCOME_MESSAGE, CATALOG_IMPORT_MAX_SIZE
+from keyboards.inline import (
+    get_admin_keyboard, get_admin_categories_keyboard, get_admin_products_keyboard,
+    get_broadcast_confirm_keyboard, get_reprice_confirm_keyboard, get_reprice_scope_keyboard
+)
 from keyboards.admin_extended import get_admin_category_products_keyboard, get_product_admin_keyboard
+from keyboards.pagination import parse_page_token
 from utils.database import (
     add_category, delete_category, update_category, get_categories,
-    add_product, delete_product, update_product, get_products, get_product, update_product_image
+    add_product, delete_product, update_product, get_products, get_product, update_product_image,
+    get_catalog_cache_stats, get_category_with_products, get_pool_stats
 )
-from utils.image_storage import save_image, get_image_path, delete_image
+from utils.broadcast import count_recipients, create_broadcast, format_broadcast, get_broadcasts
+from utils.catalog_io import CatalogImportError, detect_format, export_catalog, import_catalog
+from utils.image_storage import ImageTooLarge, image_store
+from utils.repricing import apply_price_list, describe_adjustment, format_price_diff, parse_adjustment, reprice
+from utils.navigation import Screen, navigate
+from utils.telegram_media import DocumentTooLarge, download_document, download_photo
+from utils.unit_of_work import UnitOfWork
+
+logger = logging.getLogger(__name__)
 
 router = Router()
 
@@ -30,11 +47,40 @@ class AdminStates(StatesGroup):
     waiting_product_field_description = State()
     waiting_product_field_price = State()
     waiting_product_field_image = State()
+    waiting_catalog_file = State()
+    waiting_reprice_adjustment = State()
+    waiting_price_list = State()
+    waiting_reprice_confirm = State()
+    waiting_broadcast_text = State()
+    waiting_broadcast_confirm = State()
 
 def is_admin(user_id: int) -> bool:
     """Check if user is admin"""
     return user_id == ADMIN_ID
 
+async def get_category_products_view(category_id: int, after_id=None, before_id=None, default_name: str = "Категория"):
+    """Get category name and products management keyboard in one fetch"""
+    category = await get_category_with_products(category_id, after_id=after_id, before_id=before_id)
+    if category is None:
+        category = {"id": category_id, "name": default_name, "products": [], "has_prev": False, "has_next": False}
+    return category["name"], get_admin_category_products_keyboard(category)
+
+async def get_product_admin_screen(product: dict) -> Screen:
+    """Product card with management buttons, with its photo if there is one"""
+    has_image = await image_store.exists(product.get('image_path'))
+    product_text = f"""
+📦 <b>{product['name']}</b>
+
+📝 Описание: {product['description']}
+
+💰 Цена: <b>{product['price']} руб.</b>
+
+{"📸 Изображение: есть" if has_image else "📸 Изображение: отсутствует"}
+
+Выберите что хотите изменить:"""
+    keyboard = get_product_admin_keyboard(product['id'], product['category_id'])
+    return Screen(product_text, keyboard, product=product if has_image else None)
+
 @router.message(Command("admin"))
 async def admin_panel(message: Message):
     """Show admin panel"""
@@ -45,26 +91,62 @@ async def admin_panel(message: Message):
     admin_kb = get_admin_keyboard()
     await message.answer(ADMIN_WELCOME_MESSAGE, reply_markup=admin_kb)
 
+@router.message(Command("cache_stats"))
+async def cache_stats(message: Message):
+    """Show catalog snapshot cache counters"""
+    if not is_admin(message.from_user.id):
+        await message.answer("❌ У вас нет доступа к панели администратора.")
+        return
+
+    stats = get_catalog_cache_stats()
+    await message.answer(
+        f"🗄️ Кэш каталога (версия {stats['version']}):\n\n"
+        f"Попаданий: <b>{stats['hits']}</b>\n"
+        f"Промахов (запросов к БД): <b>{stats['misses']}</b>\n"
+        f"Сбросов: <b>{stats['invalidations']}</b>\n"
+        f"Из них по изменениям других процессов: <b>{stats['remote_changes']}</b>",
+        parse_mode="HTML"
+    )
+
+@router.message(Command("db_stats"))
+async def db_stats(message: Message):
+    """Show database connection pool metrics"""
+    if not is_admin(message.from_user.id):
+        await message.answer("❌ У вас нет доступа к панели администратора.")
+        return
+
+    stats = get_pool_stats()
+    await message.answer(
+        f"🔌 Пул соединений (размер {stats['size']}):\n\n"
+        f"Занято сейчас: <b>{stats['checked_out']}</b> (пик {stats['checked_out_peak']})\n"
+        f"Сверх лимита: <b>{stats['overflow']}</b> (пик {stats['overflow_peak']})\n"
+        f"Выдано соединений: <b>{stats['checkouts']}</b>\n"
+        f"Ожидание: среднее {stats['wait_avg_ms']:.2f} мс, p99 {stats['wait_p99_ms']:.2f} мс, "
+        f"макс {stats['wait_max_ms']:.2f} мс\n"
+        f"Таймаутов: <b>{stats['timeouts']}</b>",
+        parse_mode="HTML"
+    )
+
 @router.callback_query(F.data == "admin_categories")
-async def admin_categories(callback: CallbackQuery):
+async def admin_categories(callback: CallbackQuery, state: FSMContext):
     """Show categories management"""
     if not is_admin(callback.from_user.id):
         await callback.answer("❌ Доступ запрещен!", show_alert=True)
         return
 
     categories_kb = await get_admin_categories_keyboard()
-    await callback.message.edit_text("📂 Управление категориями:", reply_markup=categories_kb)
+    await navigate(callback, state, Screen("📂 Управление категориями:", categories_kb, parse_mode=None))
     await callback.answer()
 
 @router.callback_query(F.data == "admin_products")
-async def admin_products(callback: CallbackQuery):
+async def admin_products(callback: CallbackQuery, state: FSMContext):
     """Show products management"""
     if not is_admin(callback.from_user.id):
         await callback.answer("❌ Доступ запрещен!", show_alert=True)
         return
 
     products_kb = await get_admin_products_keyboard()
-    await callback.message.edit_text("🛍️ Управление товарами:", reply_markup=products_kb)
+    await navigate(callback, state, Screen("🛍️ Управление товарами:", products_kb, parse_mode=None))
     await callback.answer()
 
 @router.callback_query(F.data == "add_category")
@@ -79,7 +161,7 @@ async def add_category_start(callback: CallbackQuery, state: FSMContext):
     await callback.answer()
 
 @router.message(AdminStates.waiting_category_name)
-async def add_category_finish(message: Message, state: FSMContext):
+async def add_category_finish(message: Message, state: FSMContext, uow: UnitOfWork):
     """Finish adding new category"""
     category_name = message.text.strip()
 
@@ -88,6 +170,7 @@ async def add_category_finish(message: Message, state: FSMContext):
         return
 
     category_id = await add_category(category_name)
+    await uow.commit()
     await message.answer(f"✅ Категория <b>{category_name}</b> добавлена!", parse_mode="HTML")
 
     # Show categories management menu again
@@ -96,7 +179,7 @@ async def add_category_finish(message: Message, state: FSMContext):
     await state.clear()
 
 @router.callback_query(F.data.startswith("delete_category_"))
-async def delete_category_handler(callback: CallbackQuery):
+async def delete_category_handler(callback: CallbackQuery, state: FSMContext, uow: UnitOfWork):
     """Delete category"""
     if not is_admin(callback.from_user.id):
         await callback.answer("❌ Доступ запрещен!", show_alert=True)
@@ -108,11 +191,12 @@ async def delete_category_handler(callback: CallbackQuery):
 
     if category_name:
         await delete_category(category_id)
+        await uow.commit()
         await callback.answer(f"✅ Категория {category_name} удалена!")
 
         # Update the keyboard
         categories_kb = await get_admin_categories_keyboard()
-        await callback.message.edit_reply_markup(reply_markup=categories_kb)
+        await navigate(callback, state, Screen("📂 Управление категориями:", categories_kb, parse_mode=None))
     else:
         await callback.answer("❌ Категория не найдена!", show_alert=True)
 
@@ -138,7 +222,7 @@ async def edit_category_start(callback: CallbackQuery, state: FSMContext):
     await callback.answer()
 
 @router.message(AdminStates.waiting_new_category_name)
-async def edit_category_finish(message: Message, state: FSMContext):
+async def edit_category_finish(message: Message, state: FSMContext, uow: UnitOfWork):
     """Finish editing category"""
     new_name = message.text.strip()
 
@@ -150,6 +234,7 @@ async def edit_category_finish(message: Message, state: FSMContext):
     category_id = data["category_id"]
 
     await update_category(category_id, new_name)
+    await uow.commit()
     await message.answer(f"✅ Название категории изменено на <b>{new_name}</b>!", parse_mode="HTML")
 
     # Show categories management menu again
@@ -213,25 +298,22 @@ async def add_product_image(message: Message, state: FSMContext):
     await state.set_state(AdminStates.waiting_product_image)
 
 @router.message(AdminStates.waiting_product_image)
-async def add_product_finish(message: Message, state: FSMContext):
+async def add_product_finish(message: Message, state: FSMContext, uow: UnitOfWork):
     """Finish adding new product"""
     data = await state.get_data()
     image_path = None
+    variants = {}
 
     # Check if user wants to skip image upload
     if message.text and message.text.strip().lower() == "/skip":
         pass  # Keep image_path as None
     elif message.photo:
         try:
-            # Download and save image
-            photo = message.photo[-1]  # Get the highest resolution
-            file_info = await message.bot.get_file(photo.file_id)
-            file_data = await message.bot.download_file(file_info.file_path)
-
-            # Save image and get path
-            image_id = save_image(file_data.read(), ".jpg")
-            image_path = get_image_path(image_id, ".jpg")
-
+            # Stream the highest resolution straight into the image store
+            image_path = (await download_photo(message.bot, message.photo[-1])).path
+            variants = await image_store.create_variants(image_path)
+        except ImageTooLarge as e:
+            await message.answer(f"❌ Изображение слишком большое (максимум {e.max_size // (1024 * 1024)} МБ).")
         except Exception as e:
             await message.answer(f"❌ Ошибка при сохранении изображения: {str(e)}")
             # Continue without image
@@ -244,8 +326,11 @@ async def add_product_finish(message: Message, state: FSMContext):
         data["product_description"],
         data["product_price"],
         data["category_id"],
-        image_path
+        image_path,
+        display_image_path=variants.get("display"),
+        thumb_image_path=variants.get("thumb")
     )
+    await uow.commit()
 
     success_msg = f"✅ Товар <b>{data['product_name']}</b> добавлен!"
     if image_path:
@@ -317,7 +402,7 @@ async def edit_product_price_input(message: Message, state: FSMContext):
     await state.set_state(AdminStates.waiting_new_product_price)
 
 @router.message(AdminStates.waiting_new_product_price)
-async def edit_product_finish(message: Message, state: FSMContext):
+async def edit_product_finish(message: Message, state: FSMContext, uow: UnitOfWork):
     """Finish editing product"""
     try:
         price = float(message.text.strip())
@@ -335,6 +420,7 @@ async def edit_product_finish(message: Message, state: FSMContext):
         data["new_product_description"],
         price
     )
+    await uow.commit()
 
     await message.answer(f"✅ Товар <b>{data['new_product_name']}</b> обновлен!", parse_mode="HTML")
 
@@ -344,83 +430,348 @@ async def edit_product_finish(message: Message, state: FSMContext):
     await state.clear()
 
 @router.callback_query(F.data == "back_to_admin")
-async def back_to_admin(callback: CallbackQuery):
+async def back_to_admin(callback: CallbackQuery, state: FSMContext):
     """Return to admin panel"""
     if not is_admin(callback.from_user.id):
         await callback.answer("❌ Доступ запрещен!", show_alert=True)
         return
 
     admin_kb = get_admin_keyboard()
-    await callback.message.edit_text(ADMIN_WELCOME_MESSAGE, reply_markup=admin_kb)
+    await navigate(callback, state, Screen(ADMIN_WELCOME_MESSAGE, admin_kb, parse_mode=None))
     await callback.answer()
 
+@router.callback_query(F.data == "admin_import")
+async def catalog_import_start(callback: CallbackQuery, state: FSMContext):
+    """Start bulk catalog import"""
+    if not is_admin(callback.from_user.id):
+        await callback.answer("❌ Доступ запрещен!", show_alert=True)
+        return
 
+    await callback.message.answer(
+        "📥 Отправьте файл каталога в формате JSON или CSV.\n\n"
+        "CSV: строка заголовка и колонки id, name, description, price, category_id или category "
+        "(название, недостающие категории будут созданы). Товары с известным id обновляются, "
+        "без id — добавляются.\n\n"
+        "Отправьте /cancel для отмены."
+    )
+    await state.set_state(AdminStates.waiting_catalog_file)
+    await callback.answer()
 
+@router.message(AdminStates.waiting_catalog_file)
+async def catalog_import_finish(message: Message, state: FSMContext, uow: UnitOfWork):
+    """Import uploaded catalog file"""
+    if message.text and message.text.strip().lower() == "/cancel":
+        await state.clear()
+        await message.answer(ADMIN_WELCOME_MESSAGE, reply_markup=get_admin_keyboard())
+        return
+    if not message.document:
+        await message.answer("❌ Пожалуйста, отправьте файл JSON или CSV или /cancel для отмены!")
+        return
 
+    try:
+        file_format = detect_format(message.document.file_name or "")
+    except CatalogImportError as e:
+        await message.answer(f"❌ {e}")
+        return
 
-# New handlers for improved product management
-@router.callback_query(F.data.startswith("admin_category_products_"))
-async def admin_category_products(callback: CallbackQuery):
-    """Show products in specific category for management"""
+    fd, path = tempfile.mkstemp(suffix=f".{file_format}")
+    os.close(fd)
+    try:
+        await download_document(message.bot, message.document, path, CATALOG_IMPORT_MAX_SIZE)
+        report = await import_catalog(path, file_format)
+        await uow.commit()
+    except DocumentTooLarge as e:
+        await message.answer(f"❌ Файл слишком большой (максимум {e.max_size // (1024 * 1024)} МБ).")
+        return
+    except CatalogImportError as e:
+        await message.answer(f"❌ Файл не импортирован: {e}")
+        return
+    finally:
+        await asyncio.to_thread(os.remove, path)
+
+    text = (
+        f"✅ Импорт завершен за {report['seconds']:.1f} с ({report['rows_per_second']:.0f} строк/с)\n\n"
+        f"Категорий: <b>{report['categories']}</b> (создано по названию {report['categories_created']})\n"
+        f"Товаров: <b>{report['products']}</b>\n"
+        f"Пропущено строк: <b>{report['skipped']}</b>"
+    )
+    if report["errors"]:
+        text += "\n\n" + "\n".join(f"⚠️ {html.quote(error)}" for error in report["errors"])
+    await message.answer(text, parse_mode="HTML")
+    await message.answer(ADMIN_WELCOME_MESSAGE, reply_markup=get_admin_keyboard())
+    await state.clear()
+
+@router.callback_query(F.data.in_({"admin_export_csv", "admin_export_json"}))
+async def catalog_export(callback: CallbackQuery):
+    """Send the whole catalog as a file"""
     if not is_admin(callback.from_user.id):
         await callback.answer("❌ Доступ запрещен!", show_alert=True)
         return
 
+    await callback.answer("⏳ Выгружаю каталог...")
+    file_format = callback.data.rsplit("_", 1)[1]
+    fd, path = tempfile.mkstemp(suffix=f".{file_format}")
+    os.close(fd)
     try:
-        category_id = int(callback.data.split("_")[3]) # Убедитесь, что индекс правильный
-    except (IndexError, ValueError):
-        await callback.answer("❌ Неверный формат данных категории!", show_alert=True)
+        report = await export_catalog(path, file_format)
+        await callback.message.answer_document(
+            FSInputFile(path, filename=f"catalog.{file_format}"),
+            caption=f"📤 Категорий: {report['categories']}, товаров: {report['products']}"
+        )
+    finally:
+        await asyncio.to_thread(os.remove, path)
+
+@router.callback_query(F.data == "admin_reprice")
+async def reprice_start(callback: CallbackQuery, state: FSMContext):
+    """Choose what to reprice"""
+    if not is_admin(callback.from_user.id):
+        await callback.answer("❌ Доступ запрещен!", show_alert=True)
+        return
+
+    await state.clear()
+    scope_kb = await get_reprice_scope_keyboard()
+    await navigate(callback, state, Screen("💸 Переоценка: выберите, какие цены изменить", scope_kb, parse_mode=None))
+    await callback.answer()
+
+@router.callback_query(F.data.startswith("reprice_scope_"))
+async def reprice_scope(callback: CallbackQuery, state: FSMContext):
+    """Ask for the price adjustment"""
+    if not is_admin(callback.from_user.id):
+        await callback.answer("❌ Доступ запрещен!", show_alert=True)
+        return
+
+    await state.update_data(reprice_category_id=int(callback.data.split("_")[2]) or None)
+    await callback.message.answer(
+        "Введите изменение цены: процент (+10%, -15%) или сумму в рублях (+100, -49.90).\n\n"
+        "Отправьте /cancel для отмены."
+    )
+    await state.set_state(AdminStates.waiting_reprice_adjustment)
+    await callback.answer()
+
+@router.message(AdminStates.waiting_reprice_adjustment)
+async def reprice_preview(message: Message, state: FSMContext):
+    """Show the diff of an adjustment before applying it"""
+    if message.text and message.text.strip().lower() == "/cancel":
+        await state.clear()
+        await message.answer(ADMIN_WELCOME_MESSAGE, reply_markup=get_admin_keyboard())
+        return
+    try:
+        mode, value = parse_adjustment(message.text or "")
+    except ValueError as e:
+        await message.answer(f"❌ {e}. Пример: +10% или -50")
+        return
+
+    data = await state.get_data()
+    report = await reprice(mode, value, data.get("reprice_category_id"), dry_run=True)
+    await state.update_data(reprice_mode=mode, reprice_value=value)
+    await state.set_state(AdminStates.waiting_reprice_confirm)
+    await message.answer(
+        f"💸 Предпросмотр: {describe_adjustment(mode, value)}\n\n{format_price_diff(report, dry_run=True)}",
+        reply_markup=get_reprice_confirm_keyboard()
+    )
+
+@router.callback_query(F.data == "reprice_price_list")
+async def price_list_start(callback: CallbackQuery, state: FSMContext):
+    """Ask for a price list file"""
+    if not is_admin(callback.from_user.id):
+        await callback.answer("❌ Доступ запрещен!", show_alert=True)
+        return
+
+    await callback.message.answer(
+        "📄 Отправьте прайс-лист в формате CSV или JSON с колонками id и price "
+        "(например, выгрузку каталога с исправленными ценами).\n\n"
+        "Отправьте /cancel для отмены."
+    )
+    await state.set_state(AdminStates.waiting_price_list)
+    await callback.answer()
+
+async def _run_price_list(message: Message, document: Document, dry_run: bool) -> dict:
+    file_format = detect_format(document.file_name or "")
+    fd, path = tempfile.mkstemp(suffix=f".{file_format}")
+    os.close(fd)
+    try:
+        await download_document(message.bot, document, path, CATALOG_IMPORT_MAX_SIZE)
+        return await apply_price_list(path, file_format, dry_run=dry_run)
+    finally:
+        await asyncio.to_thread(os.remove, path)
+
+@router.message(AdminStates.waiting_price_list)
+async def price_list_preview(message: Message, state: FSMContext):
+    """Show the diff of an uploaded price list before applying it"""
+    if message.text and message.text.strip().lower() == "/cancel":
+        await state.clear()
+        await message.answer(ADMIN_WELCOME_MESSAGE, reply_markup=get_admin_keyboard())
+        return
+    if not message.document:
+        await message.answer("❌ Пожалуйста, отправьте файл CSV или JSON или /cancel для отмены!")
         return
 
-    # Предполагаем, что get_categories() и get_admin_category_products_keyboard() реализованы
-    categories = await get_categories() # Замените на вашу реальную функцию
-    category_name = next((cat["name"] for cat in categories if cat["id"] == category_id), "Неизвестная категория")
+    try:
+        report = await _run_price_list(message, message.document, dry_run=True)
+    except DocumentTooLarge as e:
+        await message.answer(f"❌ Файл слишком большой (максимум {e.max_size // (1024 * 1024)} МБ).")
+        return
+    except CatalogImportError as e:
+        await message.answer(f"❌ Прайс-лист не прочитан: {e}")
+        return
 
-    products_kb = await get_admin_category_products_keyboard(category_id) # Замените на вашу реальную функцию
+    # Telegram keeps the file; it is downloaded again when the change is confirmed
+    await state.update_data(price_list=message.document.model_dump(mode="json", exclude_none=True))
+    await state.set_state(AdminStates.waiting_reprice_confirm)
+    await message.answer(
+        f"📄 Предпросмотр прайс-листа\n\n{format_price_diff(report, dry_run=True)}",
+        reply_markup=get_reprice_confirm_keyboard()
+    )
+
+@router.callback_query(F.data == "reprice_apply")
+async def reprice_apply(callback: CallbackQuery, state: FSMContext, uow: UnitOfWork):
+    """Apply the previewed price change"""
+    if not is_admin(callback.from_user.id):
+        await callback.answer("❌ Доступ запрещен!", show_alert=True)
+        return
 
-    message_text = f"🛍️ Товары в категории <b>{category_name}</b>:"
+    if await state.get_state() != AdminStates.waiting_reprice_confirm.state:
+        await callback.answer("❌ Переоценка устарела, начните заново.", show_alert=True)
+        return
 
+    data = await state.get_data()
+    await callback.answer("⏳ Применяю...")
     try:
-  
-        if callback.message.photo:
-
-            await callback.message.delete()
-            await callback.message.answer(
-                text=message_text,
-                reply_markup=products_kb,
-                parse_mode="HTML"
-            )
-        elif callback.message.text:
-
-            await callback.message.edit_text(
-                text=message_text,
-                reply_markup=products_kb,
-                parse_mode="HTML"
-            )
+        if "price_list" in data:
+            report = await _run_price_list(callback.message, Document.model_validate(data["price_list"]), dry_run=False)
         else:
+            report = await reprice(data["reprice_mode"], data["reprice_value"], data.get("reprice_category_id"))
+        await uow.commit()
+    except (DocumentTooLarge, CatalogImportError) as e:
+        await callback.message.answer(f"❌ Ошибка при переоценке: {e}")
+        return
+    finally:
+        await state.clear()
 
-            await callback.message.delete()
-            await callback.message.answer(
-                text=message_text,
-                reply_markup=products_kb,
-                parse_mode="HTML"
-            )
-        # --- Конец главного изменения ---
-        await callback.answer() 
+    await callback.message.edit_reply_markup(reply_markup=None)
+    await callback.message.answer(f"✅ Переоценка выполнена\n\n{format_price_diff(report, dry_run=False)}")
+    await callback.message.answer(ADMIN_WELCOME_MESSAGE, reply_markup=get_admin_keyboard())
 
-    except Exception as e:
-        print(f"Ошибка при обработке admin_category_products ({callback.data}): {e}")
+@router.callback_query(F.data == "reprice_cancel")
+async def reprice_cancel(callback: CallbackQuery, state: FSMContext):
+    """Drop the previewed price change"""
+    if not is_admin(callback.from_user.id):
+        await callback.answer("❌ Доступ запрещен!", show_alert=True)
+        return
 
-        await callback.answer("❌ Произошла ошибка при отображении товаров!", show_alert=True)
+    await state.clear()
+    await callback.message.edit_reply_markup(reply_markup=None)
+    await callback.message.answer(ADMIN_WELCOME_MESSAGE, reply_markup=get_admin_keyboard())
+    await callback.answer("Переоценка отменена")
+
+@router.callback_query(F.data == "admin_broadcast")
+async def broadcast_start(callback: CallbackQuery, state: FSMContext):
+    """Ask for the broadcast text"""
+    if not is_admin(callback.from_user.id):
+        await callback.answer("❌ Доступ запрещен!", show_alert=True)
+        return
+
+    recipients = await count_recipients()
+    await callback.message.answer(
+        f"📣 Отправьте текст рассылки. Получателей: {recipients}.\n\n"
+        "Форматирование (жирный, ссылки) сохранится. Отправьте /cancel для отмены."
+    )
+    await state.set_state(AdminStates.waiting_broadcast_text)
+    await callback.answer()
+
+@router.message(AdminStates.waiting_broadcast_text)
+async def broadcast_preview(message: Message, state: FSMContext):
+    """Show the broadcast as users will see it before sending"""
+    if message.text and message.text.strip().lower() == "/cancel":
+        await state.clear()
+        await message.answer(ADMIN_WELCOME_MESSAGE, reply_markup=get_admin_keyboard())
+        return
+    if not message.text:
+        await message.answer("❌ Рассылка поддерживает только текст. Отправьте текст или /cancel для отмены!")
+        return
+
+    await state.update_data(broadcast_text=message.html_text)
+    await state.set_state(AdminStates.waiting_broadcast_confirm)
+    await message.answer("👀 Так сообщение увидят пользователи:")
+    await message.answer(message.html_text, parse_mode="HTML", reply_markup=get_broadcast_confirm_keyboard())
+
+@router.callback_query(F.data == "broadcast_send")
+async def broadcast_send(callback: CallbackQuery, state: FSMContext, uow: UnitOfWork):
+    """Queue the previewed broadcast"""
+    if not is_admin(callback.from_user.id):
+        await callback.answer("❌ Доступ запрещен!", show_alert=True)
+        return
+
+    if await state.get_state() != AdminStates.waiting_broadcast_confirm.state:
+        await callback.answer("❌ Рассылка устарела, начните заново.", show_alert=True)
+        return
+
+    data = await state.get_data()
+    await state.clear()
+    broadcast = await create_broadcast(data["broadcast_text"], callback.message.chat.id)
+    await uow.commit()
+    await callback.message.edit_reply_markup(reply_markup=None)
+    await callback.message.answer(
+        f"✅ Рассылка #{broadcast['id']} поставлена в очередь, получателей: {broadcast['recipients']}.\n"
+        "Когда она завершится, придет отчет. Ход рассылки: /broadcasts"
+    )
+    await callback.answer()
+
+@router.callback_query(F.data == "broadcast_cancel")
+async def broadcast_cancel(callback: CallbackQuery, state: FSMContext):
+    """Drop the previewed broadcast"""
+    if not is_admin(callback.from_user.id):
+        await callback.answer("❌ Доступ запрещен!", show_alert=True)
+        return
+
+    await state.clear()
+    await callback.message.edit_reply_markup(reply_markup=None)
+    await callback.message.answer(ADMIN_WELCOME_MESSAGE, reply_markup=get_admin_keyboard())
+    await callback.answer("Рассылка отменена")
+
+@router.message(Command("broadcasts"))
+async def broadcasts_status(message: Message):
+    """Show progress of recent broadcasts"""
+    if not is_admin(message.from_user.id):
+        await message.answer("❌ У вас нет доступа к панели администратора.")
+        return
+
+    broadcasts = await get_broadcasts()
+    if not broadcasts:
+        await message.answer("📣 Рассылок еще не было.")
+        return
+    await message.answer("📣 Последние рассылки:\n\n" + "\n".join(format_broadcast(item) for item in broadcasts))
+
+# New handlers for improved product management
+@router.callback_query(F.data.startswith("admin_category_products_"))
+async def admin_category_products(callback: CallbackQuery, state: FSMContext):
+    """Show products in specific category for management"""
+    if not is_admin(callback.from_user.id):
+        await callback.answer("❌ Доступ запрещен!", show_alert=True)
+        return
 
+    try:
+        parts = callback.data.split("_")
+        category_id = int(parts[3]) # Убедитесь, что индекс правильный
+        after_id, before_id = parse_page_token(parts[4] if len(parts) > 4 else None)
+    except (IndexError, ValueError):
+        await callback.answer("❌ Неверный формат данных категории!", show_alert=True)
+        return
 
+    category_name, products_kb = await get_category_products_view(
+        category_id, after_id=after_id, before_id=before_id, default_name="Неизвестная категория"
+    )
 
+    try:
+        await navigate(callback, state, Screen(f"🛍️ Товары в категории <b>{category_name}</b>:", products_kb))
+        await callback.answer()
+    except Exception:
+        logger.exception("Ошибка при обработке admin_category_products (%s)", callback.data)
+        await callback.answer("❌ Произошла ошибка при отображении товаров!", show_alert=True)
 
 @router.callback_query(F.data.startswith("view_product_"))
-async def view_product_admin(callback: CallbackQuery):
+async def view_product_admin(callback: CallbackQuery, state: FSMContext):
     """Show product details for admin"""
-    from aiogram.types import FSInputFile
-    
     if not is_admin(callback.from_user.id):
         await callback.answer("❌ Доступ запрещен!", show_alert=True)
         return
@@ -432,38 +783,14 @@ async def view_product_admin(callback: CallbackQuery):
         await callback.answer("❌ Товар не найден!", show_alert=True)
         return
 
-    product_text = f"""
-📦 <b>{product['name']}</b>
-
-📝 Описание: {product['description']}
-
-💰 Цена: <b>{product['price']} руб.</b>
-"""
-
-
-    image_status = "📸 Изображение: есть" if product.get('image_path') and os.path.exists(product['image_path']) else "📸 Изображение: отсутствует"
-    product_text += f"\n{image_status}"
-    product_text += "\n\nВыберите что хотите изменить:"
+    screen = await get_product_admin_screen(product)
+    try:
+        await navigate(callback, state, screen)
+    except Exception:
+        # If image fails to load, show text
+        logger.exception("Не удалось отправить фото товара %s", product_id)
+        await navigate(callback, state, screen._replace(product=None))
 
-    keyboard = get_product_admin_keyboard(product_id, product['category_id'])
-    
-    # Show image if available
-    if product.get('image_path') and os.path.exists(product['image_path']):
-        try:
-            photo = FSInputFile(product['image_path'])
-            await callback.message.answer_photo(
-                photo=photo, 
-                caption=product_text, 
-                reply_markup=keyboard,
-                parse_mode="HTML"
-            )
-        except Exception as e:
-            # If image fails to load, send text message
-            await callback.message.answer(product_text, reply_markup=keyboard, parse_mode="HTML")
-    else:
-        # No image or image not found
-        await callback.message.answer(product_text, reply_markup=keyboard, parse_mode="HTML")
-    
     await callback.answer()
 
 @router.callback_query(F.data.startswith("edit_product_name_"))
@@ -485,7 +812,7 @@ async def edit_product_name_start(callback: CallbackQuery, state: FSMContext):
     await callback.answer()
 
 @router.message(AdminStates.waiting_product_field_name)
-async def edit_product_name_finish(message: Message, state: FSMContext):
+async def edit_product_name_finish(message: Message, state: FSMContext, uow: UnitOfWork):
     """Finish editing product name"""
     new_name = message.text.strip()
 
@@ -497,12 +824,11 @@ async def edit_product_name_finish(message: Message, state: FSMContext):
     product = await get_product(data["product_id"])
 
     await update_product(data["product_id"], new_name, product['description'], product['price'])
+    await uow.commit()
     await message.answer(f"✅ Название товара изменено на: <b>{new_name}</b>", parse_mode="HTML")
 
     # Show category products again
-    products_kb = await get_admin_category_products_keyboard(data["category_id"])
-    categories = await get_categories()
-    category_name = next((cat["name"] for cat in categories if cat["id"] == data["category_id"]), "Категория")
+    category_name, products_kb = await get_category_products_view(data["category_id"])
     await message.answer(f"🛍️ Товары в категории <b>{category_name}</b>:", reply_markup=products_kb, parse_mode="HTML")
     await state.clear()
 
@@ -526,7 +852,7 @@ async def edit_product_price_start(callback: CallbackQuery, state: FSMContext):
     await callback.answer()
 
 @router.message(AdminStates.waiting_product_field_price)
-async def edit_product_price_finish(message: Message, state: FSMContext):
+async def edit_product_price_finish(message: Message, state: FSMContext, uow: UnitOfWork):
     """Finish editing product price"""
     try:
         price = float(message.text.strip())
@@ -540,12 +866,11 @@ async def edit_product_price_finish(message: Message, state: FSMContext):
     product = await get_product(data["product_id"])
 
     await update_product(data["product_id"], product['name'], product['description'], price)
+    await uow.commit()
     await message.answer(f"✅ Цена товара изменена на: <b>{price} руб.</b>", parse_mode="HTML")
 
     # Show category products again
-    products_kb = await get_admin_category_products_keyboard(data["category_id"])
-    categories = await get_categories()
-    category_name = next((cat["name"] for cat in categories if cat["id"] == data["category_id"]), "Категория")
+    category_name, products_kb = await get_category_products_view(data["category_id"])
     await message.answer(f"🛍️ Товары в категории <b>{category_name}</b>:", reply_markup=products_kb, parse_mode="HTML")
     await state.clear()
 
@@ -568,7 +893,7 @@ async def edit_product_description_start(callback: CallbackQuery, state: FSMCont
     await callback.answer()
 
 @router.message(AdminStates.waiting_product_field_description)
-async def edit_product_description_finish(message: Message, state: FSMContext):
+async def edit_product_description_finish(message: Message, state: FSMContext, uow: UnitOfWork):
     """Finish editing product description"""
     new_description = message.text.strip()
 
@@ -580,12 +905,11 @@ async def edit_product_description_finish(message: Message, state: FSMContext):
     product = await get_product(data["product_id"])
 
     await update_product(data["product_id"], product['name'], new_description, product['price'])
+    await uow.commit()
     await message.answer(f"✅ Описание товара изменено!", parse_mode="HTML")
 
     # Show category products again
-    products_kb = await get_admin_category_products_keyboard(data["category_id"])
-    categories = await get_categories()
-    category_name = next((cat["name"] for cat in categories if cat["id"] == data["category_id"]), "Категория")
+    category_name, products_kb = await get_category_products_view(data["category_id"])
     await message.answer(f"🛍️ Товары в категории <b>{category_name}</b>:", reply_markup=products_kb, parse_mode="HTML")
     await state.clear()
 
@@ -611,44 +935,41 @@ async def edit_product_image_start(callback: CallbackQuery, state: FSMContext):
     await callback.answer()
 
 @router.message(AdminStates.waiting_product_field_image)
-async def edit_product_image_finish(message: Message, state: FSMContext):
+async def edit_product_image_finish(message: Message, state: FSMContext, uow: UnitOfWork):
     """Finish editing product image"""
     if not message.photo:
         await message.answer("❌ Пожалуйста, отправьте изображение!")
         return
 
     data = await state.get_data()
-    product = await get_product(data["product_id"])
-
-    # Delete old image if exists
-    if product.get('image_path'):
-        delete_image(product['image_path'])
 
     try:
-        # Download and save new image
-        photo = message.photo[-1]  # Get the highest resolution
-        file_info = await message.bot.get_file(photo.file_id)
-        file_data = await message.bot.download_file(file_info.file_path)
-
-        # Save image and get path
-        image_id = save_image(file_data.read(), ".jpg")
-        image_path = get_image_path(image_id, ".jpg")
-
-        await update_product_image(data["product_id"], image_path)
+        # Stream the highest resolution straight into the image store
+        image_path = (await download_photo(message.bot, message.photo[-1])).path
+        variants = await image_store.create_variants(image_path)
+
+        # The old image file is released once no product references it
+        await update_product_image(
+            data["product_id"],
+            image_path,
+            display_image_path=variants.get("display"),
+            thumb_image_path=variants.get("thumb")
+        )
+        await uow.commit()
         await message.answer("✅ Изображение товара обновлено!")
 
+    except ImageTooLarge as e:
+        await message.answer(f"❌ Изображение слишком большое (максимум {e.max_size // (1024 * 1024)} МБ).")
     except Exception as e:
         await message.answer(f"❌ Ошибка при сохранении изображения: {str(e)}")
 
     # Show category products again
-    products_kb = await get_admin_category_products_keyboard(data["category_id"])
-    categories = await get_categories()
-    category_name = next((cat["name"] for cat in categories if cat["id"] == data["category_id"]), "Категория")
+    category_name, products_kb = await get_category_products_view(data["category_id"])
     await message.answer(f"🛍️ Товары в категории <b>{category_name}</b>:", reply_markup=products_kb, parse_mode="HTML")
     await state.clear()
 
 @router.callback_query(F.data.startswith("delete_product_image_"))
-async def delete_product_image_handler(callback: CallbackQuery):
+async def delete_product_image_handler(callback: CallbackQuery, state: FSMContext, uow: UnitOfWork):
     """Delete product image"""
     if not is_admin(callback.from_user.id):
         await callback.answer("❌ Доступ запрещен!", show_alert=True)
@@ -665,32 +986,18 @@ async def delete_product_image_handler(callback: CallbackQuery):
         await callback.answer("❌ У товара нет изображения!", show_alert=True)
         return
 
-    # Delete image file
-    if delete_image(product['image_path']):
-        await update_product_image(product_id, None)
+    # Detach image; the file is deleted with its last reference
+    if await update_product_image(product_id, None):
+        await uow.commit()
         await callback.answer("✅ Изображение товара удалено!")
     else:
         await callback.answer("❌ Ошибка при удалении изображения!", show_alert=True)
 
     # Update product view
-    updated_product = await get_product(product_id)
-    product_text = f"""
-📦 <b>{updated_product['name']}</b>
-
-📝 Описание: {updated_product['description']}
-
-💰 Цена: <b>{updated_product['price']} руб.</b>
-"""
-    if updated_product.get('image_path'):
-        product_text += f"\n📸 Изображение: {updated_product['image_path']}"
-
-    product_text += "\n\nВыберите что хотите изменить:"
-
-    keyboard = get_product_admin_keyboard(product_id, updated_product['category_id'])
-    await callback.message.edit_text(product_text, reply_markup=keyboard, parse_mode="HTML")
+    await navigate(callback, state, await get_product_admin_screen(await get_product(product_id)))
 
 @router.callback_query(F.data.startswith("delete_product_") & ~F.data.startswith("delete_product_image_"))
-async def delete_product_handler(callback: CallbackQuery):
+async def delete_product_handler(callback: CallbackQuery, state: FSMContext, uow: UnitOfWork):
     """Delete entire product"""
     if not is_admin(callback.from_user.id):
         await callback.answer("❌ Доступ запрещен!", show_alert=True)
@@ -703,23 +1010,14 @@ async def delete_product_handler(callback: CallbackQuery):
         await callback.answer("❌ Товар не найден!", show_alert=True)
         return
 
-    # Delete the product's image if it exists
-    if product.get('image_path'):
-        delete_image(product['image_path'])
-
     success = await delete_product(product_id)
+    await uow.commit()
     
     if success:
         await callback.answer(f"✅ Товар {product['name']} удален!")
         
         # Return to category products view
-        products_kb = await get_admin_category_products_keyboard(product['category_id'])
-        categories = await get_categories()
-        category_name = next((cat["name"] for cat in categories if cat["id"] == product['category_id']), "Категория")
-        await callback.message.edit_text(
-            f"🛍️ Товары в категории <b>{category_name}</b>:", 
-            reply_markup=products_kb, 
-            parse_mode="HTML"
-        )
+        category_name, products_kb = await get_category_products_view(product['category_id'])
+        await navigate(callback, state, Screen(f"🛍️ Товары в категории <b>{category_name}</b>:", products_kb))
     else:
         await callback.answer("❌ Ошибка при удалении товара!", show_alert=True)
\ No newline at end of file
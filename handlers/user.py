@@ -1,14 +1,41 @@
-import os
+import html
+import logging
+from functools import lru_cache
 from aiogram import Router, F
-from aiogram.filters import CommandStart
-from aiogram.types import Message, CallbackQuery, ReplyKeyboardMarkup, KeyboardButton
-
-from config import WELCOME_MESSAGE, ORDER_MESSAGE, SELLER_CONTACT, ADMIN_ID, GROUP
-from keyboards.inline import get_categories_keyboard, get_products_keyboard, get_product_detail_keyboard
-from utils.database import get_categories, get_products_by_category, get_product
+from aiogram.filters import Command, CommandObject, CommandStart, StateFilter
+from aiogram.fsm.context import FSMContext
+from aiogram.types import (
+    Message, CallbackQuery, InlineQuery, InlineQueryResultArticle, InputTextMessageContent,
+    ReplyKeyboardMarkup, KeyboardButton
+)
+
+from config import WELCOME_MESSAGE, ORDER_MESSAGE, SELLER_CONTACT, ADMIN_ID, GROUP, SEARCH_PAGE_SIZE
+from keyboards.inline import (
+    get_categories_keyboard, get_products_keyboard, get_product_detail_keyboard,
+    get_product_share_keyboard, get_search_results_keyboard
+)
+from keyboards.pagination import parse_page_token
+from utils.database import get_category_with_products, get_product
+from utils.image_storage import image_store
+from utils.navigation import Screen, navigate
+from utils.search import remember_query, resolve_query, search_products
+from utils.user_registry import user_registry
+
+logger = logging.getLogger(__name__)
 
 router = Router()
 
+def format_product_text(product: dict) -> str:
+    """Render product card text"""
+    return f"""
+🛍️ <b>{product['name']}</b>
+
+📝 {product['description']}
+
+💰 Цена: <b>{product['price']} руб.</b>
+"""
+
+@lru_cache(maxsize=2)
 def get_main_menu_keyboard(is_admin: bool = False):
     """Create main menu keyboard"""
     keyboard_buttons = [[KeyboardButton(text="🛍️ Каталог товаров")]]
@@ -27,6 +54,7 @@ def get_main_menu_keyboard(is_admin: bool = False):
 @router.message(CommandStart())
 async def start_command(message: Message):
     """Handle /start command"""
+    user_registry.remember(message.from_user.id)
     categories_kb = await get_categories_keyboard()
     is_admin = message.from_user.id == ADMIN_ID
     main_menu = get_main_menu_keyboard(is_admin)
@@ -61,35 +89,36 @@ async def admin_panel_shortcut(message: Message):
     from handlers.admin import admin_panel
     await admin_panel(message)
 
-@router.callback_query(F.data.startswith("category_"))
-async def show_category_products(callback: CallbackQuery):
-    """Show products in selected category"""
-    category_id = int(callback.data.split("_")[1])
+async def get_categories_screen() -> Screen:
+    """Catalog start screen"""
+    categories_kb = await get_categories_keyboard()
+    if categories_kb:
+        return Screen(WELCOME_MESSAGE, categories_kb)
+    return Screen("❌ Категории товаров пока не добавлены.")
 
-    products_kb = await get_products_keyboard(category_id)
-    categories = await get_categories()
-    category_name = next((cat["name"] for cat in categories if cat["id"] == category_id), "Неизвестная категория")
+async def get_category_screen(category_id: int, after_id=None, before_id=None) -> Screen:
+    """One page of products in a category"""
+    category = await get_category_with_products(category_id, after_id=after_id, before_id=before_id)
+    category_name = category["name"] if category else "Неизвестная категория"
+    products_kb = get_products_keyboard(category) if category else None
 
     if products_kb:
-        await callback.message.edit_text(
-            f"🛍️ Товары в категории <b>{category_name}</b>:\n\nВыберите товар:",
-            reply_markup=products_kb,
-            parse_mode="HTML"
-        )
-    else:
-        await callback.message.edit_text(
-            f"❌ В категории <b>{category_name}</b> пока нет товаров.",
-            reply_markup=await get_categories_keyboard(),
-            parse_mode="HTML"
-        )
+        return Screen(f"🛍️ Товары в категории <b>{category_name}</b>:\n\nВыберите товар:", products_kb)
+    return Screen(f"❌ В категории <b>{category_name}</b> пока нет товаров.", await get_categories_keyboard())
 
+@router.callback_query(F.data.startswith("category_"))
+async def show_category_products(callback: CallbackQuery, state: FSMContext):
+    """Show products in selected category"""
+    parts = callback.data.split("_")
+    category_id = int(parts[1])
+    after_id, before_id = parse_page_token(parts[2] if len(parts) > 2 else None)
+
+    await navigate(callback, state, await get_category_screen(category_id, after_id=after_id, before_id=before_id))
     await callback.answer()
 
 @router.callback_query(F.data.startswith("product_"))
-async def show_product_detail(callback: CallbackQuery):
+async def show_product_detail(callback: CallbackQuery, state: FSMContext):
     """Show product details"""
-    from aiogram.types import InputFile, FSInputFile
-    
     product_id = int(callback.data.split("_")[1])
     product = await get_product(product_id)
 
@@ -97,40 +126,21 @@ async def show_product_detail(callback: CallbackQuery):
         await callback.answer("❌ Товар не найден!", show_alert=True)
         return
 
-    product_text = f"""
-🛍️ <b>{product['name']}</b>
-
-📝 {product['description']}
-
-💰 Цена: <b>{product['price']} руб.</b>
-"""
+    product_text = format_product_text(product)
     
-    keyboard = await get_product_detail_keyboard(product_id, product['category_id'])
+    keyboard = get_product_detail_keyboard(product)
     
     # Show image if available
-    if product.get('image_path') and os.path.exists(product['image_path']):
+    if await image_store.exists(product.get('image_path')):
         try:
-            photo = FSInputFile(product['image_path'])
-            await callback.message.answer_photo(
-                photo=photo, 
-                caption=product_text, 
-                reply_markup=keyboard,
-                parse_mode="HTML"
-            )
-        except Exception as e:
-            # If image fails to load, send text message
-            await callback.message.answer(
-                product_text + "\n\n🖼️ Ошибка при загрузке изображения.", 
-                reply_markup=keyboard,
-                parse_mode="HTML"
-            )
+            await navigate(callback, state, Screen(product_text, keyboard, product=product))
+        except Exception:
+            # If image fails to load, show text
+            logger.exception("Не удалось отправить фото товара %s", product_id)
+            await navigate(callback, state, Screen(product_text + "\n\n🖼️ Ошибка при загрузке изображения.", keyboard))
     else:
         # No image or image not found
-        await callback.message.answer(
-            product_text, 
-            reply_markup=keyboard,
-            parse_mode="HTML"
-        )
+        await navigate(callback, state, Screen(product_text, keyboard))
 
     await callback.answer()
 
@@ -151,92 +161,17 @@ async def make_order(callback: CallbackQuery):
     await callback.answer("✅ Контакт продавца отправлен!")
 
 @router.callback_query(F.data == "back_to_categories")
-async def back_to_categories(callback: CallbackQuery):
+async def back_to_categories(callback: CallbackQuery, state: FSMContext):
     """Return to categories menu"""
-    categories_kb = await get_categories_keyboard()
-
     try:
-        if categories_kb:
-            if callback.message.photo:
-                # Удаляем фото и отправляем новое приветствие с клавиатурой.
-                try:
-                    await callback.message.delete()
-                except Exception as delete_err:
-                    print(f"Не удалось удалить предыдущее фото-сообщение в back_to_categories: {delete_err}")
-                    pass
-
-                await callback.message.answer(
-                    text=WELCOME_MESSAGE, # Предполагается, что WELCOME_MESSAGE - это ваша константа
-                    reply_markup=categories_kb,
-                    parse_mode="HTML" # Или как вы там форматируете WELCOME_MESSAGE
-                )
-            elif callback.message.text:
-                # Редактируем текст, если он уже текстовый.
-                await callback.message.edit_text(
-                    text=WELCOME_MESSAGE,
-                    reply_markup=categories_kb,
-                    parse_mode="HTML"
-                )
-            else:
-                # Если что-то другое, удаляем и отправляем новое.
-                try:
-                    await callback.message.delete()
-                except Exception as delete_err:
-                    print(f"Не удалось удалить предыдущее сообщение в back_to_categories: {delete_err}")
-                    pass
-
-                await callback.message.answer(
-                    text=WELCOME_MESSAGE,
-                    reply_markup=categories_kb,
-                    parse_mode="HTML"
-                )
-        else:
-            # Если категорий нет, и предыдущее сообщение было фото
-            if callback.message.photo:
-                try:
-                    await callback.message.delete()
-                except Exception as delete_err:
-                    print(f"Не удалось удалить предыдущее фото-сообщение в back_to_categories (no categories): {delete_err}")
-                    pass
-
-                await callback.message.answer(
-                    text="❌ Категории товаров пока не добавлены.",
-                    reply_markup=await get_categories_keyboard(), # На случай, если клавиатура пуста, но должна быть
-                    parse_mode="HTML"
-                )
-            elif callback.message.text:
-                # Редактируем текст.
-                await callback.message.edit_text(
-                    text="❌ Категории товаров пока не добавлены.",
-                    reply_markup=await get_categories_keyboard(),
-                    parse_mode="HTML"
-                )
-            else:
-                # Удаляем и отправляем новое.
-                try:
-                    await callback.message.delete()
-                except Exception as delete_err:
-                    print(f"Не удалось удалить предыдущее сообщение в back_to_categories (no categories): {delete_err}")
-                    pass
-
-                await callback.message.answer(
-                    text="❌ Категории товаров пока не добавлены.",
-                    reply_markup=await get_categories_keyboard(),
-                    parse_mode="HTML"
-                )
-
-        # await callback.answer() # Эта строка была дважды, убрал одну
-
-    except Exception as e:
-        print(f"Ошибка при обработке back_to_categories: {e}")
-        await callback.answer("❌ Произошла ошибка при возврате к категориям!", show_alert=True)
-    finally:
-        # Важно вызывать callback.answer() в любом случае, чтобы убрать "loading"
+        await navigate(callback, state, await get_categories_screen())
         await callback.answer()
-
+    except Exception:
+        logger.exception("Ошибка при обработке back_to_categories")
+        await callback.answer("❌ Произошла ошибка при возврате к категориям!", show_alert=True)
 
 @router.callback_query(F.data.startswith("back_to_category_"))
-async def back_to_category(callback: CallbackQuery):
+async def back_to_category(callback: CallbackQuery, state: FSMContext):
     """Return to category products"""
     try:
         category_id = int(callback.data.split("_")[3])
@@ -244,85 +179,73 @@ async def back_to_category(callback: CallbackQuery):
         await callback.answer("❌ Неверный формат данных категории!", show_alert=True)
         return
 
-    products_kb = await get_products_keyboard(category_id)
-    categories = await get_categories()
-    category_name = next((cat["name"] for cat in categories if cat["id"] == category_id), "Неизвестная категория")
+    try:
+        await navigate(callback, state, await get_category_screen(category_id))
+        await callback.answer()
+    except Exception:
+        logger.exception("Ошибка при обработке back_to_category (%s)", callback.data)
+        await callback.answer("❌ Произошла ошибка при возврате к товарам!", show_alert=True)
+
+async def render_search_page(query: str, offset: int = 0):
+    """Get text and keyboard for one page of search results"""
+    products, has_more = await search_products(query, offset=offset)
+    if not products:
+        return f"🔍 По запросу <b>{html.escape(query)}</b> ничего не найдено.", await get_categories_keyboard()
+
+    keyboard = get_search_results_keyboard(products, remember_query(query), offset, has_more)
+    return f"🔍 Результаты поиска по запросу <b>{html.escape(query)}</b>:", keyboard
+
+@router.message(Command("search"))
+async def search_command(message: Message, command: CommandObject):
+    """Search products: /search <query>"""
+    if not command.args:
+        await message.answer("🔍 Напишите, что ищете, например: /search жидкость")
+        return
 
-    message_text = f"🛍️ Товары в категории <b>{category_name}</b>:\n\nВыберите товар:"
-    no_products_text = f"❌ В категории <b>{category_name}</b> пока нет товаров."
+    text, keyboard = await render_search_page(command.args)
+    await message.answer(text, reply_markup=keyboard, parse_mode="HTML")
 
-    try:
-        if products_kb: # Если товары есть и клавиатура создана
-            if callback.message.photo:
-                # Если предыдущее сообщение было с фото, удаляем его и отправляем текст.
-                try:
-                    await callback.message.delete()
-                except Exception as delete_err:
-                    print(f"Не удалось удалить предыдущее фото-сообщение в back_to_category: {delete_err}")
-                    pass # Продолжаем, даже если удаление не удалось
-
-                await callback.message.answer(
-                    text=message_text,
-                    reply_markup=products_kb,
-                    parse_mode="HTML"
-                )
-            elif callback.message.text:
-                # Если предыдущее сообщение было текстом, безопасно редактируем.
-                await callback.message.edit_text(
-                    text=message_text,
-                    reply_markup=products_kb,
-                    parse_mode="HTML"
-                )
-            else:
-                # Если предыдущее сообщение было чем-то другим, удаляем и отправляем новое.
-                try:
-                    await callback.message.delete()
-                except Exception as delete_err:
-                    print(f"Не удалось удалить предыдущее сообщение в back_to_category: {delete_err}")
-                    pass
-
-                await callback.message.answer(
-                    text=message_text,
-                    reply_markup=products_kb,
-                    parse_mode="HTML"
-                )
-        else: # Если товаров нет
-            if callback.message.photo:
-                # Удаляем фото и отправляем сообщение о пустой категории.
-                try:
-                    await callback.message.delete()
-                except Exception as delete_err:
-                    print(f"Не удалось удалить предыдущее фото-сообщение в back_to_category (no products): {delete_err}")
-                    pass
-
-                await callback.message.answer(
-                    text=no_products_text,
-                    reply_markup=await get_categories_keyboard(), # Нужна клавиатура для возврата к категориям
-                    parse_mode="HTML"
-                )
-            elif callback.message.text:
-                # Редактируем текст, если он уже текстовый.
-                await callback.message.edit_text(
-                    text=no_products_text,
-                    reply_markup=await get_categories_keyboard(),
-                    parse_mode="HTML"
-                )
-            else:
-                # Если что-то другое, удаляем и отправляем новое.
-                try:
-                    await callback.message.delete()
-                except Exception as delete_err:
-                    print(f"Не удалось удалить предыдущее сообщение в back_to_category (no products): {delete_err}")
-                    pass
-
-                await callback.message.answer(
-                    text=no_products_text,
-                    reply_markup=await get_categories_keyboard(),
-                    parse_mode="HTML"
-                )
+@router.callback_query(F.data.startswith("search_"))
+async def search_page(callback: CallbackQuery, state: FSMContext):
+    """Show another page of search results"""
+    _, query_token, offset = callback.data.split("_")
+    query = resolve_query(query_token)
+    if query is None:
+        await callback.answer("❌ Результаты поиска устарели, повторите запрос.", show_alert=True)
+        return
 
-        await callback.answer()
+    text, keyboard = await render_search_page(query, int(offset))
+    await navigate(callback, state, Screen(text, keyboard))
+    await callback.answer()
+
+@router.inline_query()
+async def search_inline(inline_query: InlineQuery):
+    """Search products from any chat: @bot <query>"""
+    offset = int(inline_query.offset) if inline_query.offset.isdigit() else 0
+    products, has_more = await search_products(inline_query.query, offset=offset, limit=SEARCH_PAGE_SIZE)
+
+    results = [
+        InlineQueryResultArticle(
+            id=str(product["id"]),
+            title=product["name"],
+            description=f"{product['price']} руб.",
+            input_message_content=InputTextMessageContent(
+                message_text=format_product_text(product),
+                parse_mode="HTML"
+            ),
+            reply_markup=get_product_share_keyboard(product)
+        )
+        for product in products
+    ]
+    await inline_query.answer(
+        results,
+        cache_time=30,
+        next_offset=str(offset + len(products)) if has_more else ""
+    )
 
-    except Exception as e:
-        print(f"Ошибка при обработке back_to_category ({callback.data}): {e}")
-        await callback.answer("❌ Произошла ошибка при возврате к товарам!", show_alert=True)
\ No newline at end of file
+# Must stay the last message handler: any other text outside admin flows is a search query
+@router.message(StateFilter(None), F.text, ~F.text.startswith("/"))
+async def search_by_text(message: Message):
+    """Search products by free text"""
+    text, keyboard = await render_search_page(message.text)
+    await message.answer(text, reply_markup=keyboard, parse_mode="HTML")
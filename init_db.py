@@ -11,7 +11,7 @@ async def main():
     try:
         await init_database()
         print("✅ База данных успешно инициализирована!")
-        print("Таблицы categories и products созданы.")
+        print("Таблицы categories и products созданы, миграции применены.")
     except Exception as e:
         print(f"❌ Ошибка при инициализации базы данных: {e}")
 
@@ -1,11 +1,21 @@
 from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton
-from utils.database import get_categories, get_products_by_category
+from keyboards.cache import memoized_keyboard_sync
+from keyboards.pagination import get_page_navigation_row, page_cache_key
 
-async def get_admin_category_products_keyboard(category_id: int) -> InlineKeyboardMarkup:
-    """Create keyboard for managing products in specific category"""
-    categories = await get_categories()
-    products = await get_products_by_category(category_id)
-    category_name = next((cat["name"] for cat in categories if cat["id"] == category_id), "Неизвестная категория")
+def get_admin_category_products_keyboard(category: dict) -> InlineKeyboardMarkup:
+    """Create keyboard for managing one page of products in specific category
+
+    category is the result of get_category_with_products.
+    """
+    return memoized_keyboard_sync(
+        ("admin_category_products", category["id"], page_cache_key(category)),
+        lambda: _build_admin_category_products_keyboard(category)
+    )
+
+def _build_admin_category_products_keyboard(category: dict) -> InlineKeyboardMarkup:
+    category_id = category["id"]
+    category_name = category["name"]
+    products = category["products"]
     
     keyboard = [
         [
@@ -25,6 +35,10 @@ async def get_admin_category_products_keyboard(category_id: int) -> InlineKeyboa
                 )
             ])
     
+    navigation_row = get_page_navigation_row(f"admin_category_products_{category_id}", category)
+    if navigation_row:
+        keyboard.append(navigation_row)
+    
     keyboard.append([
         InlineKeyboardButton(
             text="◀️ Назад к категориям",
@@ -36,6 +50,12 @@ async def get_admin_category_products_keyboard(category_id: int) -> InlineKeyboa
 
 def get_product_admin_keyboard(product_id: int, category_id: int) -> InlineKeyboardMarkup:
     """Create keyboard for product administration"""
+    return memoized_keyboard_sync(
+        ("product_admin", product_id, category_id),
+        lambda: _build_product_admin_keyboard(product_id, category_id)
+    )
+
+def _build_product_admin_keyboard(product_id: int, category_id: int) -> InlineKeyboardMarkup:
     keyboard = [
         [
             InlineKeyboardButton(
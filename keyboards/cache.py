@@ -0,0 +1,61 @@
+"""
+Memoization of inline keyboards.
+
+Keyboards built from catalog rows are shared by all users and only change when
+an admin edits the catalog, so every markup is cached under the catalog version
+it was built from and the whole cache is dropped when the version moves
+(including when another process changed the catalog, see utils/catalog_cache.py).
+While the current update has uncommitted catalog writes, keyboards are built
+from its own session and not cached.
+"""
+from typing import Awaitable, Callable, Dict, Hashable, Optional
+
+from aiogram.types import InlineKeyboardMarkup
+
+from utils.database import catalog_cache, catalog_pending
+
+_MISSING = object()
+
+_markups: Dict[Hashable, Optional[InlineKeyboardMarkup]] = {}
+_markups_version = -1
+
+def _lookup(key: Hashable, version: int):
+    global _markups_version
+    if version != _markups_version:
+        _markups.clear()
+        _markups_version = version
+    return _markups.get(key, _MISSING)
+
+def _store(key: Hashable, version: int, markup: Optional[InlineKeyboardMarkup]) -> None:
+    # Skip markups built from data that was replaced while we were awaiting it
+    if version == catalog_cache.version == _markups_version:
+        _markups[key] = markup
+
+async def memoized_keyboard(
+    key: Hashable,
+    build: Callable[[], Awaitable[Optional[InlineKeyboardMarkup]]]
+) -> Optional[InlineKeyboardMarkup]:
+    """Return cached markup for key, building it with build() on a miss"""
+    if catalog_pending():
+        return await build()
+    await catalog_cache.refresh()
+    version = catalog_cache.version
+    markup = _lookup(key, version)
+    if markup is _MISSING:
+        markup = await build()
+        _store(key, version, markup)
+    return markup
+
+def memoized_keyboard_sync(
+    key: Hashable,
+    build: Callable[[], Optional[InlineKeyboardMarkup]]
+) -> Optional[InlineKeyboardMarkup]:
+    """Synchronous variant of memoized_keyboard for keyboards built without queries"""
+    if catalog_pending():
+        return build()
+    version = catalog_cache.version
+    markup = _lookup(key, version)
+    if markup is _MISSING:
+        markup = build()
+        _store(key, version, markup)
+    return markup
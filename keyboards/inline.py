@@ -1,10 +1,17 @@
+from typing import List
+
 from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton
-from utils.database import get_categories, get_products, get_products_by_category, get_product
+from utils.database import get_categories
 from keyboards.admin_extended import get_admin_category_products_keyboard, get_product_admin_keyboard
-from config import SELLER_CONTACT
+from keyboards.cache import memoized_keyboard, memoized_keyboard_sync
+from keyboards.pagination import get_page_navigation_row, page_cache_key
+from config import SEARCH_PAGE_SIZE, SELLER_CONTACT
 
 async def get_categories_keyboard() -> InlineKeyboardMarkup:
     """Create keyboard with categories"""
+    return await memoized_keyboard("categories", _build_categories_keyboard)
+
+async def _build_categories_keyboard() -> InlineKeyboardMarkup:
     categories = await get_categories()
     
     if not categories:
@@ -21,9 +28,19 @@ async def get_categories_keyboard() -> InlineKeyboardMarkup:
     
     return InlineKeyboardMarkup(inline_keyboard=keyboard)
 
-async def get_products_keyboard(category_id: int) -> InlineKeyboardMarkup:
-    """Create keyboard with products from category"""
-    products = await get_products_by_category(category_id)
+def get_products_keyboard(category: dict) -> InlineKeyboardMarkup:
+    """Create keyboard with one page of products from category
+
+    category is the result of get_category_with_products.
+    """
+    return memoized_keyboard_sync(
+        ("products", category["id"], page_cache_key(category)),
+        lambda: build_products_keyboard(category["id"], category)
+    )
+
+def build_products_keyboard(category_id: int, page: dict) -> InlineKeyboardMarkup:
+    """Create products keyboard from an already fetched page"""
+    products = page["products"]
     
     if not products:
         return None
@@ -37,6 +54,10 @@ async def get_products_keyboard(category_id: int) -> InlineKeyboardMarkup:
             )
         ])
     
+    navigation_row = get_page_navigation_row(f"category_{category_id}", page)
+    if navigation_row:
+        keyboard.append(navigation_row)
+    
     # Add back button
     keyboard.append([
         InlineKeyboardButton(
@@ -47,24 +68,27 @@ async def get_products_keyboard(category_id: int) -> InlineKeyboardMarkup:
     
     return InlineKeyboardMarkup(inline_keyboard=keyboard)
 
-async def get_product_detail_keyboard(product_id: int, category_id: int) -> InlineKeyboardMarkup:
+def get_product_detail_keyboard(product: dict) -> InlineKeyboardMarkup:
     """Create keyboard for product details"""
-    product = await get_product(product_id)
+    return memoized_keyboard_sync(("product_detail", product["id"]), lambda: _build_product_detail_keyboard(product))
+
+def _seller_button(product: dict) -> InlineKeyboardButton:
     SELLER = SELLER_CONTACT.split("@")[1]
+    return InlineKeyboardButton(
+        text="🛒 Связаться с продавцом",
+        url=(
+            f"tg://resolve?domain={SELLER}&text=Здравствуйте%2C%0A"
+            f"Я%20хочу%20заказать%20товар%20'{product.get('name')}'"
+        )
+    )
+
+def _build_product_detail_keyboard(product: dict) -> InlineKeyboardMarkup:
     keyboard = [
-        [
-            InlineKeyboardButton(
-                text="🛒 Связаться с продавцом",
-                url=(
-                    f"tg://resolve?domain={SELLER}&text=Здравствуйте%2C%0A"
-                    f"Я%20хочу%20заказать%20товар%20'{product.get('name')}'"
-                )
-            )
-        ],
+        [_seller_button(product)],
         [
             InlineKeyboardButton(
                 text="◀️ Назад к товарам",
-                callback_data=f"back_to_category_{category_id}"
+                callback_data=f"back_to_category_{product['category_id']}"
             )
         ],
         [
@@ -77,8 +101,55 @@ async def get_product_detail_keyboard(product_id: int, category_id: int) -> Inli
     
     return InlineKeyboardMarkup(inline_keyboard=keyboard)
 
+def get_product_share_keyboard(product: dict) -> InlineKeyboardMarkup:
+    """Create keyboard for a product sent through inline mode
+
+    Inline messages live in foreign chats, so only the URL button is kept.
+    """
+    return memoized_keyboard_sync(
+        ("product_share", product["id"]),
+        lambda: InlineKeyboardMarkup(inline_keyboard=[[_seller_button(product)]])
+    )
+
+def get_search_results_keyboard(products: List[dict], query_token: str, offset: int, has_more: bool) -> InlineKeyboardMarkup:
+    """Create keyboard with one page of search results"""
+    keyboard = []
+    for product in products:
+        keyboard.append([
+            InlineKeyboardButton(
+                text=f"🛍️ {product['name']} - {product['price']} руб.",
+                callback_data=f"product_{product['id']}"
+            )
+        ])
+
+    navigation_row = []
+    if offset > 0:
+        navigation_row.append(InlineKeyboardButton(
+            text="⬅️ Назад",
+            callback_data=f"search_{query_token}_{max(offset - SEARCH_PAGE_SIZE, 0)}"
+        ))
+    if has_more:
+        navigation_row.append(InlineKeyboardButton(
+            text="Далее ➡️",
+            callback_data=f"search_{query_token}_{offset + len(products)}"
+        ))
+    if navigation_row:
+        keyboard.append(navigation_row)
+
+    keyboard.append([
+        InlineKeyboardButton(
+            text="📂 К категориям",
+            callback_data="back_to_categories"
+        )
+    ])
+
+    return InlineKeyboardMarkup(inline_keyboard=keyboard)
+
 def get_admin_keyboard() -> InlineKeyboardMarkup:
     """Create admin panel keyboard"""
+    return memoized_keyboard_sync("admin", _build_admin_keyboard)
+
+def _build_admin_keyboard() -> InlineKeyboardMarkup:
     keyboard = [
         [
             InlineKeyboardButton(
@@ -91,6 +162,34 @@ def get_admin_keyboard() -> InlineKeyboardMarkup:
                 text="🛍️ Управление товарами",
                 callback_data="admin_products"
             )
+        ],
+        [
+            InlineKeyboardButton(
+                text="💸 Переоценка",
+                callback_data="admin_reprice"
+            )
+        ],
+        [
+            InlineKeyboardButton(
+                text="📣 Рассылка",
+                callback_data="admin_broadcast"
+            )
+        ],
+        [
+            InlineKeyboardButton(
+                text="📥 Импорт каталога",
+                callback_data="admin_import"
+            )
+        ],
+        [
+            InlineKeyboardButton(
+                text="📤 Экспорт CSV",
+                callback_data="admin_export_csv"
+            ),
+            InlineKeyboardButton(
+                text="📤 Экспорт JSON",
+                callback_data="admin_export_json"
+            )
         ]
     ]
     
@@ -98,6 +197,9 @@ def get_admin_keyboard() -> InlineKeyboardMarkup:
 
 async def get_admin_categories_keyboard() -> InlineKeyboardMarkup:
     """Create admin categories management keyboard"""
+    return await memoized_keyboard("admin_categories", _build_admin_categories_keyboard)
+
+async def _build_admin_categories_keyboard() -> InlineKeyboardMarkup:
     categories = await get_categories()
     
     keyboard = [
@@ -133,6 +235,9 @@ async def get_admin_categories_keyboard() -> InlineKeyboardMarkup:
 
 async def get_admin_products_keyboard() -> InlineKeyboardMarkup:
     """Create admin products categories selection keyboard"""
+    return await memoized_keyboard("admin_products", _build_admin_products_keyboard)
+
+async def _build_admin_products_keyboard() -> InlineKeyboardMarkup:
     categories = await get_categories()
     
     keyboard = []
@@ -154,3 +259,82 @@ async def get_admin_products_keyboard() -> InlineKeyboardMarkup:
     ])
     
     return InlineKeyboardMarkup(inline_keyboard=keyboard)
+
+async def get_reprice_scope_keyboard() -> InlineKeyboardMarkup:
+    """Create repricing scope selection keyboard"""
+    return await memoized_keyboard("reprice_scope", _build_reprice_scope_keyboard)
+
+async def _build_reprice_scope_keyboard() -> InlineKeyboardMarkup:
+    categories = await get_categories()
+
+    keyboard = [
+        [
+            InlineKeyboardButton(
+                text="🌐 Весь каталог",
+                callback_data="reprice_scope_0"
+            )
+        ]
+    ]
+
+    for category in categories:
+        keyboard.append([
+            InlineKeyboardButton(
+                text=f"📂 {category['name']}",
+                callback_data=f"reprice_scope_{category['id']}"
+            )
+        ])
+
+    keyboard.append([
+        InlineKeyboardButton(
+            text="📄 Загрузить прайс-лист",
+            callback_data="reprice_price_list"
+        )
+    ])
+    keyboard.append([
+        InlineKeyboardButton(
+            text="◀️ Назад в панель",
+            callback_data="back_to_admin"
+        )
+    ])
+
+    return InlineKeyboardMarkup(inline_keyboard=keyboard)
+
+def get_reprice_confirm_keyboard() -> InlineKeyboardMarkup:
+    """Create repricing confirmation keyboard"""
+    return memoized_keyboard_sync("reprice_confirm", _build_reprice_confirm_keyboard)
+
+def _build_reprice_confirm_keyboard() -> InlineKeyboardMarkup:
+    keyboard = [
+        [
+            InlineKeyboardButton(
+                text="✅ Применить",
+                callback_data="reprice_apply"
+            ),
+            InlineKeyboardButton(
+                text="❌ Отмена",
+                callback_data="reprice_cancel"
+            )
+        ]
+    ]
+
+    return InlineKeyboardMarkup(inline_keyboard=keyboard)
+
+def get_broadcast_confirm_keyboard() -> InlineKeyboardMarkup:
+    """Create broadcast confirmation keyboard"""
+    return memoized_keyboard_sync("broadcast_confirm", _build_broadcast_confirm_keyboard)
+
+def _build_broadcast_confirm_keyboard() -> InlineKeyboardMarkup:
+    keyboard = [
+        [
+            InlineKeyboardButton(
+                text="📣 Отправить всем",
+                callback_data="broadcast_send"
+            ),
+            InlineKeyboardButton(
+                text="❌ Отмена",
+                callback_data="broadcast_cancel"
+            )
+        ]
+    ]
+
+    return InlineKeyboardMarkup(inline_keyboard=keyboard)
@@ -0,0 +1,44 @@
+from typing import List, Optional, Tuple
+
+from aiogram.types import InlineKeyboardButton
+
+# Page tokens are appended to a list callback: "category_5_n120" is the page
+# after product 120, "category_5_p121" the page before product 121.
+NEXT_PAGE = "n"
+PREV_PAGE = "p"
+
+def parse_page_token(token: Optional[str]) -> Tuple[Optional[int], Optional[int]]:
+    """Convert page token to (after_id, before_id)"""
+    if not token:
+        return None, None
+    direction, anchor = token[0], token[1:]
+    if not anchor.isdigit():
+        return None, None
+    if direction == NEXT_PAGE:
+        return int(anchor), None
+    if direction == PREV_PAGE:
+        return None, int(anchor)
+    return None, None
+
+def page_cache_key(page: dict) -> Tuple[Optional[int], Optional[int]]:
+    """Identify a page within a catalog version by its first and last product"""
+    products = page["products"]
+    if not products:
+        return None, None
+    return products[0]["id"], products[-1]["id"]
+
+def get_page_navigation_row(callback_prefix: str, page: dict) -> List[InlineKeyboardButton]:
+    """Create previous/next buttons for a products page"""
+    products = page["products"]
+    row = []
+    if products and page["has_prev"]:
+        row.append(InlineKeyboardButton(
+            text="⬅️ Назад",
+            callback_data=f"{callback_prefix}_{PREV_PAGE}{products[0]['id']}"
+        ))
+    if products and page["has_next"]:
+        row.append(InlineKeyboardButton(
+            text="Далее ➡️",
+            callback_data=f"{callback_prefix}_{NEXT_PAGE}{products[-1]['id']}"
+        ))
+    return row
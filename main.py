@@ -1,13 +1,33 @@
 import asyncio
 import logging
+import signal
+from typing import Tuple
+from aiohttp import web
 from aiogram import Bot, Dispatcher
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.client.telegram import TelegramAPIServer
 from aiogram.filters import CommandStart, Command
 from aiogram.types import Message
-from aiogram.fsm.storage.memory import MemoryStorage
+from aiogram.webhook.aiohttp_server import setup_application
 
-from config import BOT_TOKEN, ADMIN_ID
+from config import (
+    BOT_TOKEN, ADMIN_ID, TELEGRAM_API_URL, BOT_MODE,
+    WEBHOOK_BASE_URL, WEBHOOK_PATH, WEBHOOK_SECRET, WEBHOOK_HOST, WEBHOOK_PORT,
+    WEBHOOK_MAX_CONCURRENT_UPDATES, WEBHOOK_DRAIN_TIMEOUT, IMAGE_GC_INTERVAL, METRICS_HOST, METRICS_PORT
+)
 from handlers import user, admin
-from utils.database import init_database
+from middlewares.database import UnitOfWorkMiddleware
+from middlewares.metrics import setup_metrics
+from middlewares.send_queue import SendScheduler, setup_send_queue
+from utils.broadcast import broadcast_engine
+from utils.database import async_session, init_database
+from utils.fsm_storage import create_fsm_storage
+from utils.image_gc import run_image_gc_forever
+from utils.image_processing import shutdown_image_workers
+from utils.image_storage import image_store
+from utils.metrics import start_metrics_server
+from utils.user_registry import user_registry
+from utils.webhook import WebhookUpdateHandler
 
 # Configure logging
 logging.basicConfig(
@@ -16,29 +36,106 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-# Initialize bot and dispatcher
-bot = Bot(token=BOT_TOKEN)
-storage = MemoryStorage()
-dp = Dispatcher(storage=storage)
+# The bot and dispatcher are built in main(), not at import: image workers are
+# spawned processes (utils/image_processing.py) that import this module again
+
+def create_bot() -> Tuple[Bot, SendScheduler]:
+    """Create bot with the configured API server and its outbound rate limiter"""
+    session = AiohttpSession(api=TelegramAPIServer.from_base(TELEGRAM_API_URL)) if TELEGRAM_API_URL else None
+    bot = Bot(token=BOT_TOKEN, session=session)
+    return bot, setup_send_queue(bot)
+
+def create_dispatcher(bot: Bot) -> Dispatcher:
+    """Create dispatcher with FSM storage, routers and middlewares; bot gets the API metrics"""
+    dp = Dispatcher(storage=create_fsm_storage())
+
+    # Include routers
+    dp.include_router(user.router)
+    dp.include_router(admin.router)
+    setup_metrics(dp, bot)
+    # Registered after the metrics middleware so the final commit counts towards the update
+    dp.update.outer_middleware(UnitOfWorkMiddleware(async_session))
+    return dp
+
+def create_webhook_app(dp: Dispatcher, bot: Bot) -> web.Application:
+    """Create aiohttp application that receives updates via webhook"""
+    app = web.Application()
+    handler = WebhookUpdateHandler(
+        dp,
+        bot,
+        secret_token=WEBHOOK_SECRET or None,
+        max_concurrent_updates=WEBHOOK_MAX_CONCURRENT_UPDATES,
+        drain_timeout=WEBHOOK_DRAIN_TIMEOUT
+    )
+    handler.register(app, WEBHOOK_PATH)
+    # Emits dispatcher startup/shutdown; registered after the handler so updates drain first
+    setup_application(app, dp, bot=bot)
+    return app
+
+async def run_webhook(dp: Dispatcher, bot: Bot):
+    """Serve updates from an aiohttp webhook listener until stopped"""
+    if WEBHOOK_BASE_URL:
+        await bot.set_webhook(
+            url=f"{WEBHOOK_BASE_URL.rstrip('/')}{WEBHOOK_PATH}",
+            secret_token=WEBHOOK_SECRET or None,
+            max_connections=WEBHOOK_MAX_CONCURRENT_UPDATES,
+            allowed_updates=dp.resolve_used_update_types()
+        )
+
+    runner = web.AppRunner(create_webhook_app(dp, bot))
+    await runner.setup()
+    site = web.TCPSite(runner, WEBHOOK_HOST, WEBHOOK_PORT)
+    await site.start()
+    logger.info(f"Webhook listener started on {WEBHOOK_HOST}:{WEBHOOK_PORT}{WEBHOOK_PATH}")
+
+    stop_event = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop_event.set)
+    try:
+        await stop_event.wait()
+    finally:
+        logger.info("Stopping webhook listener...")
+        await runner.cleanup()
 
 async def main():
     """Main function to start the bot"""
+    bot, send_scheduler = create_bot()
+    dp = create_dispatcher(bot)
+    gc_task = None
+    metrics_runner = None
     try:
         # Initialize database
         await init_database()
-        
-        # Include routers
-        dp.include_router(user.router)
-        dp.include_router(admin.router)
-        
-        # Start polling
-        logger.info("Bot is starting...")
-        await dp.start_polling(bot)
-        
+        await image_store.load()
+        if METRICS_PORT:
+            metrics_runner = await start_metrics_server(METRICS_HOST, METRICS_PORT)
+        if IMAGE_GC_INTERVAL > 0:
+            gc_task = asyncio.create_task(run_image_gc_forever(IMAGE_GC_INTERVAL))
+        # Resumes broadcasts interrupted by the last shutdown
+        broadcast_engine.start(bot)
+
+        if BOT_MODE == "webhook":
+            logger.info("Bot is starting in webhook mode...")
+            await run_webhook(dp, bot)
+        else:
+            # Start polling
+            logger.info("Bot is starting...")
+            await dp.start_polling(bot)
+
     except Exception as e:
         logger.error(f"Error starting bot: {e}")
     finally:
+        if gc_task:
+            gc_task.cancel()
+        if metrics_runner:
+            await metrics_runner.cleanup()
+        await broadcast_engine.close()
+        await user_registry.close()
+        await dp.storage.close()
+        await send_scheduler.close()
         await bot.session.close()
+        shutdown_image_workers()
 
 if __name__ == "__main__":
     asyncio.run(main())
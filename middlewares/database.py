@@ -0,0 +1,47 @@
+"""
+Request-scoped database session.
+
+UnitOfWorkMiddleware gives every update one UnitOfWork (see
+utils/unit_of_work.py): the database helpers called by its handler share one
+lazily opened session, and the update is committed once when the handler
+returns or rolled back if it raises. Handlers that want the session itself
+can take a `uow` argument.
+
+Handlers that write call `await uow.commit()` before replying with success:
+a reply sent before the commit could announce a write that then fails, and
+the open transaction would hold its connection and row locks while the send
+queue paces the Bot API calls. The commit at the end then does nothing.
+"""
+from typing import Any, Awaitable, Callable, Dict
+
+from aiogram import BaseMiddleware
+from aiogram.types import TelegramObject, Update
+from sqlalchemy.ext.asyncio import async_sessionmaker
+
+from utils.unit_of_work import UnitOfWork, current_unit_of_work
+
+class UnitOfWorkMiddleware(BaseMiddleware):
+    """Outer update middleware: one database session and one commit per update"""
+
+    def __init__(self, session_factory: async_sessionmaker):
+        self.session_factory = session_factory
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: Update,
+        data: Dict[str, Any]
+    ) -> Any:
+        uow = UnitOfWork(self.session_factory)
+        token = current_unit_of_work.set(uow)
+        data["uow"] = uow
+        try:
+            result = await handler(event, data)
+            await uow.commit()
+            return result
+        except BaseException:
+            await uow.rollback()
+            raise
+        finally:
+            current_unit_of_work.reset(token)
+            await uow.close()
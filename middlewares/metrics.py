@@ -0,0 +1,128 @@
+"""
+Latency instrumentation middlewares.
+
+UpdateMetricsMiddleware wraps every update and records its duration together
+with the database and Bot API time spent on it, labeled by the handler that
+took the update (module and function name, e.g. handlers.user.show_product_detail,
+one per callback prefix). HandlerLabelMiddleware runs inside the routers and
+reports which handler matched; ApiMetricsMiddleware times Bot API requests.
+
+Updates that execute more than DB_QUERY_BUDGET statements are counted in
+shopbot_update_db_budget_exceeded_total. With DB_QUERY_DEBUG every update
+logs its statement count and DB time, and updates over budget or repeating a
+statement are logged as warnings with the offending SQL.
+
+Use setup_metrics to install all three.
+"""
+import logging
+import time
+from typing import Any, Awaitable, Callable, Dict
+
+from aiogram import BaseMiddleware, Bot, Dispatcher
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware, NextRequestMiddlewareType
+from aiogram.methods import Response, TelegramMethod
+from aiogram.methods.base import TelegramType
+from aiogram.types import TelegramObject, Update
+
+from config import DB_QUERY_BUDGET, DB_QUERY_DEBUG
+from utils.metrics import (
+    UPDATE_API_TIME, UPDATE_DB_TIME, UPDATE_DURATION, UPDATE_ERRORS, UPDATE_OVER_BUDGET, UPDATE_QUERIES,
+    UpdateTimings, current_update, record_api_request
+)
+
+logger = logging.getLogger(__name__)
+
+class UpdateMetricsMiddleware(BaseMiddleware):
+    """Outer update middleware: time the whole update and attribute DB and API time to it"""
+
+    def __init__(self, query_budget: int = DB_QUERY_BUDGET, debug: bool = DB_QUERY_DEBUG):
+        self.query_budget = query_budget
+        self.debug = debug
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: Update,
+        data: Dict[str, Any]
+    ) -> Any:
+        timings = UpdateTimings(track_statements=self.debug)
+        token = current_update.set(timings)
+        started = time.perf_counter()
+        try:
+            return await handler(event, data)
+        except Exception:
+            UPDATE_ERRORS.inc(handler=timings.handler, update_type=event.event_type)
+            raise
+        finally:
+            elapsed = time.perf_counter() - started
+            current_update.reset(token)
+            labels = {"handler": timings.handler, "update_type": event.event_type}
+            UPDATE_DURATION.observe(elapsed, **labels)
+            UPDATE_DB_TIME.observe(timings.db_time, **labels)
+            UPDATE_API_TIME.observe(timings.api_time, **labels)
+            UPDATE_QUERIES.observe(timings.db_queries, **labels)
+            self._check_queries(timings, event, elapsed)
+
+    def _check_queries(self, timings: UpdateTimings, event: Update, elapsed: float) -> None:
+        over_budget = 0 < self.query_budget < timings.db_queries
+        if over_budget:
+            UPDATE_OVER_BUDGET.inc(handler=timings.handler, update_type=event.event_type)
+        if not self.debug:
+            return
+
+        logger.info(
+            "Update %s (%s): %d statements, db %.1f ms of %.1f ms",
+            event.update_id, timings.handler, timings.db_queries, timings.db_time * 1000, elapsed * 1000
+        )
+        repeated = timings.repeated_statements()
+        if over_budget or repeated:
+            details = "".join(f"\n  {count}x {' '.join(statement.split())}" for statement, count in repeated)
+            logger.warning(
+                "Update %s (%s) executed %d statements (budget %d)%s",
+                event.update_id, timings.handler, timings.db_queries, self.query_budget,
+                f", repeated:{details}" if repeated else ""
+            )
+
+class HandlerLabelMiddleware(BaseMiddleware):
+    """Inner middleware: name the update after the handler that matched it"""
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any]
+    ) -> Any:
+        timings = current_update.get()
+        if timings is not None:
+            callback = data["handler"].callback
+            timings.handler = f"{callback.__module__}.{callback.__name__}"
+        return await handler(event, data)
+
+class ApiMetricsMiddleware(BaseRequestMiddleware):
+    """Bot session middleware: time every Bot API request"""
+
+    async def __call__(
+        self,
+        make_request: NextRequestMiddlewareType[TelegramType],
+        bot: Bot,
+        method: TelegramMethod[TelegramType]
+    ) -> Response[TelegramType]:
+        started = time.perf_counter()
+        error = None
+        try:
+            return await make_request(bot, method)
+        except Exception as e:
+            error = type(e).__name__
+            raise
+        finally:
+            record_api_request(method.__api_method__, time.perf_counter() - started, error)
+
+def setup_metrics(dp: Dispatcher, bot: Bot) -> None:
+    """Install the metrics middlewares on the dispatcher and the bot session"""
+    dp.update.outer_middleware(UpdateMetricsMiddleware())
+    label = HandlerLabelMiddleware()
+    # Inner middlewares of the dispatcher also run for handlers of included routers
+    for name, observer in dp.observers.items():
+        if name not in ("update", "error"):
+            observer.middleware(label)
+    bot.session.middleware(ApiMetricsMiddleware())
@@ -0,0 +1,64 @@
+"""
+Outbound rate limiting middleware.
+
+SendQueueMiddleware is a Bot session middleware, so every request a handler
+makes (answer, answer_photo, edit_text, delete, ...) passes through it. Requests
+that target a chat wait for a token in utils.send_queue.SendScheduler at the
+priority of the current context, and requests answered with 429 Too Many
+Requests are retried after the requested pause, up to SEND_MAX_RETRIES times.
+
+Use setup_send_queue to install it.
+"""
+import logging
+
+from aiogram import Bot
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware, NextRequestMiddlewareType
+from aiogram.exceptions import TelegramRetryAfter
+from aiogram.methods import Response, TelegramMethod
+from aiogram.methods.base import TelegramType
+
+from config import SEND_CHAT_BURST, SEND_CHAT_RATE, SEND_GLOBAL_RATE, SEND_MAX_RETRIES
+from utils.metrics import SEND_RETRY_AFTER
+from utils.send_queue import SendScheduler, send_priority
+
+logger = logging.getLogger(__name__)
+
+class SendQueueMiddleware(BaseRequestMiddleware):
+    """Bot session middleware: rate limit chat-bound requests and retry them on RetryAfter"""
+
+    def __init__(self, scheduler: SendScheduler, max_retries: int = SEND_MAX_RETRIES):
+        self.scheduler = scheduler
+        self.max_retries = max_retries
+
+    async def __call__(
+        self,
+        make_request: NextRequestMiddlewareType[TelegramType],
+        bot: Bot,
+        method: TelegramMethod[TelegramType]
+    ) -> Response[TelegramType]:
+        chat_id = getattr(method, "chat_id", None)
+        if chat_id is None:
+            return await make_request(bot, method)
+
+        priority = send_priority.get()
+        attempt = 0
+        while True:
+            await self.scheduler.acquire(chat_id, priority)
+            try:
+                return await make_request(bot, method)
+            except TelegramRetryAfter as e:
+                SEND_RETRY_AFTER.inc(method=method.__api_method__)
+                self.scheduler.retry_after(chat_id, e.retry_after)
+                attempt += 1
+                if attempt > self.max_retries:
+                    raise
+                logger.warning(
+                    "%s to chat %s hit flood control, retrying in %s s (attempt %d of %d)",
+                    method.__api_method__, chat_id, e.retry_after, attempt, self.max_retries
+                )
+
+def setup_send_queue(bot: Bot) -> SendScheduler:
+    """Rate limit requests of bot; install before the metrics middleware so it times each attempt"""
+    scheduler = SendScheduler(SEND_GLOBAL_RATE, SEND_CHAT_RATE, SEND_CHAT_BURST)
+    bot.session.middleware(SendQueueMiddleware(scheduler))
+    return scheduler
@@ -0,0 +1,261 @@
+"""
+Broadcasts: announcements pushed to every user in the registry.
+
+A broadcast is a row in the broadcasts table; creating one only queues it.
+BroadcastEngine, started with the bot, claims queued broadcasts and streams
+recipients from bot_users in user_id order, BROADCAST_CHUNK_SIZE at a time.
+Each chunk is sent by a pool of BROADCAST_WORKERS concurrent senders at
+Priority.BULK, so the send queue (middlewares.send_queue) keeps them within
+Telegram's 30 messages per second and behind interactive replies.
+
+After every chunk the delivered/blocked/failed counters and last_user_id are
+committed as a checkpoint, so a restarted bot resumes where it stopped;
+recipients of a chunk interrupted by a crash may get the message twice.
+Users who blocked the bot are flagged and skipped by later broadcasts.
+
+The engine holds a lease on the broadcast it delivers and renews it with
+every checkpoint, so with several bot processes each broadcast is delivered
+by one of them; a stopped process releases its lease, a crashed one's
+expires after BROADCAST_LEASE seconds.
+"""
+import asyncio
+import logging
+import time
+from datetime import timedelta
+from typing import List, Optional
+
+from aiogram import Bot
+from aiogram.exceptions import TelegramAPIError, TelegramForbiddenError
+from sqlalchemy import func, or_, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from config import BROADCAST_CHUNK_SIZE, BROADCAST_LEASE, BROADCAST_POLL_INTERVAL, BROADCAST_WORKERS
+from utils.database import BotUser, Broadcast, async_session, db_session, utcnow
+from utils.metrics import BROADCAST_MESSAGES
+from utils.send_queue import Priority, send_priority
+from utils.unit_of_work import after_commit, finish
+from utils.user_registry import user_registry
+
+logger = logging.getLogger(__name__)
+
+DELIVERED, BLOCKED, FAILED = "delivered", "blocked", "failed"
+
+BROADCAST_COLUMNS = (
+    Broadcast.id, Broadcast.status, Broadcast.recipients, Broadcast.delivered, Broadcast.blocked,
+    Broadcast.failed, Broadcast.created_at, Broadcast.finished_at
+)
+
+async def count_recipients(session: Optional[AsyncSession] = None) -> int:
+    """Users a broadcast would be sent to"""
+    async with db_session(session) as session:
+        return await session.scalar(select(func.count()).select_from(BotUser).where(BotUser.blocked.is_(False)))
+
+async def create_broadcast(text: str, created_by: int, session: Optional[AsyncSession] = None) -> dict:
+    """Queue a broadcast of text (HTML) to all users, report to chat created_by when done"""
+    async with db_session(session) as session:
+        broadcast = Broadcast(text=text, created_by=created_by, recipients=await count_recipients(session))
+        session.add(broadcast)
+        await session.flush()
+        result = {"id": broadcast.id, "recipients": broadcast.recipients}
+        after_commit(session, broadcast_engine.wake)
+        await finish(session)
+        return result
+
+async def get_broadcasts(limit: int = 5, session: Optional[AsyncSession] = None) -> List[dict]:
+    """Most recent broadcasts with their progress"""
+    async with db_session(session) as session:
+        result = await session.execute(select(*BROADCAST_COLUMNS).order_by(Broadcast.id.desc()).limit(limit))
+        return [dict(row) for row in result.mappings()]
+
+def format_broadcast(broadcast: dict) -> str:
+    """One-line progress of a broadcast"""
+    handled = broadcast["delivered"] + broadcast["blocked"] + broadcast["failed"]
+    status = {"pending": "⏳ в очереди", "running": "📤 отправляется", "done": "✅ завершена"}[broadcast["status"]]
+    return (
+        f"#{broadcast['id']} {status}: {handled} из {broadcast['recipients']} — "
+        f"доставлено {broadcast['delivered']}, заблокировали бота {broadcast['blocked']}, "
+        f"ошибок {broadcast['failed']}"
+    )
+
+async def claim_broadcast(lease: float) -> Optional[dict]:
+    """Take the oldest unfinished broadcast nobody holds a lease on"""
+    async with async_session() as session:
+        now = utcnow()
+        free = or_(Broadcast.lease_until.is_(None), Broadcast.lease_until < now)
+        candidates = await session.scalars(
+            select(Broadcast.id).where(Broadcast.status != "done", free).order_by(Broadcast.id)
+        )
+        for broadcast_id in candidates.all():
+            # Another process may have claimed it since the SELECT
+            claimed = await session.execute(
+                update(Broadcast)
+                .where(Broadcast.id == broadcast_id, Broadcast.status != "done", free)
+                .values(status="running", lease_until=now + timedelta(seconds=lease))
+            )
+            if claimed.rowcount:
+                await session.commit()
+                result = await session.execute(select(Broadcast.__table__).where(Broadcast.id == broadcast_id))
+                return dict(result.mappings().one())
+        return None
+
+class BroadcastEngine:
+    """Deliver queued broadcasts in the background, one at a time"""
+
+    def __init__(
+        self,
+        workers: int = BROADCAST_WORKERS,
+        chunk_size: int = BROADCAST_CHUNK_SIZE,
+        lease: float = BROADCAST_LEASE,
+        poll_interval: float = BROADCAST_POLL_INTERVAL
+    ):
+        self.workers = workers
+        self.chunk_size = chunk_size
+        self.lease = lease
+        self.poll_interval = poll_interval
+        self._wakeup = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self, bot: Bot) -> None:
+        """Deliver queued broadcasts, including interrupted ones, until close()"""
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run(bot))
+
+    def wake(self) -> None:
+        """Look for queued broadcasts now rather than at the next poll"""
+        self._wakeup.set()
+
+    async def _run(self, bot: Bot) -> None:
+        send_priority.set(Priority.BULK)
+        while True:
+            self._wakeup.clear()
+            try:
+                broadcast = await claim_broadcast(self.lease)
+                if broadcast is not None:
+                    await self.deliver(bot, broadcast)
+                    continue
+            except Exception:
+                logger.exception("Broadcast delivery failed")
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.poll_interval)
+            except asyncio.TimeoutError:
+                pass
+
+    async def deliver(self, bot: Bot, broadcast: dict) -> dict:
+        """Send a claimed broadcast to the remaining recipients, return its final counters"""
+        started = time.perf_counter()
+        try:
+            while True:
+                async with async_session() as session:
+                    recipients = (await session.scalars(
+                        select(BotUser.user_id)
+                        .where(BotUser.blocked.is_(False), BotUser.user_id > broadcast["last_user_id"])
+                        .order_by(BotUser.user_id)
+                        .limit(self.chunk_size)
+                    )).all()
+                if not recipients:
+                    break
+                outcomes: List[Optional[str]] = [None] * len(recipients)
+                try:
+                    await self._send_chunk(bot, broadcast["text"], recipients, outcomes)
+                finally:
+                    # When interrupted, keep what was sent before the first unfinished recipient
+                    done = outcomes.index(None) if None in outcomes else len(outcomes)
+                    if done:
+                        await self._checkpoint(broadcast, recipients[:done], outcomes[:done])
+        except BaseException:
+            await self._release(broadcast)
+            raise
+
+        await self._finish(broadcast)
+        logger.info(
+            "Broadcast %s done in %.1f s: %s delivered, %s blocked, %s failed",
+            broadcast["id"], time.perf_counter() - started,
+            broadcast["delivered"], broadcast["blocked"], broadcast["failed"]
+        )
+        try:
+            await bot.send_message(
+                broadcast["created_by"], f"📣 Рассылка завершена\n\n{format_broadcast(broadcast)}"
+            )
+        except TelegramAPIError as e:
+            logger.warning("Could not report broadcast %s: %s", broadcast["id"], e)
+        return broadcast
+
+    async def _send_chunk(self, bot: Bot, text: str, recipients: List[int], outcomes: List[Optional[str]]) -> None:
+        queue = asyncio.Queue()
+        for index in range(len(recipients)):
+            queue.put_nowait(index)
+
+        async def worker():
+            while not queue.empty():
+                index = queue.get_nowait()
+                outcomes[index] = await self._send(bot, recipients[index], text)
+
+        await asyncio.gather(*(worker() for _ in range(min(self.workers, len(recipients)))))
+
+    async def _send(self, bot: Bot, user_id: int, text: str) -> str:
+        try:
+            await bot.send_message(user_id, text, parse_mode="HTML")
+            outcome = DELIVERED
+        except TelegramForbiddenError:
+            # Blocked the bot or deactivated the account
+            outcome = BLOCKED
+        except TelegramAPIError as e:
+            logger.warning("Broadcast message to %s failed: %s", user_id, e)
+            outcome = FAILED
+        BROADCAST_MESSAGES.inc(result=outcome)
+        return outcome
+
+    async def _checkpoint(self, broadcast: dict, recipients: List[int], outcomes: List[str]) -> None:
+        """Commit progress up to the last of recipients and renew the lease"""
+        counts = {outcome: outcomes.count(outcome) for outcome in (DELIVERED, BLOCKED, FAILED)}
+        blocked = [user_id for user_id, outcome in zip(recipients, outcomes) if outcome == BLOCKED]
+        async with async_session() as session:
+            if blocked:
+                await session.execute(update(BotUser).where(BotUser.user_id.in_(blocked)).values(blocked=True))
+            await session.execute(
+                update(Broadcast)
+                .where(Broadcast.id == broadcast["id"])
+                .values(
+                    last_user_id=recipients[-1],
+                    delivered=Broadcast.delivered + counts[DELIVERED],
+                    blocked=Broadcast.blocked + counts[BLOCKED],
+                    failed=Broadcast.failed + counts[FAILED],
+                    lease_until=utcnow() + timedelta(seconds=self.lease)
+                )
+            )
+            await session.commit()
+        broadcast["last_user_id"] = recipients[-1]
+        for outcome, count in counts.items():
+            broadcast[outcome] += count
+        for user_id in blocked:
+            user_registry.forget(user_id)
+
+    async def _finish(self, broadcast: dict) -> None:
+        async with async_session() as session:
+            await session.execute(
+                update(Broadcast)
+                .where(Broadcast.id == broadcast["id"])
+                .values(status="done", finished_at=utcnow(), lease_until=None)
+            )
+            await session.commit()
+        broadcast["status"] = "done"
+
+    async def _release(self, broadcast: dict) -> None:
+        """Let a restarted process resume the broadcast without waiting for the lease to expire"""
+        try:
+            async with async_session() as session:
+                await session.execute(update(Broadcast).where(Broadcast.id == broadcast["id"]).values(lease_until=None))
+                await session.commit()
+        except Exception:
+            logger.exception("Failed to release broadcast %s", broadcast["id"])
+
+    async def close(self) -> None:
+        """Stop after checkpointing what was sent"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+
+broadcast_engine = BroadcastEngine()
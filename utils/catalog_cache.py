@@ -0,0 +1,156 @@
+"""
+In-process catalog snapshot cache.
+
+The catalog (categories + products) changes a few times a day but is read on
+every catalog tap, so the read helpers in utils.database are served from a
+versioned in-memory snapshot. Every admin write bumps the version and drops
+the snapshot; the next read reloads it with a single database round trip.
+
+Writes of other processes (more workers, bulk_catalog.py) never reach this
+process's after-commit callbacks. Every catalog write also bumps a revision
+counter in the database, and the cache compares it with the revision it has
+loaded at most once per check interval, dropping its state when it moved.
+"""
+import asyncio
+import logging
+import time
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# (revision, categories, products); the revision is read before the rows
+CatalogLoader = Callable[[], Awaitable[Tuple[Optional[int], List[dict], List[dict]]]]
+RevisionLoader = Callable[[], Awaitable[Optional[int]]]
+
+
+class CatalogSnapshot:
+    """Read-only view of the catalog at a given version"""
+
+    __slots__ = ("version", "categories", "categories_by_id", "products", "products_by_id", "products_by_category")
+
+    def __init__(self, version: int, categories: List[dict], products: List[dict]):
+        self.version = version
+        self.categories = categories
+        self.categories_by_id: Dict[int, dict] = {cat["id"]: cat for cat in categories}
+        self.products = products
+        self.products_by_id: Dict[int, dict] = {prod["id"]: prod for prod in products}
+        self.products_by_category: Dict[int, List[dict]] = {cat["id"]: [] for cat in categories}
+        for prod in products:
+            self.products_by_category.setdefault(prod["category_id"], []).append(prod)
+
+
+class CatalogCache:
+    """Versioned catalog snapshot with lazy reload and hit/miss counters"""
+
+    def __init__(
+        self,
+        loader: CatalogLoader,
+        revision_loader: Optional[RevisionLoader] = None,
+        check_interval: float = 0.0,
+        on_remote_change: Optional[Callable[[], None]] = None
+    ):
+        self._loader = loader
+        self._revision_loader = revision_loader
+        self._check_interval = check_interval
+        self._on_remote_change = on_remote_change
+        self._snapshot: Optional[CatalogSnapshot] = None
+        self._version = 0
+        # Database revision the cached state reflects, None until first seen
+        self._revision: Optional[int] = None
+        self._checked_at: Optional[float] = None
+        self._lock = asyncio.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        self.remote_changes = 0
+
+    @property
+    def version(self) -> int:
+        """Current catalog version, bumped on every invalidation"""
+        return self._version
+
+    async def get(self) -> CatalogSnapshot:
+        """Return the current snapshot, loading it from the database if needed"""
+        await self.refresh()
+        snapshot = self._snapshot
+        if snapshot is not None:
+            self.hits += 1
+            return snapshot
+
+        async with self._lock:
+            # Another waiter may have loaded the snapshot while we were queued
+            snapshot = self._snapshot
+            if snapshot is not None:
+                self.hits += 1
+                return snapshot
+
+            self.misses += 1
+            version = self._version
+            revision, categories, products = await self._loader()
+            if self._advance(revision) and version + 1 == self._version:
+                # Only the state cached before this load was stale
+                version = self._version
+            snapshot = CatalogSnapshot(version, categories, products)
+            # A write that committed during the load makes this snapshot stale:
+            # serve it to this caller only and let the next read reload.
+            if version == self._version:
+                self._snapshot = snapshot
+                logger.info(
+                    "Catalog snapshot v%d loaded: %d categories, %d products",
+                    version, len(categories), len(products)
+                )
+            return snapshot
+
+    async def refresh(self) -> None:
+        """Drop cached state if another process changed the catalog, checking at most once per interval"""
+        if self._revision_loader is None:
+            return
+        now = time.monotonic()
+        if self._checked_at is not None and now - self._checked_at < self._check_interval:
+            return
+        self._checked_at = now
+        self._advance(await self._revision_loader())
+
+    def _advance(self, revision: Optional[int]) -> bool:
+        """Move to a database revision, return whether writes of other processes made the cache stale"""
+        if revision is None or (self._revision is not None and revision <= self._revision):
+            return False
+        stale = self._revision is not None
+        self._revision = revision
+        if stale:
+            logger.info("Catalog changed by another process, revision %d", revision)
+            self.remote_changes += 1
+            self.invalidate()
+            if self._on_remote_change is not None:
+                self._on_remote_change()
+        return stale
+
+    def committed(self, revision: int) -> None:
+        """Record the revision a catalog write of this process committed"""
+        if self._revision is not None and revision > self._revision + 1:
+            # Other processes wrote since the last check
+            self._advance(revision - 1)
+        if self._revision is None or revision > self._revision:
+            self._revision = revision
+
+    def peek(self) -> Optional[CatalogSnapshot]:
+        """Return the loaded snapshot without loading or counting a hit"""
+        return self._snapshot
+
+    def invalidate(self) -> None:
+        """Drop the snapshot after a catalog write"""
+        self._version += 1
+        self._snapshot = None
+        self.invalidations += 1
+
+    def stats(self) -> dict:
+        """Get cache counters"""
+        return {
+            "version": self._version,
+            "revision": self._revision,
+            "loaded": self._snapshot is not None,
+            "hits": self.hits,
+            "misses": self.misses,
+            "invalidations": self.invalidations,
+            "remote_changes": self.remote_changes,
+        }
@@ -0,0 +1,472 @@
+"""
+Bulk catalog import and export.
+
+Files are read incrementally: CSV row by row, JSON through a small streaming
+reader that yields array items one at a time, so a supplier price list with
+tens of thousands of rows never sits in memory as a whole. Parsing runs in a
+worker thread batch by batch, and every batch goes to the driver as one
+executemany of a single INSERT ... ON CONFLICT (id) DO UPDATE statement,
+compiled once for the whole import. Everything runs in one transaction; the
+catalog snapshot and the search index are dropped once it commits.
+
+Accepted formats:
+    JSON  {"categories": [{"id", "name"}], "products": [{"id", "name", ...}]},
+          either key optional (the files in data/ are valid imports), or a
+          bare array of products
+    CSV   one product per row with a header; columns id, name, description,
+          price, category_id, category (name), image_path. Delimiter ",", ";"
+          or tab is detected.
+
+Products are matched by id: rows with a known id are updated, rows without
+one are inserted. A category given by name is created when missing. Images
+are not touched on update; image_path is only used for new products and must
+name a file in the images directory (as exported), other rows are rejected.
+"""
+import asyncio
+import csv
+import json
+import os
+import time
+from itertools import islice
+from typing import Dict, Iterable, Iterator, List, Optional, TextIO, Tuple
+
+from sqlalchemy import select, text
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from config import CATALOG_IMPORT_BATCH_SIZE
+from utils.database import Category, Product, catalog_changed, db_session, dialect_insert
+from utils.image_storage import IMAGES_DIR, stored_image_path
+from utils.search_index import product_index
+from utils.unit_of_work import after_commit, finish
+
+FORMATS = ("json", "csv")
+CSV_COLUMNS = ("id", "name", "description", "price", "category_id", "category", "image_path")
+# Rejected rows reported back in detail; the rest are only counted
+MAX_REPORTED_ERRORS = 10
+
+class CatalogImportError(ValueError):
+    """The file cannot be imported at all"""
+
+def detect_format(path: str) -> str:
+    """File format by extension"""
+    extension = os.path.splitext(path)[1].lower().lstrip(".")
+    if extension not in FORMATS:
+        raise CatalogImportError(f"Неизвестный формат файла «{extension}», ожидается JSON или CSV")
+    return extension
+
+# Streaming JSON
+class _JsonReader:
+    """Pull parser over a text stream for the structural parts of a JSON document"""
+
+    def __init__(self, stream: TextIO, chunk_size: int = 65536):
+        self._stream = stream
+        self._chunk_size = chunk_size
+        self._buffer = ""
+        self._pos = 0
+        self._eof = False
+        self._decoder = json.JSONDecoder()
+
+    def _fill(self) -> bool:
+        if self._eof:
+            return False
+        chunk = self._stream.read(self._chunk_size)
+        if not chunk:
+            self._eof = True
+            return False
+        self._buffer = self._buffer[self._pos:] + chunk
+        self._pos = 0
+        return True
+
+    def peek(self) -> str:
+        """Next non-whitespace character, "" at the end of input"""
+        while True:
+            while self._pos < len(self._buffer) and self._buffer[self._pos] in " \t\r\n":
+                self._pos += 1
+            if self._pos < len(self._buffer):
+                return self._buffer[self._pos]
+            if not self._fill():
+                return ""
+
+    def expect(self, char: str) -> None:
+        found = self.peek()
+        if found != char:
+            raise CatalogImportError(f"Ошибка JSON: ожидался «{char}», найдено «{found or 'конец файла'}»")
+        self._pos += 1
+
+    def value(self):
+        """Decode the next complete value, reading more input until it fits"""
+        self.peek()
+        while True:
+            try:
+                value, end = self._decoder.raw_decode(self._buffer, self._pos)
+            except json.JSONDecodeError as e:
+                if not self._fill():
+                    raise CatalogImportError(f"Ошибка JSON: {e.msg}") from e
+                continue
+            # A number ending exactly at the chunk boundary may continue in the next one
+            if end == len(self._buffer) and self._fill():
+                continue
+            self._pos = end
+            return value
+
+def _seek_key(reader: _JsonReader, key: str) -> bool:
+    """Advance to the value of key in the top-level object"""
+    reader.expect("{")
+    if reader.peek() == "}":
+        return False
+    while True:
+        name = reader.value()
+        reader.expect(":")
+        if name == key:
+            return True
+        reader.value()
+        if reader.peek() != ",":
+            reader.expect("}")
+            return False
+        reader.expect(",")
+
+def iter_json_array(stream: TextIO, key: Optional[str] = None, chunk_size: int = 65536) -> Iterator:
+    """Yield the items of a JSON array one by one
+
+    The array is the document itself, or the value of key in the top-level
+    object (nothing is yielded when the key is missing).
+    """
+    reader = _JsonReader(stream, chunk_size)
+    if key is not None and not _seek_key(reader, key):
+        return
+    reader.expect("[")
+    if reader.peek() == "]":
+        return
+    while True:
+        yield reader.value()
+        if reader.peek() != ",":
+            reader.expect("]")
+            return
+        reader.expect(",")
+
+def _json_sections(path: str) -> Tuple[Iterator, Iterator]:
+    """Category and product records of a JSON import file"""
+    def records(key: Optional[str]) -> Iterator:
+        with open(path, encoding="utf-8-sig") as f:
+            yield from iter_json_array(f, key)
+
+    with open(path, encoding="utf-8-sig") as f:
+        first = _JsonReader(f).peek()
+    if first == "[":
+        return iter(()), records(None)
+    if first != "{":
+        raise CatalogImportError("Ошибка JSON: ожидается объект или массив товаров")
+    return records("categories"), records("products")
+
+# CSV
+def _csv_records(path: str) -> Iterator[dict]:
+    with open(path, encoding="utf-8-sig", newline="") as f:
+        sample = f.read(4096)
+        f.seek(0)
+        try:
+            dialect = csv.Sniffer().sniff(sample, delimiters=",;\t")
+        except csv.Error:
+            dialect = csv.excel
+        reader = csv.DictReader(f, dialect=dialect)
+        if not reader.fieldnames:
+            raise CatalogImportError("В CSV нет строки заголовка")
+        reader.fieldnames = [name.strip().lower() for name in reader.fieldnames]
+        for row in reader:
+            yield {key: value for key, value in row.items() if key and value not in (None, "")}
+
+def product_records(path: str, file_format: Optional[str] = None) -> Iterator[dict]:
+    """Product records of an import file, read lazily"""
+    file_format = file_format or detect_format(path)
+    if file_format == "json":
+        return _json_sections(path)[1]
+    return _csv_records(path)
+
+# Row validation
+def parse_optional_int(value, field: str) -> Optional[int]:
+    """Positive integer, None for an empty value"""
+    if value in (None, ""):
+        return None
+    try:
+        number = int(value)
+    except (TypeError, ValueError):
+        raise ValueError(f"{field}: не целое число «{value}»")
+    if number <= 0:
+        raise ValueError(f"{field}: должно быть больше нуля")
+    return number
+
+def _text(value, field: str, max_length: int, required: bool = True) -> str:
+    value = "" if value is None else str(value).strip()
+    if required and not value:
+        raise ValueError(f"{field}: пустое значение")
+    if len(value) > max_length:
+        raise ValueError(f"{field}: длиннее {max_length} символов")
+    return value
+
+def parse_price(value) -> float:
+    """Price from a number or a string such as "1 299,50" """
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        price = float(value)
+    else:
+        try:
+            price = float(str(value).replace(" ", "").replace("\u00a0", "").replace(",", "."))
+        except ValueError:
+            raise ValueError(f"price: не число «{value}»")
+    if price <= 0:
+        raise ValueError("price: должна быть больше нуля")
+    return price
+
+def _image_path(value) -> Optional[str]:
+    image_path = _text(value, "image_path", 255, required=False)
+    if not image_path:
+        return None
+    # Products may only reference the image store: the file is sent to Telegram and deleted with the product
+    stored = stored_image_path(image_path)
+    if stored is None:
+        raise ValueError(f"image_path: «{image_path}» не в каталоге {IMAGES_DIR}/")
+    return stored
+
+def _category_row(record) -> dict:
+    if not isinstance(record, dict):
+        raise ValueError("ожидается объект")
+    row = {"name": _text(record.get("name"), "name", 255)}
+    category_id = parse_optional_int(record.get("id"), "id")
+    if category_id is not None:
+        row["id"] = category_id
+    return row
+
+def _product_row(record) -> dict:
+    """Validated product columns; the category is kept as given (id or name)"""
+    if not isinstance(record, dict):
+        raise ValueError("ожидается объект")
+    row = {
+        "name": _text(record.get("name"), "name", 255),
+        "description": _text(record.get("description"), "description", 1000, required=False),
+        "price": parse_price(record.get("price")),
+        "category_id": parse_optional_int(record.get("category_id"), "category_id"),
+        "category": _text(record.get("category"), "category", 255, required=False),
+        "image_path": _image_path(record.get("image_path"))
+    }
+    if row["category_id"] is None and not row["category"]:
+        raise ValueError("не указана категория (category_id или category)")
+    product_id = parse_optional_int(record.get("id"), "id")
+    if product_id is not None:
+        row["id"] = product_id
+    return row
+
+def parse_batch(records: Iterator, parse, size: int, errors: List[str], counters: dict) -> List[dict]:
+    """Next batch of valid rows; runs in a worker thread"""
+    batch = []
+    for record in islice(records, size):
+        counters["read"] += 1
+        try:
+            batch.append(parse(record))
+        except ValueError as e:
+            counters["skipped"] += 1
+            if len(errors) < MAX_REPORTED_ERRORS:
+                errors.append(f"запись {counters['read']}: {e}")
+    return batch
+
+# Writing
+def _insert(session: AsyncSession, table):
+    try:
+        return dialect_insert(session, table)
+    except NotImplementedError:
+        raise CatalogImportError(f"Импорт не поддерживает базу данных {session.bind.dialect.name}") from None
+
+async def upsert(session: AsyncSession, table, rows: List[dict], columns: Iterable[str]) -> None:
+    """Insert rows without id, upsert rows with one, each group in one executemany"""
+    # The same id twice in one ON CONFLICT batch is an error in Postgres; the last one wins
+    with_id = list({row["id"]: row for row in rows if "id" in row}.values())
+    without_id = [row for row in rows if "id" not in row]
+    if with_id:
+        stmt = _insert(session, table)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[table.c.id],
+            set_={column: stmt.excluded[column] for column in columns}
+        )
+        await session.execute(stmt, with_id)
+    if without_id:
+        await session.execute(_insert(session, table), without_id)
+
+async def _sync_sequences(session: AsyncSession) -> None:
+    """Move Postgres id sequences past ids written explicitly"""
+    if session.bind.dialect.name != "postgresql":
+        return
+    for table in ("categories", "products"):
+        await session.execute(text(
+            f"SELECT setval(pg_get_serial_sequence('{table}', 'id'), "
+            f"COALESCE((SELECT MAX(id) FROM {table}), 0) + 1, false)"
+        ))
+
+class _Categories:
+    """Category ids known to the import, creating categories referenced by name"""
+
+    def __init__(self, session: AsyncSession, rows: Iterable[Tuple[int, str]]):
+        self._session = session
+        self.ids = set()
+        self.by_name: Dict[str, int] = {}
+        self.created = 0
+        for category_id, name in rows:
+            self.add(category_id, name)
+
+    def add(self, category_id: int, name: str) -> None:
+        self.ids.add(category_id)
+        self.by_name.setdefault(name.strip().lower(), category_id)
+
+    async def resolve(self, row: dict) -> int:
+        if row["category_id"] is not None:
+            if row["category_id"] not in self.ids:
+                raise ValueError(f"категория {row['category_id']} не найдена")
+            return row["category_id"]
+        key = row["category"].lower()
+        if key not in self.by_name:
+            category_id = await self._session.scalar(
+                _insert(self._session, Category.__table__).values(name=row["category"]).returning(Category.id)
+            )
+            self.add(category_id, row["category"])
+            self.created += 1
+        return self.by_name[key]
+
+async def _import_categories(session, records, categories: _Categories, batch_size, errors, counters) -> int:
+    imported = 0
+    while True:
+        batch = await asyncio.to_thread(parse_batch, records, _category_row, batch_size, errors, counters)
+        if not batch:
+            return imported
+        await upsert(session, Category.__table__, batch, ("name",))
+        # Rows without an id get theirs from the database; look them up by name once
+        for row in batch:
+            if "id" in row:
+                categories.add(row["id"], row["name"])
+        names = [row["name"] for row in batch if "id" not in row]
+        if names:
+            result = await session.execute(select(Category.id, Category.name).where(Category.name.in_(names)))
+            for category_id, name in result:
+                categories.add(category_id, name)
+        imported += len(batch)
+
+async def _import_products(session, records, categories: _Categories, batch_size, errors, counters) -> int:
+    imported = 0
+    while True:
+        batch = await asyncio.to_thread(parse_batch, records, _product_row, batch_size, errors, counters)
+        if not batch:
+            return imported
+        rows = []
+        for row in batch:
+            try:
+                row["category_id"] = await categories.resolve(row)
+            except ValueError as e:
+                counters["skipped"] += 1
+                if len(errors) < MAX_REPORTED_ERRORS:
+                    errors.append(f"товар «{row['name']}»: {e}")
+                continue
+            del row["category"]
+            rows.append(row)
+        if rows:
+            await upsert(session, Product.__table__, rows, ("name", "description", "price", "category_id"))
+            imported += len(rows)
+
+def _catalog_imported() -> None:
+    # Thousands of rows changed at once: rebuild the search index lazily instead of patching it
+    product_index.reset()
+
+async def import_catalog(
+    path: str,
+    file_format: Optional[str] = None,
+    batch_size: int = CATALOG_IMPORT_BATCH_SIZE,
+    session: Optional[AsyncSession] = None
+) -> dict:
+    """Import categories and products from a JSON or CSV file in one transaction, return a report"""
+    file_format = file_format or detect_format(path)
+    started = time.perf_counter()
+    errors: List[str] = []
+    counters = {"read": 0, "skipped": 0}
+
+    if file_format == "json":
+        category_records, records = await asyncio.to_thread(_json_sections, path)
+    else:
+        category_records, records = iter(()), _csv_records(path)
+
+    async with db_session(session) as session:
+        result = await session.execute(select(Category.id, Category.name))
+        categories = _Categories(session, result.all())
+        imported_categories = await _import_categories(
+            session, category_records, categories, batch_size, errors, counters
+        )
+        imported_products = await _import_products(
+            session, records, categories, batch_size, errors, counters
+        )
+        await _sync_sequences(session)
+        await catalog_changed(session)
+        after_commit(session, _catalog_imported)
+        await finish(session)
+
+    seconds = time.perf_counter() - started
+    return {
+        "categories": imported_categories,
+        "categories_created": categories.created,
+        "products": imported_products,
+        "read": counters["read"],
+        "skipped": counters["skipped"],
+        "errors": errors,
+        "seconds": seconds,
+        "rows_per_second": counters["read"] / seconds if seconds else 0.0
+    }
+
+# Export
+async def _write(f: TextIO, chunk: str) -> None:
+    await asyncio.to_thread(f.write, chunk)
+
+async def export_catalog(
+    path: str,
+    file_format: Optional[str] = None,
+    batch_size: int = CATALOG_IMPORT_BATCH_SIZE,
+    session: Optional[AsyncSession] = None
+) -> dict:
+    """Stream the catalog into a JSON or CSV file that import_catalog accepts, return a report"""
+    file_format = file_format or detect_format(path)
+    started = time.perf_counter()
+    exported = 0
+    columns = (Product.id, Product.name, Product.description, Product.price, Product.category_id, Product.image_path)
+
+    async with db_session(session) as session:
+        result = await session.execute(select(Category.id, Category.name).order_by(Category.id))
+        categories = result.all()
+        category_names = dict(categories)
+        stream = await session.stream(
+            select(*columns).order_by(Product.id).execution_options(yield_per=batch_size)
+        )
+        f = await asyncio.to_thread(open, path, "w", encoding="utf-8", newline="")
+        try:
+            if file_format == "json":
+                header = json.dumps(
+                    {"categories": [{"id": category_id, "name": name} for category_id, name in categories]},
+                    ensure_ascii=False
+                )
+                await _write(f, header[:-1] + ', "products": [')
+            else:
+                writer = csv.writer(f)
+                await asyncio.to_thread(writer.writerow, CSV_COLUMNS)
+            async for partition in stream.mappings().partitions():
+                if file_format == "json":
+                    chunk = ",\n".join(json.dumps(dict(row), ensure_ascii=False) for row in partition)
+                    await _write(f, ("\n" if not exported else ",\n") + chunk)
+                else:
+                    await asyncio.to_thread(writer.writerows, [
+                        (row["id"], row["name"], row["description"], row["price"], row["category_id"],
+                         category_names.get(row["category_id"], ""), row["image_path"] or "")
+                        for row in partition
+                    ])
+                exported += len(partition)
+            if file_format == "json":
+                await _write(f, "\n]}\n")
+        finally:
+            await asyncio.to_thread(f.close)
+
+    seconds = time.perf_counter() - started
+    return {
+        "categories": len(categories),
+        "products": exported,
+        "seconds": seconds,
+        "rows_per_second": exported / seconds if seconds else 0.0
+    }
@@ -1,8 +1,25 @@
 import os
-from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine, async_sessionmaker
+import time
+from datetime import datetime, timezone
+from functools import partial
+from bisect import bisect_left, bisect_right
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession, create_async_engine, async_sessionmaker
 from sqlalchemy.orm import DeclarativeBase, Mapped, mapped_column, relationship
-from sqlalchemy import Integer, String, Float, ForeignKey, select
-from typing import List, Optional
+from sqlalchemy import BigInteger, Boolean, DateTime, Integer, String, Text, Float, ForeignKey, Index, delete, false, func, select, update
+from sqlalchemy.dialects import postgresql, sqlite
+from typing import Iterable, List, Optional, Tuple
+
+from config import (
+    CATALOG_CACHE_CHECK_INTERVAL, CATALOG_CACHE_ENABLED, CATALOG_PAGE_SIZE, DB_POOL_SIZE, DB_MAX_OVERFLOW, DB_POOL_TIMEOUT,
+    DB_POOL_PRE_PING, DB_POOL_RECYCLE, DB_STATEMENT_CACHE_SIZE, IMAGE_GC_GRACE
+)
+from utils.catalog_cache import CatalogCache, CatalogSnapshot
+from utils.db_pool import InstrumentedQueuePool
+from utils.image_storage import image_store
+from utils.metrics import instrument_engine
+from utils.migrations import run_migrations
+from utils.unit_of_work import after_commit, current_session, finish, pending_after_commit, session_scope
+from utils.search_index import product_index
 
 # Database configuration  
 DATABASE_URL = os.getenv("DATABASE_URL", "")
@@ -11,13 +28,29 @@ if "?sslmode=" in DATABASE_URL:
     DATABASE_URL = DATABASE_URL.split("?sslmode=")[0]
 DATABASE_URL = DATABASE_URL.replace("postgresql://", "postgresql+asyncpg://")
 
-# Create async engine with proper connection pool settings
-engine = create_async_engine(
-    DATABASE_URL, 
-    echo=False,
-    pool_pre_ping=True,
-    pool_recycle=300
-)
+def create_database_engine(**overrides) -> AsyncEngine:
+    """Create async engine with pool settings from config, overridable per call"""
+    options = {
+        "echo": False,
+        "poolclass": InstrumentedQueuePool,
+        "pool_size": DB_POOL_SIZE,
+        "max_overflow": DB_MAX_OVERFLOW,
+        "pool_timeout": DB_POOL_TIMEOUT,
+        "pool_pre_ping": DB_POOL_PRE_PING,
+        "pool_recycle": DB_POOL_RECYCLE,
+    }
+    statement_cache_size = overrides.pop("statement_cache_size", DB_STATEMENT_CACHE_SIZE)
+    if DATABASE_URL.startswith("postgresql+asyncpg"):
+        options["connect_args"] = {
+            "statement_cache_size": statement_cache_size,
+            "prepared_statement_cache_size": statement_cache_size
+        }
+    options.update(overrides)
+    db_engine = create_async_engine(DATABASE_URL, **options)
+    instrument_engine(db_engine)
+    return db_engine
+
+engine = create_database_engine()
 async_session = async_sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
 
 class Base(DeclarativeBase):
@@ -27,13 +60,19 @@ class Category(Base):
     __tablename__ = "categories"
     
     id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True)
-    name: Mapped[str] = mapped_column(String(255), nullable=False)
+    name: Mapped[str] = mapped_column(String(255), nullable=False, index=True)
     
     # Relationship
     products: Mapped[List["Product"]] = relationship("Product", back_populates="category", cascade="all, delete-orphan")
 
 class Product(Base):
     __tablename__ = "products"
+    __table_args__ = (
+        # Category filtering and keyset pagination (WHERE category_id = ? AND id > ? ORDER BY id)
+        Index("ix_products_category_id_id", "category_id", "id"),
+        # Reference counting of shared image files
+        Index("ix_products_image_path", "image_path"),
+    )
     
     id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True)
     name: Mapped[str] = mapped_column(String(255), nullable=False)
@@ -41,155 +80,515 @@ class Product(Base):
     price: Mapped[float] = mapped_column(Float, nullable=False)
     category_id: Mapped[int] = mapped_column(Integer, ForeignKey("categories.id"), nullable=False)
     image_path: Mapped[Optional[str]] = mapped_column(String(255), nullable=True)
+    # Resized variants rendered at upload time; NULL means send the original
+    display_image_path: Mapped[Optional[str]] = mapped_column(String(255), nullable=True)
+    thumb_image_path: Mapped[Optional[str]] = mapped_column(String(255), nullable=True)
     # Relationship
     category: Mapped["Category"] = relationship("Category", back_populates="products")
 
+class TelegramFile(Base):
+    """Telegram file_id of an already uploaded image, so it is never uploaded twice"""
+    __tablename__ = "telegram_files"
+
+    image_path: Mapped[str] = mapped_column(String(255), primary_key=True)
+    file_id: Mapped[str] = mapped_column(String(255), nullable=False)
+
+class CatalogRevision(Base):
+    """Single row counting catalog writes, so every process notices the writes of the others"""
+    __tablename__ = "catalog_revision"
+
+    id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=False)
+    revision: Mapped[int] = mapped_column(BigInteger, nullable=False, default=0)
+
+def utcnow() -> datetime:
+    return datetime.now(timezone.utc)
+
+class BotUser(Base):
+    """User who started the bot, a broadcast recipient (see utils/user_registry.py)"""
+    __tablename__ = "bot_users"
+
+    user_id: Mapped[int] = mapped_column(BigInteger, primary_key=True, autoincrement=False)
+    started_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), nullable=False, default=utcnow)
+    # Set when a broadcast finds the bot blocked; cleared by the next /start
+    blocked: Mapped[bool] = mapped_column(Boolean, nullable=False, default=False, server_default=false())
+
+class Broadcast(Base):
+    """Announcement sent to every user, with its delivery checkpoint (see utils/broadcast.py)"""
+    __tablename__ = "broadcasts"
+
+    id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True)
+    # HTML; may be longer than the 4096 characters Telegram counts after parsing
+    text: Mapped[str] = mapped_column(Text, nullable=False)
+    # pending, running or done
+    status: Mapped[str] = mapped_column(String(16), nullable=False, default="pending", index=True)
+    # Chat the final report goes to
+    created_by: Mapped[int] = mapped_column(BigInteger, nullable=False)
+    recipients: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+    # Every recipient up to this user_id has been handled
+    last_user_id: Mapped[int] = mapped_column(BigInteger, nullable=False, default=0)
+    delivered: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+    blocked: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+    failed: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+    created_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), nullable=False, default=utcnow)
+    finished_at: Mapped[Optional[datetime]] = mapped_column(DateTime(timezone=True), nullable=True)
+    # The process delivering it holds it until then; an expired lease is taken over
+    lease_until: Mapped[Optional[datetime]] = mapped_column(DateTime(timezone=True), nullable=True)
+
 async def init_database():
-    """Initialize database tables"""
+    """Initialize database tables and apply pending migrations"""
     async with engine.begin() as conn:
         await conn.run_sync(Base.metadata.create_all)
+        await run_migrations(conn)
 
 async def get_async_session():
     """Get async database session"""
     async with async_session() as session:
         yield session
 
+# Column projections for Core-level reads: rows come back as plain tuples or
+# mappings, without ORM entities, identity map bookkeeping or unused columns
+CATEGORY_COLUMNS = (Category.id, Category.name)
+PRODUCT_LIST_COLUMNS = (Product.id, Product.name, Product.price)
+PRODUCT_COLUMNS = (
+    Product.id,
+    Product.name,
+    Product.description,
+    Product.price,
+    Product.category_id,
+    Product.image_path,
+    Product.display_image_path,
+    Product.thumb_image_path,
+    TelegramFile.file_id.label("image_file_id")
+)
+
+def _select_products():
+    """Select full product rows together with the cached Telegram file_id of the sent photo"""
+    photo_path = func.coalesce(Product.display_image_path, Product.image_path)
+    return select(*PRODUCT_COLUMNS).outerjoin(TelegramFile, TelegramFile.image_path == photo_path)
+
+def product_photo_path(product: dict) -> Optional[str]:
+    """Path of the file sent as the product photo: the display variant if rendered"""
+    return product.get("display_image_path") or product.get("image_path")
+
+async def _load_catalog() -> Tuple[Optional[int], List[dict], List[dict]]:
+    """Load the whole catalog in one session for the snapshot cache"""
+    async with async_session() as session:
+        # Read first: rows committed after it make the next check reload, never the reverse
+        revision = await session.scalar(select(CatalogRevision.revision))
+        categories = await session.execute(select(*CATEGORY_COLUMNS).order_by(Category.id))
+        products = await session.execute(_select_products().order_by(Product.id))
+        return revision, [dict(row) for row in categories.mappings()], [dict(row) for row in products.mappings()]
+
+async def _load_catalog_revision() -> Optional[int]:
+    async with engine.connect() as conn:
+        return await conn.scalar(select(CatalogRevision.revision))
+
+catalog_cache = CatalogCache(
+    _load_catalog,
+    _load_catalog_revision,
+    CATALOG_CACHE_CHECK_INTERVAL,
+    # Another process changed products the index only learns about through this one's writes
+    on_remote_change=product_index.reset
+)
+
+def db_session(session: Optional[AsyncSession] = None):
+    """Session for one helper call, shared with the current update (see utils/unit_of_work.py)"""
+    return session_scope(async_session, session)
+
+def dialect_insert(session: AsyncSession, table):
+    """INSERT with ON CONFLICT support for the session's database"""
+    dialect = session.bind.dialect.name
+    if dialect == "postgresql":
+        return postgresql.insert(table)
+    if dialect == "sqlite":
+        return sqlite.insert(table)
+    raise NotImplementedError(f"ON CONFLICT is not supported by {dialect}")
+
+async def catalog_changed(session: AsyncSession) -> None:
+    """Bump the catalog revision in session's transaction, invalidate the snapshot once it commits"""
+    if catalog_pending(session):
+        return
+    revision = await session.scalar(
+        update(CatalogRevision).values(revision=CatalogRevision.revision + 1).returning(CatalogRevision.revision)
+    )
+    after_commit(session, catalog_cache.invalidate)
+    if revision is not None:
+        after_commit(session, partial(catalog_cache.committed, revision))
+
+def catalog_pending(session: Optional[AsyncSession] = None) -> bool:
+    """Whether catalog writes of the current update are still uncommitted"""
+    return pending_after_commit(session or current_session(), catalog_cache.invalidate)
+
+def _use_snapshot(session: Optional[AsyncSession]) -> bool:
+    # Uncommitted writes are only visible through the session that made them
+    return CATALOG_CACHE_ENABLED and not catalog_pending(session)
+
+def get_catalog_cache_stats() -> dict:
+    """Get catalog snapshot hit/miss counters"""
+    return catalog_cache.stats()
+
+def get_pool_stats(db_engine: Optional[AsyncEngine] = None) -> dict:
+    """Get connection pool usage and checkout wait metrics"""
+    pool = (db_engine or engine).pool
+    metrics = pool.metrics
+    return {
+        "size": pool.size(),
+        "checked_out": pool.checkedout(),
+        "overflow": max(pool.overflow(), 0),
+        "checkouts": metrics.checkouts,
+        "timeouts": metrics.timeouts,
+        "overflow_peak": metrics.overflow_peak,
+        "checked_out_peak": metrics.checked_out_peak,
+        "wait_avg_ms": metrics.wait_total / metrics.checkouts * 1000 if metrics.checkouts else 0.0,
+        "wait_p99_ms": metrics.wait_percentile(99) * 1000,
+        "wait_max_ms": metrics.wait_max * 1000
+    }
+
 # Category operations
-async def get_categories() -> List[dict]:
+async def get_categories(session: Optional[AsyncSession] = None) -> List[dict]:
     """Get all categories"""
-    async with async_session() as session:
-        result = await session.execute(select(Category))
-        categories = result.scalars().all()
-        return [{"id": cat.id, "name": cat.name} for cat in categories]
+    if _use_snapshot(session):
+        snapshot = await catalog_cache.get()
+        return [dict(cat) for cat in snapshot.categories]
+
+    async with db_session(session) as session:
+        result = await session.execute(select(*CATEGORY_COLUMNS))
+        return [dict(row) for row in result.mappings()]
 
-async def add_category(name: str) -> int:
+async def add_category(name: str, session: Optional[AsyncSession] = None) -> int:
     """Add new category"""
-    async with async_session() as session:
+    async with db_session(session) as session:
         category = Category(name=name)
         session.add(category)
-        await session.commit()
-        await session.refresh(category)
+        await catalog_changed(session)
+        await finish(session)
         return category.id
 
-async def delete_category(category_id: int) -> bool:
+async def delete_category(category_id: int, session: Optional[AsyncSession] = None) -> bool:
     """Delete category and all its products"""
-    async with async_session() as session:
+    async with db_session(session) as session:
         result = await session.execute(select(Category).where(Category.id == category_id))
         category = result.scalar_one_or_none()
         if category:
+            products = (await session.execute(
+                select(Product.id, Product.image_path).where(Product.category_id == category_id)
+            )).all()
             await session.delete(category)
-            await session.commit()
+            await catalog_changed(session)
+            after_commit(session, partial(
+                _products_removed,
+                [product_id for product_id, _ in products],
+                [image_path for _, image_path in products]
+            ))
+            await finish(session)
             return True
         return False
 
-async def update_category(category_id: int, new_name: str) -> bool:
+async def update_category(category_id: int, new_name: str, session: Optional[AsyncSession] = None) -> bool:
     """Update category name"""
-    async with async_session() as session:
+    async with db_session(session) as session:
         result = await session.execute(select(Category).where(Category.id == category_id))
         category = result.scalar_one_or_none()
         if category:
             category.name = new_name
-            await session.commit()
+            await catalog_changed(session)
+            await finish(session)
             return True
         return False
 
 # Product operations
-async def get_products() -> List[dict]:
+async def get_products(session: Optional[AsyncSession] = None) -> List[dict]:
     """Get all products"""
-    async with async_session() as session:
-        result = await session.execute(select(Product))
-        products = result.scalars().all()
-        return [
-            {
-                "id": prod.id,
-                "name": prod.name,
-                "description": prod.description,
-                "price": prod.price,
-                "category_id": prod.category_id,
-                "image_path": prod.image_path
-            }
-            for prod in products
-        ]
-
-async def get_products_by_category(category_id: int) -> List[dict]:
+    if _use_snapshot(session):
+        snapshot = await catalog_cache.get()
+        return [dict(prod) for prod in snapshot.products]
+
+    async with db_session(session) as session:
+        result = await session.execute(_select_products())
+        return [dict(row) for row in result.mappings()]
+
+async def get_products_by_category(category_id: int, session: Optional[AsyncSession] = None) -> List[dict]:
     """Get products by category"""
-    async with async_session() as session:
-        result = await session.execute(select(Product).where(Product.category_id == category_id))
-        products = result.scalars().all()
-        return [
-            {
-                "id": prod.id,
-                "name": prod.name,
-                "description": prod.description,
-                "price": prod.price,
-                "category_id": prod.category_id,
-                "image_path": prod.image_path
-            }
-            for prod in products
-        ]
-
-async def get_product(product_id: int) -> Optional[dict]:
-    """Get product by ID"""
-    async with async_session() as session:
-        result = await session.execute(select(Product).where(Product.id == product_id))
-        product = result.scalar_one_or_none()
-        if product:
-            return {
-                "id": product.id,
-                "name": product.name,
-                "description": product.description,
-                "price": product.price,
-                "category_id": product.category_id,
-                "image_path": product.image_path
-            }
+    if _use_snapshot(session):
+        snapshot = await catalog_cache.get()
+        return [dict(prod) for prod in snapshot.products_by_category.get(category_id, [])]
+
+    async with db_session(session) as session:
+        result = await session.execute(_select_products().where(Product.category_id == category_id))
+        return [dict(row) for row in result.mappings()]
+
+def _snapshot_page(
+    snapshot: CatalogSnapshot,
+    category_id: int,
+    after_id: Optional[int],
+    before_id: Optional[int],
+    limit: int
+) -> dict:
+    category_products = snapshot.products_by_category.get(category_id, [])
+    if after_id is not None:
+        start = bisect_right(category_products, after_id, key=lambda prod: prod["id"])
+        end = start + limit
+    elif before_id is not None:
+        end = bisect_left(category_products, before_id, key=lambda prod: prod["id"])
+        start = max(end - limit, 0)
+    else:
+        start, end = 0, limit
+    return {
+        "products": [dict(prod) for prod in category_products[start:end]],
+        "has_prev": start > 0,
+        "has_next": end < len(category_products)
+    }
+
+def _keyset(after_id: Optional[int], before_id: Optional[int]):
+    """Product id condition and ordering for a keyset page"""
+    if after_id is not None:
+        return Product.id > after_id, Product.id
+    if before_id is not None:
+        return Product.id < before_id, Product.id.desc()
+    return None, Product.id
+
+def _make_page(products: list, after_id: Optional[int], before_id: Optional[int], limit: int) -> dict:
+    """Build page dict from up to limit + 1 rows fetched in keyset order"""
+    has_more = len(products) > limit
+    products = products[:limit]
+    if before_id is not None:
+        products.reverse()
+        return {"products": products, "has_prev": has_more, "has_next": True}
+    return {"products": products, "has_prev": after_id is not None, "has_next": has_more}
+
+async def get_products_page(
+    category_id: int,
+    after_id: Optional[int] = None,
+    before_id: Optional[int] = None,
+    limit: int = CATALOG_PAGE_SIZE,
+    session: Optional[AsyncSession] = None
+) -> dict:
+    """Get one page of category products ordered by id (keyset pagination)
+
+    after_id returns the page following that product, before_id the page
+    preceding it, neither the first page. Result has "products", "has_prev"
+    and "has_next" keys. Products carry at least id, name and price; when
+    read from the database they are read-only row mappings of just those.
+    """
+    if _use_snapshot(session):
+        snapshot = await catalog_cache.get()
+        return _snapshot_page(snapshot, category_id, after_id, before_id, limit)
+
+    condition, order = _keyset(after_id, before_id)
+    query = select(*PRODUCT_LIST_COLUMNS).where(Product.category_id == category_id)
+    if condition is not None:
+        query = query.where(condition)
+
+    async with db_session(session) as session:
+        result = await session.execute(query.order_by(order).limit(limit + 1))
+        return _make_page(list(result.mappings()), after_id, before_id, limit)
+
+async def get_category_with_products(
+    category_id: int,
+    after_id: Optional[int] = None,
+    before_id: Optional[int] = None,
+    limit: int = CATALOG_PAGE_SIZE,
+    session: Optional[AsyncSession] = None
+) -> Optional[dict]:
+    """Get category together with one page of its products
+
+    Returns None if the category does not exist, otherwise a dict with the
+    category "id" and "name" plus the keys of get_products_page. From the
+    database this is one round trip: a single LEFT JOIN keyset query.
+    """
+    if _use_snapshot(session):
+        snapshot = await catalog_cache.get()
+        category = snapshot.categories_by_id.get(category_id)
+        if category is None:
+            return None
+        return {**category, **_snapshot_page(snapshot, category_id, after_id, before_id, limit)}
+
+    condition, order = _keyset(after_id, before_id)
+    join_condition = Product.category_id == Category.id
+    if condition is not None:
+        join_condition = join_condition & condition
+    query = (
+        select(Category.id.label("category_id"), Category.name.label("category_name"), *PRODUCT_LIST_COLUMNS)
+        .outerjoin(Product, join_condition)
+        .where(Category.id == category_id)
+        .order_by(order)
+        .limit(limit + 1)
+    )
+
+    async with db_session(session) as session:
+        rows = (await session.execute(query)).all()
+
+    if not rows:
         return None
+    products = [{"id": row.id, "name": row.name, "price": row.price} for row in rows if row.id is not None]
+    return {"id": rows[0].category_id, "name": rows[0].category_name, **_make_page(products, after_id, before_id, limit)}
+
+async def get_product(product_id: int, session: Optional[AsyncSession] = None) -> Optional[dict]:
+    """Get product by ID"""
+    if _use_snapshot(session):
+        snapshot = await catalog_cache.get()
+        product = snapshot.products_by_id.get(product_id)
+        return dict(product) if product else None
 
-async def add_product(name: str, description: str, price: float, category_id: int, image_path: Optional[str] = None) -> int:
+    async with db_session(session) as session:
+        result = await session.execute(_select_products().where(Product.id == product_id))
+        row = result.mappings().one_or_none()
+        return dict(row) if row else None
+
+async def add_product(
+    name: str,
+    description: str,
+    price: float,
+    category_id: int,
+    image_path: Optional[str] = None,
+    display_image_path: Optional[str] = None,
+    thumb_image_path: Optional[str] = None,
+    session: Optional[AsyncSession] = None
+) -> int:
     """Add new product"""
-    async with async_session() as session:
-        product = Product(name=name, description=description, price=price, category_id=category_id, image_path=image_path)
+    async with db_session(session) as session:
+        product = Product(
+            name=name,
+            description=description,
+            price=price,
+            category_id=category_id,
+            image_path=image_path,
+            display_image_path=display_image_path,
+            thumb_image_path=thumb_image_path
+        )
         session.add(product)
-        await session.commit()
-        await session.refresh(product)
+        await catalog_changed(session)
+        after_commit(session, partial(_index_product, product))
+        await finish(session)
         return product.id
 
-async def delete_product(product_id: int) -> bool:
+async def delete_product(product_id: int, session: Optional[AsyncSession] = None) -> bool:
     """Delete product"""
-    async with async_session() as session:
+    async with db_session(session) as session:
         result = await session.execute(select(Product).where(Product.id == product_id))
         product = result.scalar_one_or_none()
         if product:
             await session.delete(product)
-            await session.commit()
+            await catalog_changed(session)
+            after_commit(session, partial(_products_removed, [product_id], [product.image_path]))
+            await finish(session)
             return True
         return False
 
-async def update_product(product_id: int, name: str, description: str, price: float, image_path: Optional[str] = None) -> bool:
+async def update_product(
+    product_id: int,
+    name: str,
+    description: str,
+    price: float,
+    image_path: Optional[str] = None,
+    session: Optional[AsyncSession] = None
+) -> bool:
     """Update product"""
-    async with async_session() as session:
+    async with db_session(session) as session:
         result = await session.execute(select(Product).where(Product.id == product_id))
         product = result.scalar_one_or_none()
         if product:
+            await catalog_changed(session)
             product.name = name
             product.description = description
             product.price = price
             # Update image path if provided
-            if image_path is not None:
-                # Additional logic to delete the old image file if a new one is uploaded
-                if product.image_path and os.path.exists(product.image_path) and product.image_path != image_path:
-                    os.remove(product.image_path)
+            if image_path is not None and product.image_path != image_path:
+                old_image_path = product.image_path
                 product.image_path = image_path
-            await session.commit()
+                product.display_image_path = None
+                product.thumb_image_path = None
+                # The old image file goes away with its last reference
+                after_commit(session, partial(release_images, [old_image_path]))
+            after_commit(session, partial(_index_product, product))
+            await finish(session)
             return True
         return False
 
-async def update_product_image(product_id: int, image_path: Optional[str]) -> bool:
-    """Update product image only"""
-    async with async_session() as session:
+async def update_product_image(
+    product_id: int,
+    image_path: Optional[str],
+    display_image_path: Optional[str] = None,
+    thumb_image_path: Optional[str] = None,
+    session: Optional[AsyncSession] = None
+) -> bool:
+    """Update product image and its variants only"""
+    async with db_session(session) as session:
         result = await session.execute(select(Product).where(Product.id == product_id))
         product = result.scalar_one_or_none()
         if product:
+            old_image_path = product.image_path
             product.image_path = image_path
-            await session.commit()
+            product.display_image_path = display_image_path
+            product.thumb_image_path = thumb_image_path
+            await catalog_changed(session)
+            if old_image_path != image_path:
+                after_commit(session, partial(release_images, [old_image_path]))
+            await finish(session)
             return True
-        return False
\ No newline at end of file
+        return False
+
+def _index_product(product: Product) -> None:
+    product_index.add({
+        "id": product.id,
+        "name": product.name,
+        "description": product.description,
+        "price": product.price,
+        "category_id": product.category_id
+    })
+
+async def _products_removed(product_ids: List[int], image_paths: List[Optional[str]]) -> None:
+    for product_id in product_ids:
+        product_index.remove(product_id)
+    await release_images(image_paths)
+
+# Image reference counting
+async def release_images(image_paths: Iterable[Optional[str]]) -> List[str]:
+    """Delete image files no longer referenced by any product, return deleted paths
+
+    Identical uploads share one content-addressed file, so a product letting go
+    of its image only unlinks the file together with its last reference. A file
+    reused within IMAGE_GC_GRACE may belong to an upload whose product is not
+    committed yet; it is left to the garbage collector (utils/image_gc.py).
+    Runs in its own transaction; call it once the releasing write has committed.
+    """
+    paths = {path for path in image_paths if path}
+    if not paths:
+        return []
+
+    async with async_session() as session:
+        result = await session.execute(select(Product.image_path).where(Product.image_path.in_(paths)).distinct())
+        orphaned = paths.difference(result.scalars())
+
+        released = []
+        for path in sorted(orphaned):
+            # Checked right before unlinking: a concurrent upload refreshes the mtime
+            if await image_store.modified_since(path, time.time() - IMAGE_GC_GRACE):
+                continue
+            await image_store.delete(path)
+            await image_store.delete_variants(path)
+            released.append(path)
+
+        if released:
+            uploaded_paths = set(released)
+            for path in released:
+                uploaded_paths.update(image_store.variant_paths(path).values())
+            await session.execute(delete(TelegramFile).where(TelegramFile.image_path.in_(uploaded_paths)))
+            await session.commit()
+    return released
+
+# Telegram file_id operations
+async def set_image_file_id(image_path: str, file_id: str, session: Optional[AsyncSession] = None) -> None:
+    """Remember the Telegram file_id of an uploaded image"""
+    async with db_session(session) as session:
+        await session.merge(TelegramFile(image_path=image_path, file_id=file_id))
+        after_commit(session, partial(_patch_snapshot_file_id, image_path, file_id))
+        await finish(session)
+
+def _patch_snapshot_file_id(image_path: str, file_id: str) -> None:
+    # Write-through: the catalog itself did not change, so patch the snapshot in place
+    snapshot = catalog_cache.peek()
+    if snapshot is not None:
+        for prod in snapshot.products:
+            if product_photo_path(prod) == image_path:
+                prod["image_file_id"] = file_id
@@ -0,0 +1,84 @@
+"""
+Instrumented connection pool.
+
+InstrumentedQueuePool behaves like SQLAlchemy's AsyncAdaptedQueuePool but
+times every checkout, so waits for a free connection, timeouts and overflow
+usage are visible through PoolMetrics. Only the wait is counted: the time
+spent opening a new connection is subtracted, and the pre-ping runs after
+the checkout.
+"""
+import time
+from collections import deque
+from contextvars import ContextVar
+from typing import Deque, Dict
+
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+from sqlalchemy.pool import AsyncAdaptedQueuePool, ConnectionPoolEntry
+
+# Set while a checkout is in progress; QueuePool._do_get retries by calling itself
+_in_checkout: ContextVar[bool] = ContextVar("pool_in_checkout", default=False)
+
+
+class PoolMetrics:
+    """Checkout counters and recent wait times of one pool"""
+
+    def __init__(self, window: int = 10000):
+        self.checkouts = 0
+        self.timeouts = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+        self.overflow_peak = 0
+        self.checked_out_peak = 0
+        self.recent_waits: Deque[float] = deque(maxlen=window)
+
+    def record_checkout(self, wait: float, overflow: int, checked_out: int) -> None:
+        self.checkouts += 1
+        self.wait_total += wait
+        self.wait_max = max(self.wait_max, wait)
+        self.overflow_peak = max(self.overflow_peak, overflow)
+        self.checked_out_peak = max(self.checked_out_peak, checked_out)
+        self.recent_waits.append(wait)
+
+    def wait_percentile(self, percentile: float) -> float:
+        """Checkout wait in seconds at the given percentile of recent checkouts"""
+        if not self.recent_waits:
+            return 0.0
+        waits = sorted(self.recent_waits)
+        return waits[min(int(len(waits) * percentile / 100), len(waits) - 1)]
+
+
+class InstrumentedQueuePool(AsyncAdaptedQueuePool):
+    """AsyncAdaptedQueuePool that records checkout waits in self.metrics"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.metrics = PoolMetrics()
+        # Seconds spent connecting, by the new connection's record, until its checkout is recorded
+        self._connect_times: Dict[ConnectionPoolEntry, float] = {}
+
+    def recreate(self):
+        pool = super().recreate()
+        pool.metrics = self.metrics
+        return pool
+
+    def _create_connection(self):
+        started = time.perf_counter()
+        record = super()._create_connection()
+        self._connect_times[record] = time.perf_counter() - started
+        return record
+
+    def _do_get(self):
+        if _in_checkout.get():
+            return super()._do_get()
+        token = _in_checkout.set(True)
+        started = time.perf_counter()
+        try:
+            record = super()._do_get()
+        except PoolTimeoutError:
+            self.metrics.timeouts += 1
+            raise
+        finally:
+            _in_checkout.reset(token)
+        wait = time.perf_counter() - started - self._connect_times.pop(record, 0.0)
+        self.metrics.record_checkout(wait, max(self.overflow(), 0), self.checkedout())
+        return record
@@ -0,0 +1,201 @@
+"""
+FSM storage backends.
+
+create_fsm_storage() picks the backend from config: the in-process
+MemoryStorage, a disk-backed SQLiteStorage for single-node deployments or
+aiogram's RedisStorage for several bot workers sharing state. Both persistent
+backends expire abandoned flows after FSM_STATE_TTL seconds.
+"""
+import asyncio
+import json
+import logging
+import sqlite3
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Any, Dict, List, Mapping, Optional, Tuple
+
+from aiogram.fsm.state import State
+from aiogram.fsm.storage.base import BaseStorage, DefaultKeyBuilder, KeyBuilder, StateType, StorageKey
+from aiogram.fsm.storage.memory import MemoryStorage
+
+from config import FSM_STORAGE, FSM_SQLITE_PATH, FSM_STATE_TTL, FSM_FLUSH_INTERVAL, REDIS_URL
+
+logger = logging.getLogger(__name__)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS fsm (
+    key TEXT PRIMARY KEY,
+    state TEXT,
+    data TEXT NOT NULL DEFAULT '{}',
+    expires_at REAL
+);
+CREATE INDEX IF NOT EXISTS ix_fsm_expires_at ON fsm (expires_at);
+"""
+
+_UPSERT_STATE = """
+INSERT INTO fsm (key, state, expires_at) VALUES (?, ?, ?)
+ON CONFLICT (key) DO UPDATE SET state = excluded.state, expires_at = excluded.expires_at
+"""
+
+_UPSERT_DATA = """
+INSERT INTO fsm (key, data, expires_at) VALUES (?, ?, ?)
+ON CONFLICT (key) DO UPDATE SET data = excluded.data, expires_at = excluded.expires_at
+"""
+
+
+class SQLiteStorage(BaseStorage):
+    """
+    FSM storage in a local SQLite file.
+
+    Writes are buffered in memory and flushed in one transaction every
+    flush_interval seconds, so a multi-step admin flow costs a handful of
+    commits instead of one per state change. Reads see buffered writes.
+    All SQLite work runs on a single background thread.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        state_ttl: Optional[int] = None,
+        flush_interval: float = 0.05,
+        key_builder: Optional[KeyBuilder] = None
+    ):
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        self.state_ttl = state_ttl or None
+        self.flush_interval = flush_interval
+        self.key_builder = key_builder or DefaultKeyBuilder(with_bot_id=True, with_destiny=True)
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="fsm-sqlite")
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(_SCHEMA)
+        # key -> {"state": ..., "data": ...} with only the fields written since the last flush
+        self._pending: Dict[str, Dict[str, Any]] = {}
+        self._flushing: Dict[str, Dict[str, Any]] = {}
+        self._flush_task: Optional[asyncio.Task] = None
+        self._flush_lock = asyncio.Lock()
+        self._closed = False
+
+    async def _run(self, func, *args):
+        return await asyncio.get_running_loop().run_in_executor(self._executor, func, *args)
+
+    def _buffer(self, key: StorageKey, field: str, value: Any) -> None:
+        self._pending.setdefault(self.key_builder.build(key), {})[field] = value
+        self._schedule_flush()
+
+    def _schedule_flush(self) -> None:
+        # The running flush task schedules its successor once its write is done
+        if self._flush_task is None or self._flush_task.done() or self._flush_task is asyncio.current_task():
+            self._flush_task = asyncio.create_task(self._flush_later())
+
+    def _buffered(self, key: str, field: str) -> Tuple[bool, Any]:
+        for buffer in (self._pending, self._flushing):
+            fields = buffer.get(key)
+            if fields and field in fields:
+                return True, fields[field]
+        return False, None
+
+    async def _flush_later(self) -> None:
+        await asyncio.sleep(self.flush_interval)
+        await self.flush()
+
+    async def flush(self) -> None:
+        """Write buffered changes to disk in a single transaction"""
+        async with self._flush_lock:
+            if not self._pending:
+                return
+            self._flushing, self._pending = self._pending, {}
+            try:
+                await self._run(self._write, self._flushing)
+            except Exception:
+                logger.exception("Failed to flush %d FSM records", len(self._flushing))
+                # Keep the changes for the next flush unless they were overwritten meanwhile
+                for key, fields in self._flushing.items():
+                    for field, value in fields.items():
+                        self._pending.setdefault(key, {}).setdefault(field, value)
+            finally:
+                self._flushing = {}
+        # Written meanwhile, or put back after a failure: nothing else would schedule them
+        if self._pending and not self._closed:
+            self._schedule_flush()
+
+    def _write(self, changes: Dict[str, Dict[str, Any]]) -> None:
+        now = time.time()
+        expires_at = now + self.state_ttl if self.state_ttl else None
+        states: List[tuple] = []
+        datas: List[tuple] = []
+        for key, fields in changes.items():
+            if "state" in fields:
+                states.append((key, fields["state"], expires_at))
+            if "data" in fields:
+                datas.append((key, json.dumps(fields["data"], ensure_ascii=False), expires_at))
+
+        with self._conn:
+            self._conn.execute("BEGIN")
+            self._conn.executemany(_UPSERT_STATE, states)
+            self._conn.executemany(_UPSERT_DATA, datas)
+            # Finished flows and abandoned ones past their TTL
+            self._conn.execute("DELETE FROM fsm WHERE state IS NULL AND data = '{}'")
+            self._conn.execute("DELETE FROM fsm WHERE expires_at < ?", (now,))
+
+    def _read(self, key: str, column: str) -> Optional[str]:
+        row = self._conn.execute(
+            f"SELECT {column} FROM fsm WHERE key = ? AND (expires_at IS NULL OR expires_at >= ?)",
+            (key, time.time())
+        ).fetchone()
+        return row[0] if row else None
+
+    async def set_state(self, key: StorageKey, state: StateType = None) -> None:
+        self._buffer(key, "state", state.state if isinstance(state, State) else state)
+
+    async def get_state(self, key: StorageKey) -> Optional[str]:
+        storage_key = self.key_builder.build(key)
+        found, state = self._buffered(storage_key, "state")
+        if found:
+            return state
+        return await self._run(self._read, storage_key, "state")
+
+    async def set_data(self, key: StorageKey, data: Mapping[str, Any]) -> None:
+        if not isinstance(data, dict):
+            raise TypeError(f"Data must be a dict, got {type(data).__name__}")
+        self._buffer(key, "data", data.copy())
+
+    async def get_data(self, key: StorageKey) -> Dict[str, Any]:
+        storage_key = self.key_builder.build(key)
+        found, data = self._buffered(storage_key, "data")
+        if found:
+            return data.copy()
+        raw = await self._run(self._read, storage_key, "data")
+        return json.loads(raw) if raw else {}
+
+    async def close(self) -> None:
+        if self._closed:
+            return
+        self._closed = True
+        if self._flush_task is not None and not self._flush_task.done():
+            self._flush_task.cancel()
+        await self.flush()
+        await self._run(self._conn.close)
+        self._executor.shutdown(wait=True)
+
+
+def create_fsm_storage() -> BaseStorage:
+    """Create FSM storage backend selected by FSM_STORAGE"""
+    if FSM_STORAGE == "sqlite":
+        return SQLiteStorage(FSM_SQLITE_PATH, state_ttl=FSM_STATE_TTL, flush_interval=FSM_FLUSH_INTERVAL)
+
+    if FSM_STORAGE == "redis":
+        try:
+            from aiogram.fsm.storage.redis import RedisStorage
+        except ImportError as e:
+            raise RuntimeError("FSM_STORAGE=redis requires the 'redis' package: pip install redis") from e
+        return RedisStorage.from_url(
+            REDIS_URL,
+            key_builder=DefaultKeyBuilder(with_bot_id=True, with_destiny=True),
+            state_ttl=FSM_STATE_TTL or None,
+            data_ttl=FSM_STATE_TTL or None
+        )
+
+    if FSM_STORAGE != "memory":
+        logger.warning(f"Unknown FSM_STORAGE '{FSM_STORAGE}', using memory storage")
+    return MemoryStorage()
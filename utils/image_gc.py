@@ -0,0 +1,185 @@
+"""
+Orphaned image garbage collection.
+
+Reference counting in utils.database removes files as products let go of
+them, but files can still leak: uploads whose product was never saved, files
+released while still within the grace period, crashes between commit and
+unlink, or images written by older versions. The collector diffs the images
+directory against products.image_path and the variant columns, and deletes
+or quarantines what nothing references.
+
+Running next to live admin uploads is safe because:
+- only files older than the grace period are candidates, and the image store
+  refreshes the mtime of a file it reuses for a new upload;
+- references are streamed from the database after the directory scan, so a
+  product committed during the scan still protects its file;
+- each batch is re-checked against the database and re-stat'ed right before
+  files are touched.
+"""
+import asyncio
+import logging
+import os
+import time
+from typing import Dict, Iterable, List, Set
+
+from sqlalchemy import delete, or_, select
+
+from config import (
+    IMAGE_GC_BATCH_DELAY, IMAGE_GC_BATCH_SIZE, IMAGE_GC_GRACE, IMAGE_GC_INTERVAL, IMAGE_GC_MODE,
+    IMAGE_GC_QUARANTINE_TTL
+)
+from utils.database import Product, TelegramFile, async_session
+from utils.image_storage import ImageStore, image_store
+
+logger = logging.getLogger(__name__)
+
+_REFERENCE_COLUMNS = (Product.image_path, Product.display_image_path, Product.thumb_image_path)
+
+def _scan_candidates(store: ImageStore, older_than: float) -> Dict[str, int]:
+    """Stored files (and leftover temp files) not modified since older_than, with sizes"""
+    candidates = {}
+    for directory in (store.directory, store.variants_directory):
+        if not os.path.isdir(directory):
+            continue
+        for entry in os.scandir(directory):
+            if not entry.is_file():
+                continue
+            stat = entry.stat()
+            # Temp files of interrupted writes start with a dot and are never referenced
+            if stat.st_mtime < older_than:
+                candidates[os.path.join(directory, entry.name)] = stat.st_size
+    return candidates
+
+def _expired_quarantine(store: ImageStore, older_than: float) -> Dict[str, int]:
+    if not os.path.isdir(store.quarantine_directory):
+        return {}
+    return {
+        entry.path: entry.stat().st_size
+        for entry in os.scandir(store.quarantine_directory)
+        if entry.is_file() and entry.stat().st_ctime < older_than
+    }
+
+def _still_old(path: str, older_than: float) -> bool:
+    try:
+        return os.stat(path).st_mtime < older_than
+    except FileNotFoundError:
+        return False
+
+def _protected_paths(store: ImageStore, rows: Iterable) -> Set[str]:
+    """Paths kept alive by product rows: the images, their variants and recorded variant columns"""
+    protected = set()
+    for image_path, display_image_path, thumb_image_path in rows:
+        for path in (image_path, display_image_path, thumb_image_path):
+            if path:
+                protected.add(os.path.normpath(path))
+        if image_path:
+            protected.update(os.path.normpath(path) for path in store.variant_paths(image_path).values())
+    return protected
+
+def _originals(store: ImageStore, paths: Iterable[str]) -> Set[str]:
+    """File name stems of the originals behind paths, for variants and originals alike"""
+    names = set()
+    for path in paths:
+        stem = os.path.splitext(os.path.basename(path))[0]
+        if os.path.dirname(path) == os.path.normpath(store.variants_directory):
+            stem = stem.rsplit("_", 1)[0]
+        names.add(stem)
+    return names
+
+async def _referenced(store: ImageStore, candidates: Set[str]) -> Set[str]:
+    """Stream every product reference and return the candidates it protects"""
+    protected: Set[str] = set()
+    async with async_session() as session:
+        result = await session.stream(
+            select(*_REFERENCE_COLUMNS)
+            .where(Product.image_path.is_not(None))
+            .execution_options(yield_per=1000)
+        )
+        async for rows in result.partitions():
+            protected |= _protected_paths(store, rows) & candidates
+    return protected
+
+async def _recheck(store: ImageStore, batch: List[str]) -> Set[str]:
+    """Paths of batch referenced right now, including variants of referenced originals"""
+    stems = _originals(store, batch)
+    conditions = [Product.image_path.like(f"%{stem}%") for stem in stems]
+    conditions += [column.in_(batch) for column in _REFERENCE_COLUMNS]
+    async with async_session() as session:
+        result = await session.execute(select(*_REFERENCE_COLUMNS).where(or_(*conditions)))
+        return _protected_paths(store, result.all()) & set(batch)
+
+async def collect_orphaned_images(
+    store: ImageStore = image_store,
+    grace: float = IMAGE_GC_GRACE,
+    mode: str = IMAGE_GC_MODE,
+    batch_size: int = IMAGE_GC_BATCH_SIZE,
+    batch_delay: float = IMAGE_GC_BATCH_DELAY,
+    quarantine_ttl: float = IMAGE_GC_QUARANTINE_TTL,
+    dry_run: bool = False
+) -> dict:
+    """Delete or quarantine image files no product references, return a report
+
+    mode is "delete" or "quarantine". Quarantined files are moved into
+    images/.quarantine and purged after quarantine_ttl seconds.
+    """
+    await store.load()
+    started = time.time()
+    older_than = started - grace
+    candidates = await asyncio.to_thread(_scan_candidates, store, older_than)
+    referenced = await _referenced(store, set(candidates))
+    orphans = sorted(set(candidates) - referenced)
+
+    report = {
+        "scanned": len(candidates),
+        "referenced": len(referenced),
+        "orphaned": len(orphans),
+        "removed": 0,
+        "quarantined": 0,
+        "skipped": 0,
+        "purged": 0,
+        "bytes_reclaimed": 0,
+        "dry_run": dry_run,
+    }
+    if dry_run:
+        report["bytes_reclaimed"] = sum(candidates[path] for path in orphans)
+        return report
+
+    for start in range(0, len(orphans), batch_size):
+        if start:
+            await asyncio.sleep(batch_delay)
+        batch = orphans[start:start + batch_size]
+        protected = await _recheck(store, batch)
+        batch = [path for path in batch if path not in protected and await asyncio.to_thread(_still_old, path, older_than)]
+        report["skipped"] += len(orphans[start:start + batch_size]) - len(batch)
+        if not batch:
+            continue
+
+        async with async_session() as session:
+            await session.execute(delete(TelegramFile).where(TelegramFile.image_path.in_(batch)))
+            await session.commit()
+        for path in batch:
+            if mode == "quarantine":
+                if await store.quarantine(path):
+                    report["quarantined"] += 1
+            elif await store.delete(path):
+                report["removed"] += 1
+                report["bytes_reclaimed"] += candidates[path]
+
+    expired = await asyncio.to_thread(_expired_quarantine, store, started - quarantine_ttl)
+    for path in expired:
+        if await store.delete(path):
+            report["purged"] += 1
+            report["bytes_reclaimed"] += expired[path]
+
+    report["seconds"] = round(time.time() - started, 3)
+    logger.info("Image GC: %s", report)
+    return report
+
+async def run_image_gc_forever(interval: float = IMAGE_GC_INTERVAL) -> None:
+    """Background reconciler: collect orphaned images every interval seconds"""
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            await collect_orphaned_images()
+        except Exception:
+            logger.exception("Image GC run failed")
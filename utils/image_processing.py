@@ -0,0 +1,71 @@
+"""
+Product image variants.
+
+Uploads are re-encoded into a size-bounded display image, which product views
+send instead of the original, and a small thumbnail. Decoding and resampling
+are CPU-bound, so rendering runs in a process pool and never holds the event
+loop or the GIL of the bot process.
+"""
+import asyncio
+import multiprocessing
+import os
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, Optional, Tuple
+
+from PIL import Image, ImageOps
+
+from config import (
+    IMAGE_DISPLAY_SIZE, IMAGE_THUMB_SIZE, IMAGE_VARIANT_FORMAT, IMAGE_VARIANT_QUALITY, IMAGE_WORKERS
+)
+
+# variant name -> (longest side in pixels, encoder quality)
+VARIANTS: Dict[str, Tuple[int, int]] = {
+    "display": (IMAGE_DISPLAY_SIZE, IMAGE_VARIANT_QUALITY),
+    "thumb": (IMAGE_THUMB_SIZE, IMAGE_VARIANT_QUALITY),
+}
+VARIANT_EXTENSION = ".webp" if IMAGE_VARIANT_FORMAT == "WEBP" else ".jpg"
+
+_pool: Optional[ProcessPoolExecutor] = None
+
+def render_variant(source_path: str, target_path: str, max_side: int, quality: int, image_format: str) -> int:
+    """Write a downscaled copy of source_path to target_path, return its size in bytes"""
+    with Image.open(source_path) as source:
+        image = ImageOps.exif_transpose(source)
+        image.thumbnail((max_side, max_side), Image.Resampling.LANCZOS)
+        if image.mode not in ("RGB", "L"):
+            image = image.convert("RGB")
+
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(target_path), prefix=".", suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                image.save(f, format=image_format, quality=quality, optimize=True)
+            os.replace(tmp_path, target_path)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+    return os.path.getsize(target_path)
+
+def _get_pool() -> ProcessPoolExecutor:
+    global _pool
+    if _pool is None:
+        # spawn: forking a process that already runs threads can deadlock the child
+        _pool = ProcessPoolExecutor(max_workers=IMAGE_WORKERS, mp_context=multiprocessing.get_context("spawn"))
+    return _pool
+
+async def render_variants(source_path: str, targets: Dict[str, str]) -> Dict[str, int]:
+    """Render every variant in targets (name -> path) in the process pool, return sizes"""
+    loop = asyncio.get_running_loop()
+    pool = _get_pool()
+    sizes = await asyncio.gather(*(
+        loop.run_in_executor(pool, render_variant, source_path, target, *VARIANTS[name], IMAGE_VARIANT_FORMAT)
+        for name, target in targets.items()
+    ))
+    return dict(zip(targets, sizes))
+
+def shutdown_image_workers() -> None:
+    """Stop the rendering processes"""
+    global _pool
+    if _pool is not None:
+        _pool.shutdown(wait=True, cancel_futures=True)
+        _pool = None
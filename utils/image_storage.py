@@ -1,12 +1,32 @@
+"""
+Product image storage.
 
+Images are content-addressed: a file is named after the SHA-256 of its bytes,
+so identical uploads share one file. Several products may then reference the
+same path; utils.database.release_images unlinks a file only once no product
+references it any more, and leaves files reused within IMAGE_GC_GRACE to the
+garbage collector.
+"""
+import asyncio
+import hashlib
+import logging
 import os
-import shutil
+import tempfile
 import uuid
-from typing import Optional
+from typing import AsyncIterable, BinaryIO, Dict, NamedTuple, Optional, Set
 from pathlib import Path
 
+from config import IMAGE_MAX_SIZE
+from utils.image_processing import VARIANT_EXTENSION, VARIANTS, render_variants
+
+logger = logging.getLogger(__name__)
+
 # Directory for storing images
 IMAGES_DIR = "images"
+# Resized variants of each image, named after the original (see create_variants)
+VARIANTS_SUBDIR = "variants"
+# Orphans moved aside by the garbage collector (see utils/image_gc.py)
+QUARANTINE_SUBDIR = ".quarantine"
 
 def init_images_directory():
     """Create images directory if it doesn't exist"""
@@ -16,34 +36,285 @@ def generate_image_id() -> str:
     """Generate unique image ID"""
     return str(uuid.uuid4())
 
+def file_sha256(path: str, chunk_size: int = 1024 * 1024) -> str:
+    """Hash a file without loading it into memory"""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        while chunk := f.read(chunk_size):
+            digest.update(chunk)
+    return digest.hexdigest()
+
 def get_image_path(image_id: str, extension: str = "") -> str:
     """Get full path for image file"""
     filename = f"{image_id}{extension}" if extension else image_id
     return os.path.join(IMAGES_DIR, filename)
 
-def save_image(image_data: bytes, extension: str = ".jpg") -> str:
-    """Save image data to file and return image ID"""
-    init_images_directory()
-    image_id = generate_image_id()
-    image_path = get_image_path(image_id, extension)
-    
-    with open(image_path, 'wb') as f:
+def stored_image_path(image_path: str, directory: str = IMAGES_DIR) -> Optional[str]:
+    """image_path as products reference originals (directory/name), None if it names anything else"""
+    full_path = os.path.abspath(image_path)
+    name = os.path.basename(full_path)
+    if os.path.dirname(full_path) != os.path.abspath(directory) or not name or name.startswith("."):
+        return None
+    return os.path.join(directory, name)
+
+def _inside(image_path: str, directory: str) -> bool:
+    directory = os.path.abspath(directory)
+    return os.path.commonpath([os.path.abspath(image_path), directory]) == directory
+
+class ImageTooLarge(ValueError):
+    """Raised when a streamed image exceeds the size limit"""
+
+    def __init__(self, max_size: int):
+        super().__init__(f"Image is larger than {max_size} bytes")
+        self.max_size = max_size
+
+class StoredImage(NamedTuple):
+    path: str
+    sha256: str
+    size: int
+
+def _write_atomic(image_path: str, image_data: bytes) -> None:
+    # Write to a temp file in the same directory and rename it over the target,
+    # so readers never see a partially written image
+    f, tmp_path = _open_temp(os.path.dirname(image_path) or ".")
+    try:
         f.write(image_data)
-    
-    return image_id
+        _commit_temp(f, tmp_path, image_path)
+    except BaseException:
+        _discard_temp(f, tmp_path)
+        raise
+
+def _open_temp(directory: str) -> tuple:
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".", suffix=".tmp")
+    return os.fdopen(fd, "wb"), tmp_path
+
+def _commit_temp(f: BinaryIO, tmp_path: str, image_path: str) -> None:
+    f.flush()
+    os.fsync(f.fileno())
+    f.close()
+    os.replace(tmp_path, image_path)
+
+def _discard_temp(f: BinaryIO, tmp_path: str) -> None:
+    f.close()
+    if os.path.exists(tmp_path):
+        os.unlink(tmp_path)
 
-def delete_image(image_path: str) -> bool:
-    """Delete image file"""
+def _touch(image_path: str) -> bool:
     try:
-        if image_path and os.path.exists(image_path):
-            os.remove(image_path)
+        os.utime(image_path)
+        return True
+    except FileNotFoundError:
+        return False
+
+def _move(source: str, directory: str) -> bool:
+    os.makedirs(directory, exist_ok=True)
+    try:
+        os.replace(source, os.path.join(directory, os.path.basename(source)))
+        return True
+    except FileNotFoundError:
+        return False
+
+def _remove(image_path: str) -> bool:
+    try:
+        os.remove(image_path)
+        return True
+    except FileNotFoundError:
+        return False
+
+def list_image_files(directory: str = IMAGES_DIR) -> Set[str]:
+    """Paths of all stored images, skipping temp files of unfinished writes"""
+    if not os.path.isdir(directory):
+        return set()
+    return {
+        os.path.join(directory, entry.name)
+        for entry in os.scandir(directory)
+        if entry.is_file() and not entry.name.startswith(".")
+    }
+
+class ImageStore:
+    """Non-blocking image storage
+
+    File I/O runs in the default thread pool, so disk latency never stalls the
+    event loop. Paths of stored images are kept in memory, which makes exists()
+    a set lookup on the hot path of product views.
+    """
+
+    def __init__(self, directory: str = IMAGES_DIR):
+        self.directory = directory
+        self.variants_directory = os.path.join(directory, VARIANTS_SUBDIR)
+        self.quarantine_directory = os.path.join(directory, QUARANTINE_SUBDIR)
+        self._paths: Set[str] = set()
+        self._loaded = False
+        self._load_lock = asyncio.Lock()
+
+    async def load(self) -> None:
+        """Create the directory and index the images already in it"""
+        async with self._load_lock:
+            if self._loaded:
+                return
+            await asyncio.to_thread(Path(self.variants_directory).mkdir, parents=True, exist_ok=True)
+            self._paths |= await asyncio.to_thread(list_image_files, self.directory)
+            self._paths |= await asyncio.to_thread(list_image_files, self.variants_directory)
+            self._loaded = True
+
+    def content_path(self, sha256: str, extension: str = ".jpg") -> str:
+        """Path of the image with the given content hash"""
+        return os.path.join(self.directory, f"{sha256}{extension}")
+
+    async def _reuse(self, image_path: str) -> bool:
+        # Refresh mtime of an already stored file so the garbage collector's
+        # grace period covers it again until the new reference is committed
+        if await asyncio.to_thread(_touch, image_path):
+            self._paths.add(image_path)
             return True
+        self._paths.discard(image_path)
         return False
-    except Exception:
+
+    async def save(self, image_data: bytes, extension: str = ".jpg") -> str:
+        """Store image data and return its content-addressed path"""
+        await self.load()
+        image_path = self.content_path(hashlib.sha256(image_data).hexdigest(), extension)
+        if not await self._reuse(image_path):
+            await asyncio.to_thread(_write_atomic, image_path, image_data)
+            self._paths.add(image_path)
+        return image_path
+
+    async def save_stream(
+        self,
+        chunks: AsyncIterable[bytes],
+        extension: str = ".jpg",
+        max_size: int = IMAGE_MAX_SIZE
+    ) -> StoredImage:
+        """Store image from an async stream of chunks
+
+        Only one chunk is held in memory at a time. The SHA-256 is computed while
+        writing, and the download is aborted with ImageTooLarge once it exceeds
+        max_size.
+        """
+        await self.load()
+        digest = hashlib.sha256()
+        size = 0
+        f, tmp_path = await asyncio.to_thread(_open_temp, self.directory)
+        try:
+            async for chunk in chunks:
+                size += len(chunk)
+                if size > max_size:
+                    raise ImageTooLarge(max_size)
+                digest.update(chunk)
+                await asyncio.to_thread(f.write, chunk)
+
+            sha256 = digest.hexdigest()
+            image_path = self.content_path(sha256, extension)
+            if await self._reuse(image_path):
+                # Same bytes are already stored; drop the duplicate
+                await asyncio.to_thread(_discard_temp, f, tmp_path)
+            else:
+                await asyncio.to_thread(_commit_temp, f, tmp_path, image_path)
+                self._paths.add(image_path)
+        except BaseException:
+            await asyncio.to_thread(_discard_temp, f, tmp_path)
+            raise
+        return StoredImage(image_path, sha256, size)
+
+    def variant_paths(self, image_path: str) -> Dict[str, str]:
+        """Paths of the resized variants of an image, whether rendered or not"""
+        stem = os.path.splitext(os.path.basename(image_path))[0]
+        return {
+            name: os.path.join(self.variants_directory, f"{stem}_{name}{VARIANT_EXTENSION}")
+            for name in VARIANTS
+        }
+
+    async def create_variants(self, image_path: str) -> Dict[str, str]:
+        """Render display and thumbnail variants of a stored image
+
+        Returns variant name -> path. A variant that would not be smaller than
+        the original maps to the original itself. Returns an empty dict if the
+        image cannot be decoded, so callers fall back to the original.
+        """
+        await self.load()
+        targets = self.variant_paths(image_path)
+        # Originals are content-addressed, so already rendered variants are current
+        missing = {name: path for name, path in targets.items() if not await self._reuse(path)}
+        try:
+            await render_variants(image_path, missing)
+            original_size = await asyncio.to_thread(os.path.getsize, image_path)
+            sizes = {name: await asyncio.to_thread(os.path.getsize, path) for name, path in targets.items()}
+        except Exception as e:
+            logger.warning("Could not render variants of %s: %s", image_path, e)
+            return {}
+
+        self._paths.update(missing.values())
+        return {
+            name: path if sizes[name] < original_size else image_path
+            for name, path in targets.items()
+        }
+
+    async def delete_variants(self, image_path: str) -> None:
+        """Delete the resized variants of an image"""
+        for path in self.variant_paths(image_path).values():
+            await self.delete(path)
+
+    async def delete(self, image_path: Optional[str]) -> bool:
+        """Delete image file, return whether it existed; files outside the store are never touched"""
+        if not image_path:
+            return False
+        image_path = os.path.normpath(image_path)
+        if not _inside(image_path, self.directory):
+            logger.warning("Not deleting %s: outside the image store %s", image_path, self.directory)
+            return False
+        self._paths.discard(image_path)
+        try:
+            return await asyncio.to_thread(_remove, image_path)
+        except OSError:
+            return False
+
+    async def modified_since(self, image_path: str, since: float) -> bool:
+        """Whether image file was written or reused (see _reuse) after the since timestamp"""
+        try:
+            return (await asyncio.to_thread(os.stat, image_path)).st_mtime >= since
+        except FileNotFoundError:
+            return False
+
+    async def quarantine(self, image_path: str) -> bool:
+        """Move image file into the quarantine directory, return whether it existed"""
+        image_path = os.path.normpath(image_path)
+        if not _inside(image_path, self.directory):
+            logger.warning("Not quarantining %s: outside the image store %s", image_path, self.directory)
+            return False
+        self._paths.discard(image_path)
+        return await asyncio.to_thread(_move, image_path, self.quarantine_directory)
+
+    async def exists(self, image_path: Optional[str]) -> bool:
+        """Check whether image file is stored"""
+        if not image_path:
+            return False
+        await self.load()
+        image_path = os.path.normpath(image_path)
+        if image_path in self._paths:
+            return True
+        # Files written by another process are picked up on first access;
+        # only references to missing files pay for a disk check every time
+        if await asyncio.to_thread(os.path.isfile, image_path):
+            self._paths.add(image_path)
+            return True
         return False
 
+    def contains(self, image_path: Optional[str]) -> bool:
+        """Synchronous index-only variant of exists()"""
+        return bool(image_path) and os.path.normpath(image_path) in self._paths
+
+    async def open(self, image_path: str) -> BinaryIO:
+        """Open stored image for binary reading; the caller closes it"""
+        return await asyncio.to_thread(open, image_path, "rb")
+
+    async def read(self, image_path: str) -> bytes:
+        """Read stored image"""
+        return await asyncio.to_thread(Path(image_path).read_bytes)
+
+image_store = ImageStore()
+
 def get_image_url(image_path: Optional[str]) -> Optional[str]:
     """Get URL for serving image (for web interface)"""
-    if image_path and os.path.exists(image_path):
+    if image_store.contains(image_path):
         return f"/{image_path}"
     return None
@@ -0,0 +1,274 @@
+"""
+Process metrics in the Prometheus text exposition format.
+
+Counters, gauges and histograms live in one registry, and a small aiohttp app
+serves it at /metrics. Work done for the update being handled (DB statements,
+Bot API requests) is attributed through the current_update context variable,
+which middlewares.metrics sets for every update.
+"""
+import collections
+import logging
+import time
+from bisect import bisect_left
+from contextvars import ContextVar
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from aiohttp import web
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+logger = logging.getLogger(__name__)
+
+# Seconds; covers a cached callback (~1 ms) up to a slow photo upload
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _format_labels(labelnames: Tuple[str, ...], values: Tuple[str, ...], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(labelnames, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+def _format_value(value: float) -> str:
+    return str(int(value)) if float(value).is_integer() else repr(value)
+
+class _Metric:
+    type_name = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+
+    def _key(self, labels: Dict[str, str]) -> Tuple[str, ...]:
+        return tuple(str(labels.get(name, "")) for name in self.labelnames)
+
+    def samples(self) -> List[str]:
+        raise NotImplementedError
+
+    def render(self) -> List[str]:
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.type_name}", *self.samples()]
+
+class Counter(_Metric):
+    """Monotonically increasing value per label set"""
+    type_name = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1.0, **labels: str) -> None:
+        key = self._key(labels)
+        self._values[key] = self._values.get(key, 0.0) + amount
+
+    def value(self, **labels: str) -> float:
+        return self._values.get(self._key(labels), 0.0)
+
+    def samples(self) -> List[str]:
+        return [
+            f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}"
+            for key, value in sorted(self._values.items())
+        ]
+
+class Gauge(Counter):
+    """Value per label set that can go up and down"""
+    type_name = "gauge"
+
+    def set(self, value: float, **labels: str) -> None:
+        self._values[self._key(labels)] = value
+
+class Histogram(_Metric):
+    """Bucketed distribution per label set; quantiles are computed by Prometheus"""
+    type_name = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Iterable[str] = (),
+        buckets: Tuple[float, ...] = DEFAULT_BUCKETS
+    ):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # label values -> [per-bucket counts (last one is +Inf), sum]
+        self._series: Dict[Tuple[str, ...], list] = {}
+
+    def observe(self, value: float, **labels: str) -> None:
+        key = self._key(labels)
+        series = self._series.get(key)
+        if series is None:
+            series = self._series[key] = [[0] * (len(self.buckets) + 1), 0.0]
+        series[0][bisect_left(self.buckets, value)] += 1
+        series[1] += value
+
+    def count(self, **labels: str) -> int:
+        series = self._series.get(self._key(labels))
+        return sum(series[0]) if series else 0
+
+    def samples(self) -> List[str]:
+        lines = []
+        for key, (counts, total) in sorted(self._series.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                le = "+Inf" if bound == float("inf") else _format_value(bound)
+                bucket_labels = _format_labels(self.labelnames, key, f'le="{le}"')
+                lines.append(f"{self.name}_bucket{bucket_labels} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labelnames, key)} {_format_value(total)}")
+            lines.append(f"{self.name}_count{_format_labels(self.labelnames, key)} {cumulative}")
+        return lines
+
+class MetricsRegistry:
+    """Named collection of metrics rendered together"""
+
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+
+    def register(self, metric: _Metric) -> _Metric:
+        if metric.name in self._metrics:
+            raise ValueError(f"Metric {metric.name} is already registered")
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, documentation: str, labelnames: Iterable[str] = ()) -> Counter:
+        return self.register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name: str, documentation: str, labelnames: Iterable[str] = ()) -> Gauge:
+        return self.register(Gauge(name, documentation, labelnames))
+
+    def histogram(self, name: str, documentation: str, labelnames: Iterable[str] = (), **kwargs) -> Histogram:
+        return self.register(Histogram(name, documentation, labelnames, **kwargs))
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics.values():
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+registry = MetricsRegistry()
+
+UPDATE_LABELS = ("handler", "update_type")
+UPDATE_DURATION = registry.histogram(
+    "shopbot_update_duration_seconds", "Time spent handling an update", UPDATE_LABELS
+)
+UPDATE_DB_TIME = registry.histogram(
+    "shopbot_update_db_seconds", "Time spent in database statements per update", UPDATE_LABELS
+)
+UPDATE_API_TIME = registry.histogram(
+    "shopbot_update_api_seconds", "Time spent in Bot API requests per update", UPDATE_LABELS
+)
+UPDATE_ERRORS = registry.counter(
+    "shopbot_update_errors_total", "Updates whose handler raised", UPDATE_LABELS
+)
+UPDATE_QUERIES = registry.histogram(
+    "shopbot_update_db_queries", "Database statements executed per update", UPDATE_LABELS,
+    buckets=(0, 1, 2, 3, 5, 8, 13, 21, 34)
+)
+UPDATE_OVER_BUDGET = registry.counter(
+    "shopbot_update_db_budget_exceeded_total", "Updates that executed more statements than DB_QUERY_BUDGET",
+    UPDATE_LABELS
+)
+DB_QUERIES = registry.counter("shopbot_db_queries_total", "Database statements executed")
+DB_TIME = registry.counter("shopbot_db_seconds_total", "Time spent in database statements")
+API_DURATION = registry.histogram(
+    "shopbot_bot_api_request_duration_seconds", "Bot API request latency", ("method",)
+)
+API_ERRORS = registry.counter("shopbot_bot_api_errors_total", "Failed Bot API requests", ("method", "error"))
+SEND_QUEUE_DEPTH = registry.gauge(
+    "shopbot_send_queue_depth", "Bot API requests waiting for a rate limit token", ("priority",)
+)
+SEND_QUEUE_WAIT = registry.histogram(
+    "shopbot_send_queue_wait_seconds", "Time Bot API requests waited for a rate limit token", ("priority",)
+)
+SEND_RETRY_AFTER = registry.counter(
+    "shopbot_bot_api_retry_after_total", "Bot API requests answered with 429 Too Many Requests", ("method",)
+)
+BROADCAST_MESSAGES = registry.counter(
+    "shopbot_broadcast_messages_total", "Broadcast messages by outcome: delivered, blocked or failed", ("result",)
+)
+NAVIGATION_TRANSITIONS = registry.counter(
+    "shopbot_navigation_transitions_total", "Screen changes by how the message was updated", ("transition",)
+)
+
+class UpdateTimings:
+    """Work attributed to the update being handled
+
+    With track_statements, the text of every executed statement is counted
+    too, so statements repeated within one update (N+1 fetches) can be named.
+    """
+    __slots__ = ("handler", "db_time", "db_queries", "api_time", "api_calls", "statements")
+
+    def __init__(self, track_statements: bool = False):
+        self.handler = "unhandled"
+        self.db_time = 0.0
+        self.db_queries = 0
+        self.api_time = 0.0
+        self.api_calls = 0
+        self.statements: Optional[collections.Counter] = collections.Counter() if track_statements else None
+
+    def repeated_statements(self) -> List[Tuple[str, int]]:
+        """Statements executed more than once, most frequent first"""
+        if not self.statements:
+            return []
+        return [(statement, count) for statement, count in self.statements.most_common() if count > 1]
+
+current_update: ContextVar[Optional[UpdateTimings]] = ContextVar("current_update", default=None)
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("query_started", []).append(time.perf_counter())
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    elapsed = time.perf_counter() - conn.info["query_started"].pop()
+    DB_QUERIES.inc()
+    DB_TIME.inc(elapsed)
+    timings = current_update.get()
+    if timings is not None:
+        timings.db_queries += 1
+        timings.db_time += elapsed
+        if timings.statements is not None:
+            timings.statements[statement] += 1
+
+def _handle_error(exception_context):
+    # after_cursor_execute does not fire for failed statements
+    connection = exception_context.connection
+    if connection is not None and connection.info.get("query_started"):
+        connection.info["query_started"].pop()
+
+def instrument_engine(db_engine: AsyncEngine) -> None:
+    """Time every statement executed through db_engine"""
+    sync_engine = db_engine.sync_engine
+    event.listen(sync_engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(sync_engine, "after_cursor_execute", _after_cursor_execute)
+    event.listen(sync_engine, "handle_error", _handle_error)
+
+def record_api_request(method: str, elapsed: float, error: Optional[str] = None) -> None:
+    """Account a finished Bot API request to the metrics and the current update"""
+    API_DURATION.observe(elapsed, method=method)
+    if error:
+        API_ERRORS.inc(method=method, error=error)
+    timings = current_update.get()
+    if timings is not None:
+        timings.api_calls += 1
+        timings.api_time += elapsed
+
+async def _metrics_handler(request: web.Request) -> web.Response:
+    return web.Response(
+        body=registry.render().encode(),
+        headers={"Content-Type": "text/plain; version=0.0.4; charset=utf-8"}
+    )
+
+def create_metrics_app() -> web.Application:
+    """aiohttp application serving the registry at /metrics"""
+    app = web.Application()
+    app.router.add_get("/metrics", _metrics_handler)
+    return app
+
+async def start_metrics_server(host: str, port: int) -> web.AppRunner:
+    """Serve /metrics on host:port until the returned runner is cleaned up"""
+    runner = web.AppRunner(create_metrics_app(), access_log=None)
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    logger.info(f"Metrics endpoint started on {host}:{port}/metrics")
+    return runner
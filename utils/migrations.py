@@ -0,0 +1,100 @@
+"""
+Schema migrations.
+
+Base.metadata.create_all only creates missing tables, so schema changes to
+existing tables (indexes, columns) are applied here. Each migration runs once
+and is recorded in the schema_migrations table; statements are written to be
+idempotent so a fresh database created by create_all passes through them. A
+migration that returns False could not be applied yet, is not recorded and
+runs again on the next start.
+"""
+import logging
+from typing import Awaitable, Callable, List, Optional, Tuple
+
+from sqlalchemy import inspect, text
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.ext.asyncio import AsyncConnection
+
+logger = logging.getLogger(__name__)
+
+Migration = Callable[[AsyncConnection], Awaitable[Optional[bool]]]
+
+# Arbitrary key for the Postgres advisory lock serializing concurrent workers
+_MIGRATION_LOCK_ID = 727368
+
+async def _add_catalog_indexes(conn: AsyncConnection) -> None:
+    # (category_id, id) serves category filtering and keyset pagination alike,
+    # so a separate single-column category_id index would be redundant
+    await conn.execute(text("CREATE INDEX IF NOT EXISTS ix_products_category_id_id ON products (category_id, id)"))
+    await conn.execute(text("CREATE INDEX IF NOT EXISTS ix_categories_name ON categories (name)"))
+
+async def _add_search_indexes(conn: AsyncConnection) -> Optional[bool]:
+    if conn.dialect.name != "postgresql":
+        return
+    try:
+        async with conn.begin_nested():
+            await conn.execute(text("CREATE EXTENSION IF NOT EXISTS pg_trgm"))
+    except DBAPIError as e:
+        # Managed databases may not allow extensions; search then uses the in-process
+        # index, and the indexes are created on the first start after it is installed
+        logger.warning("pg_trgm is not available, skipping trigram indexes: %s", e)
+        return False
+    await conn.execute(text(
+        "CREATE INDEX IF NOT EXISTS ix_products_name_trgm ON products USING gin (name gin_trgm_ops)"
+    ))
+    await conn.execute(text(
+        "CREATE INDEX IF NOT EXISTS ix_products_description_trgm ON products USING gin (description gin_trgm_ops)"
+    ))
+
+async def _add_image_path_index(conn: AsyncConnection) -> None:
+    await conn.execute(text("CREATE INDEX IF NOT EXISTS ix_products_image_path ON products (image_path)"))
+
+async def _add_image_variant_columns(conn: AsyncConnection) -> None:
+    columns = await conn.run_sync(lambda sync_conn: {c["name"] for c in inspect(sync_conn).get_columns("products")})
+    for column in ("display_image_path", "thumb_image_path"):
+        if column not in columns:
+            await conn.execute(text(f"ALTER TABLE products ADD COLUMN {column} VARCHAR(255)"))
+
+async def _add_catalog_revision_row(conn: AsyncConnection) -> None:
+    # The table itself is created by create_all
+    await conn.execute(text(
+        "INSERT INTO catalog_revision (id, revision) SELECT 1, 0 "
+        "WHERE NOT EXISTS (SELECT 1 FROM catalog_revision)"
+    ))
+
+MIGRATIONS: List[Tuple[int, str, Migration]] = [
+    (1, "Catalog indexes for category lookup and pagination", _add_catalog_indexes),
+    (2, "Trigram indexes for product search", _add_search_indexes),
+    (3, "Index on product image paths for reference counting", _add_image_path_index),
+    (4, "Display and thumbnail image variant columns", _add_image_variant_columns),
+    (5, "Catalog revision counter for cache invalidation across processes", _add_catalog_revision_row),
+]
+
+async def run_migrations(conn: AsyncConnection) -> List[int]:
+    """Apply pending migrations inside the caller's transaction, return applied versions"""
+    if conn.dialect.name == "postgresql":
+        await conn.execute(text(f"SELECT pg_advisory_xact_lock({_MIGRATION_LOCK_ID})"))
+
+    await conn.execute(text(
+        "CREATE TABLE IF NOT EXISTS schema_migrations ("
+        "version INTEGER PRIMARY KEY, "
+        "description VARCHAR(255) NOT NULL, "
+        "applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP)"
+    ))
+    result = await conn.execute(text("SELECT version FROM schema_migrations"))
+    applied = {row[0] for row in result}
+
+    newly_applied = []
+    for version, description, migrate in MIGRATIONS:
+        if version in applied:
+            continue
+        logger.info("Applying migration %d: %s", version, description)
+        if await migrate(conn) is False:
+            logger.info("Migration %d is not applicable yet, retrying on the next start", version)
+            continue
+        await conn.execute(
+            text("INSERT INTO schema_migrations (version, description) VALUES (:version, :description)"),
+            {"version": version, "description": description}
+        )
+        newly_applied.append(version)
+    return newly_applied
@@ -0,0 +1,209 @@
+"""
+Edit-in-place navigation.
+
+Callback handlers describe the screen they show as a Screen: text and
+keyboard, optionally with a product photo that the text captions. navigate()
+turns the message whose button was pressed into that screen with the fewest
+Bot API calls Telegram allows:
+
+- text to text: editMessageText, or editMessageReplyMarkup when only the
+  keyboard changes;
+- photo to photo: editMessageCaption when the photo stays, editMessageMedia
+  when it changes;
+- text to photo: a text message cannot get a photo, so the photo is sent
+  below it and, if nothing is left between them, the text message is
+  remembered as its parent;
+- photo to text: a photo cannot lose it either. A photo with a parent is
+  deleted and the parent edited into the screen, or only deleted if the
+  parent shows it already, which is the usual "back" from a product.
+  Otherwise the photo is deleted and the screen sent again, both at once.
+
+A screen the message already shows costs no call at all. What each message
+shows is remembered as digests in FSM storage under its own destiny, so it
+survives state.clear() and is shared by workers using the Redis storage.
+Without a record navigation still works, it only edits more.
+"""
+import asyncio
+import hashlib
+import logging
+from dataclasses import replace
+from typing import Dict, NamedTuple, Optional
+
+from aiogram.exceptions import TelegramBadRequest
+from aiogram.fsm.context import FSMContext
+from aiogram.types import CallbackQuery, InlineKeyboardMarkup, Message
+
+from utils.database import product_photo_path
+from utils.metrics import NAVIGATION_TRANSITIONS
+from utils.telegram_media import answer_product_photo, edit_product_photo
+
+logger = logging.getLogger(__name__)
+
+NAVIGATION_DESTINY = "navigation"
+# Messages per chat whose content is remembered
+HISTORY_SIZE = 20
+# Record of a message navigate() deleted
+DELETED = {"deleted": True}
+
+class Screen(NamedTuple):
+    """What a message shows: text and keyboard, or a product photo captioned with text"""
+    text: str
+    reply_markup: Optional[InlineKeyboardMarkup] = None
+    product: Optional[dict] = None
+    parse_mode: Optional[str] = "HTML"
+
+def _digest(value: str) -> str:
+    return hashlib.blake2s(value.encode(), digest_size=8).hexdigest()
+
+def _record(screen: Screen, parent: Optional[int] = None) -> dict:
+    return {
+        "text": _digest(screen.text),
+        "markup": _digest(screen.reply_markup.model_dump_json(exclude_none=True)) if screen.reply_markup else None,
+        "photo": product_photo_path(screen.product) if screen.product else None,
+        "parent": parent
+    }
+
+def _remember(history: Dict[str, dict], message_id: int, record: dict) -> None:
+    # Most recently shown last, see navigate()
+    history.pop(str(message_id), None)
+    history[str(message_id)] = record
+
+def _is_not_modified(error: TelegramBadRequest) -> bool:
+    return "message is not modified" in error.message
+
+async def _send(message: Message, screen: Screen) -> Message:
+    if screen.product:
+        return await answer_product_photo(
+            message, screen.product, caption=screen.text, reply_markup=screen.reply_markup, parse_mode=screen.parse_mode
+        )
+    return await message.answer(screen.text, reply_markup=screen.reply_markup, parse_mode=screen.parse_mode)
+
+async def _delete(message: Message, history: Dict[str, dict]) -> None:
+    history.pop(str(message.message_id), None)
+    try:
+        await message.delete()
+    except TelegramBadRequest as e:
+        # Messages older than 48 hours cannot be deleted; the new screen is sent anyway
+        logger.warning("Could not delete message %s: %s", message.message_id, e)
+        return
+    _remember(history, message.message_id, DELETED)
+
+def _nothing_between(history: Dict[str, dict], first_id: int, last_id: int) -> bool:
+    """Whether every message between first_id and last_id in a private chat was deleted by navigate()"""
+    between = range(first_id + 1, last_id)
+    return len(between) <= HISTORY_SIZE and all(history.get(str(message_id)) == DELETED for message_id in between)
+
+async def _edit_text(message: Message, message_id: int, screen: Screen, shown: Optional[dict]) -> Optional[str]:
+    """Edit text message message_id in the chat of message into screen; the transition, None if impossible"""
+    wanted = _record(screen)
+    bot, chat_id = message.bot, message.chat.id
+    try:
+        if shown and shown["photo"] is None and shown["text"] == wanted["text"]:
+            if shown["markup"] == wanted["markup"]:
+                return "unchanged"
+            await bot.edit_message_reply_markup(chat_id=chat_id, message_id=message_id, reply_markup=screen.reply_markup)
+            return "edit_markup"
+        await bot.edit_message_text(
+            text=screen.text,
+            chat_id=chat_id,
+            message_id=message_id,
+            parse_mode=screen.parse_mode,
+            reply_markup=screen.reply_markup
+        )
+        return "edit_text"
+    except TelegramBadRequest as e:
+        if _is_not_modified(e):
+            return "unchanged"
+        logger.warning("Could not edit message %s, sending a new one: %s", message_id, e)
+        return None
+
+async def _edit_photo(message: Message, screen: Screen, shown: Optional[dict]) -> Optional[str]:
+    """Edit a media message into a photo screen; the transition, None if impossible"""
+    wanted = _record(screen)
+    same_photo = (
+        shown["photo"] == wanted["photo"] if shown
+        else bool(message.photo) and message.photo[-1].file_id == screen.product.get("image_file_id")
+    )
+    try:
+        if not same_photo:
+            await edit_product_photo(
+                message, screen.product, caption=screen.text, reply_markup=screen.reply_markup, parse_mode=screen.parse_mode
+            )
+            return "edit_media"
+        if shown and shown["text"] == wanted["text"]:
+            if shown["markup"] == wanted["markup"]:
+                return "unchanged"
+            await message.edit_reply_markup(reply_markup=screen.reply_markup)
+            return "edit_markup"
+        await message.edit_caption(caption=screen.text, parse_mode=screen.parse_mode, reply_markup=screen.reply_markup)
+        return "edit_caption"
+    except TelegramBadRequest as e:
+        if _is_not_modified(e):
+            return "unchanged"
+        logger.warning("Could not edit message %s, sending a new one: %s", message.message_id, e)
+        return None
+
+async def _transition(message: Message, screen: Screen, history: Dict[str, dict]) -> str:
+    shown = history.get(str(message.message_id))
+    if shown == DELETED:
+        # A stale record: its button was pressed
+        shown = None
+
+    if message.text is not None:
+        if screen.product is None:
+            transition = await _edit_text(message, message.message_id, screen, shown)
+            if transition:
+                _remember(history, message.message_id, _record(screen))
+                return transition
+            sent = await _send(message, screen)
+            _remember(history, sent.message_id, _record(screen))
+            return "send"
+        # A text message cannot show a photo: the photo goes below it
+        sent = await _send(message, screen)
+        adjacent = _nothing_between(history, message.message_id, sent.message_id)
+        _remember(history, sent.message_id, _record(screen, parent=message.message_id if adjacent else None))
+        return "send_photo"
+
+    if screen.product is not None:
+        transition = await _edit_photo(message, screen, shown)
+        if transition:
+            _remember(history, message.message_id, _record(screen, parent=shown and shown["parent"]))
+            return transition
+        sent, _ = await asyncio.gather(_send(message, screen), _delete(message, history))
+        _remember(history, sent.message_id, _record(screen))
+        return "delete_send"
+
+    # A photo cannot become text
+    parent_id = shown and shown["parent"]
+    if parent_id is not None:
+        # The parent is right above the photo: remove the photo and show the screen there
+        parent = history.get(str(parent_id))
+        _, transition = await asyncio.gather(
+            _delete(message, history), _edit_text(message, parent_id, screen, None if parent == DELETED else parent)
+        )
+        if transition:
+            _remember(history, parent_id, _record(screen))
+            return "delete" if transition == "unchanged" else "delete_edit"
+        sent = await _send(message, screen)
+    else:
+        sent, _ = await asyncio.gather(_send(message, screen), _delete(message, history))
+    _remember(history, sent.message_id, _record(screen))
+    return "delete_send"
+
+async def navigate(callback: CallbackQuery, state: FSMContext, screen: Screen) -> None:
+    """Show screen in place of the message whose button was pressed"""
+    message = callback.message
+    if not isinstance(message, Message):
+        # Too old to be edited or deleted
+        await _send(message, screen)
+        NAVIGATION_TRANSITIONS.inc(transition="send")
+        return
+
+    key = replace(state.key, destiny=NAVIGATION_DESTINY)
+    history = (await state.storage.get_data(key)).get("messages", {})
+    transition = await _transition(message, screen, history)
+    NAVIGATION_TRANSITIONS.inc(transition=transition)
+    # Oldest first: keep the most recent messages
+    for message_id in list(history)[:-HISTORY_SIZE]:
+        del history[message_id]
+    await state.storage.set_data(key, {"messages": history})
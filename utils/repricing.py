@@ -0,0 +1,209 @@
+"""
+Bulk repricing.
+
+An adjustment ("+10%", "-50") is applied to a category or the whole catalog
+with one set-based UPDATE whose SET clause computes the new price in SQL. A
+price list (id and price per row, JSON or CSV as accepted by
+utils.catalog_io) is loaded into a temporary table and applied with one
+UPDATE ... FROM. Both can run as a dry run that only reports the diff.
+Prices that would drop to zero or below are left unchanged and counted.
+The catalog snapshot and the search index are refreshed once on commit.
+"""
+import asyncio
+import re
+from typing import List, Optional, Tuple
+
+from sqlalchemy import Column, Float, Integer, MetaData, Numeric, Table, and_, case, cast, delete, func, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from config import CATALOG_IMPORT_BATCH_SIZE
+from utils.catalog_io import parse_batch, parse_optional_int, parse_price, product_records, upsert
+from utils.database import Product, catalog_changed, db_session
+from utils.search_index import product_index
+from utils.unit_of_work import after_commit, finish
+
+# Products listed in a preview
+PREVIEW_ROWS = 10
+
+_ADJUSTMENT_RE = re.compile(r"^([+-]?)\s*(\d+(?:[.,]\d+)?)\s*(%?)$")
+
+_price_list = Table(
+    "price_list_import",
+    MetaData(),
+    Column("id", Integer, primary_key=True),
+    Column("price", Float, nullable=False),
+    prefixes=["TEMPORARY"]
+)
+
+def parse_adjustment(text: str) -> Tuple[str, float]:
+    """Parse "+10%", "-5 %", "+100" or "-49,90" into ("percent" | "amount", value)"""
+    match = _ADJUSTMENT_RE.match(text.strip().replace(" ", ""))
+    if not match:
+        raise ValueError(f"Не удалось разобрать изменение цены «{text}»")
+    value = float(match[2].replace(",", "."))
+    if match[1] == "-":
+        value = -value
+    if value == 0:
+        raise ValueError("Изменение цены не может быть нулевым")
+    if match[3] and value <= -100:
+        raise ValueError("Скидка должна быть меньше 100%")
+    return ("percent" if match[3] else "amount"), value
+
+def describe_adjustment(mode: str, value: float) -> str:
+    """Human-readable adjustment, e.g. "+10%" or "-50 руб." """
+    return f"{value:+g}%" if mode == "percent" else f"{value:+g} руб."
+
+def _new_price(mode: str, value: float):
+    if mode == "percent":
+        price = Product.price * (1 + value / 100)
+    elif mode == "amount":
+        price = Product.price + value
+    else:
+        raise ValueError(f"Unknown adjustment mode {mode!r}")
+    # round(double precision, int) does not exist in Postgres, round(numeric, int) does
+    return cast(func.round(cast(price, Numeric), 2), Float)
+
+def _scope(category_id: Optional[int]) -> list:
+    return [Product.category_id == category_id] if category_id else []
+
+async def _diff(session: AsyncSession, new_price, where: list, joins=()) -> dict:
+    """Counts, totals and sample rows of a price change before it is applied"""
+    accepted = new_price > 0
+    changed = and_(accepted, new_price != Product.price)
+    totals = select(
+        func.count(),
+        func.coalesce(func.sum(case((changed, 1), else_=0)), 0),
+        func.coalesce(func.sum(case((accepted, 0), else_=1)), 0),
+        func.coalesce(func.sum(Product.price), 0.0),
+        func.coalesce(func.sum(case((accepted, new_price), else_=Product.price)), 0.0)
+    ).select_from(Product)
+    samples = select(Product.id, Product.name, Product.price, new_price).select_from(Product)
+    for table, condition in joins:
+        totals = totals.join(table, condition)
+        samples = samples.join(table, condition)
+    matched, changed_count, rejected, before, after = (await session.execute(totals.where(*where))).one()
+    result = await session.execute(samples.where(*where, changed).order_by(Product.id).limit(PREVIEW_ROWS))
+    return {
+        "matched": matched,
+        "changed": changed_count,
+        "rejected": rejected,
+        "total_before": before,
+        "total_after": after,
+        "samples": [
+            {"id": product_id, "name": name, "old": old, "new": new}
+            for product_id, name, old, new in result
+        ]
+    }
+
+async def _prices_changed(session: AsyncSession) -> None:
+    await catalog_changed(session)
+    # The search index keeps prices too; rebuild it lazily once instead of patching every row
+    after_commit(session, product_index.reset)
+
+async def reprice(
+    mode: str,
+    value: float,
+    category_id: Optional[int] = None,
+    dry_run: bool = False,
+    session: Optional[AsyncSession] = None
+) -> dict:
+    """Adjust prices of a category (or all products) in one UPDATE, return the diff report
+
+    The report has matched/changed/rejected counts, totals before and after,
+    sample rows and "updated", the number of rows written (0 on a dry run).
+    """
+    new_price = _new_price(mode, value)
+    where = _scope(category_id)
+    async with db_session(session) as session:
+        report = await _diff(session, new_price, where)
+        report["updated"] = 0
+        if not dry_run and report["changed"]:
+            result = await session.execute(
+                update(Product)
+                .where(*where, new_price > 0, new_price != Product.price)
+                .values(price=new_price)
+                .execution_options(synchronize_session=False)
+            )
+            report["updated"] = result.rowcount
+            await _prices_changed(session)
+            await finish(session)
+        return report
+
+def _price_row(record) -> dict:
+    if not isinstance(record, dict):
+        raise ValueError("ожидается объект")
+    product_id = parse_optional_int(record.get("id"), "id")
+    if product_id is None:
+        raise ValueError("id: не указан")
+    return {"id": product_id, "price": parse_price(record.get("price"))}
+
+async def apply_price_list(
+    path: str,
+    file_format: Optional[str] = None,
+    dry_run: bool = False,
+    batch_size: int = CATALOG_IMPORT_BATCH_SIZE,
+    session: Optional[AsyncSession] = None
+) -> dict:
+    """Set prices from a price list file by product id, return the diff report
+
+    Besides the reprice() report fields, "unknown" counts ids not in the
+    catalog and "skipped"/"errors" describe rows that could not be parsed.
+    """
+    records = await asyncio.to_thread(product_records, path, file_format)
+    errors: List[str] = []
+    counters = {"read": 0, "skipped": 0}
+    new_price = _price_list.c.price
+
+    async with db_session(session) as session:
+        connection = await session.connection()
+        # SQLite runs DDL outside the transaction, so a failed run may leave the table behind
+        await connection.run_sync(_price_list.create, checkfirst=True)
+        await session.execute(delete(_price_list))
+        while True:
+            batch = await asyncio.to_thread(parse_batch, records, _price_row, batch_size, errors, counters)
+            if not batch:
+                break
+            await upsert(session, _price_list, batch, ("price",))
+
+        listed = await session.scalar(select(func.count()).select_from(_price_list))
+        report = await _diff(session, new_price, [], joins=[(_price_list, _price_list.c.id == Product.id)])
+        report.update({
+            "unknown": listed - report["matched"],
+            "read": counters["read"],
+            "skipped": counters["skipped"],
+            "errors": errors,
+            "updated": 0
+        })
+        if not dry_run and report["changed"]:
+            result = await session.execute(
+                update(Product)
+                .where(Product.id == _price_list.c.id, new_price > 0, new_price != Product.price)
+                .values(price=new_price)
+                .execution_options(synchronize_session=False)
+            )
+            report["updated"] = result.rowcount
+            await _prices_changed(session)
+        await connection.run_sync(_price_list.drop)
+        await finish(session)
+        return report
+
+def format_price_diff(report: dict, dry_run: bool) -> str:
+    """Plain-text summary of a reprice()/apply_price_list() report"""
+    lines = []
+    if "unknown" in report:
+        lines.append(f"Строк в прайс-листе: {report['read']}, пропущено: {report['skipped']}, "
+                     f"неизвестных id: {report['unknown']}")
+        lines.extend(f"⚠️ {error}" for error in report["errors"])
+    lines.append(f"Товаров затронуто: {report['matched']}, цена изменится у {report['changed']}")
+    if report["rejected"]:
+        lines.append(f"Без изменений (цена стала бы ≤ 0): {report['rejected']}")
+    lines.append(f"Сумма цен: {report['total_before']:.2f} → {report['total_after']:.2f} руб.")
+    if report["samples"]:
+        lines.append("")
+        lines.extend(f"• {row['name']}: {row['old']:g} → {row['new']:g}" for row in report["samples"])
+        if report["changed"] > len(report["samples"]):
+            lines.append(f"… и еще {report['changed'] - len(report['samples'])}")
+    if not dry_run:
+        lines.append("")
+        lines.append(f"Обновлено цен: {report['updated']}")
+    return "\n".join(lines)
@@ -0,0 +1,140 @@
+"""
+Product search.
+
+On Postgres with the pg_trgm extension (see migration 2) queries run as
+ILIKE filters served by trigram GIN indexes and are ranked by similarity of
+the product name. Everywhere else the in-process index from
+utils.search_index is used. Result pages are cached per catalog version, so
+repeated queries and inline query scrolling do not hit the backend again.
+"""
+import hashlib
+import logging
+from collections import OrderedDict
+from typing import List, Optional, Tuple
+
+from sqlalchemy import and_, func, or_, select, text
+
+from config import SEARCH_BACKEND, SEARCH_PAGE_SIZE
+from utils.database import Product, async_session, catalog_cache, engine, get_products
+from utils.search_index import product_index, tokenize
+
+logger = logging.getLogger(__name__)
+
+_RESULTS_CACHE_SIZE = 1024
+_QUERY_TOKENS_SIZE = 4096
+
+_backend: Optional[str] = None
+# Result pages of the current catalog version, least recently used first
+_results: "OrderedDict[tuple, Tuple[List[dict], bool]]" = OrderedDict()
+_results_version = -1
+# Callback data is limited to 64 bytes, so result keyboards refer to queries by a short token
+_query_tokens: "OrderedDict[str, str]" = OrderedDict()
+
+
+def normalize_query(query: str) -> str:
+    """Canonical form of a query used for caching"""
+    return " ".join(tokenize(query))
+
+
+def remember_query(query: str) -> str:
+    """Get a short token for query to put into callback data"""
+    token = hashlib.blake2s(query.encode(), digest_size=6).hexdigest()
+    _query_tokens[token] = query
+    _query_tokens.move_to_end(token)
+    if len(_query_tokens) > _QUERY_TOKENS_SIZE:
+        _query_tokens.popitem(last=False)
+    return token
+
+
+def resolve_query(token: str) -> Optional[str]:
+    """Get query by token from remember_query"""
+    return _query_tokens.get(token)
+
+
+async def _resolve_backend() -> str:
+    global _backend
+    if _backend is None:
+        _backend = "memory"
+        if SEARCH_BACKEND != "memory" and engine.dialect.name == "postgresql":
+            async with engine.connect() as conn:
+                installed = await conn.scalar(text("SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm'"))
+            if installed:
+                _backend = "postgres"
+            elif SEARCH_BACKEND == "postgres":
+                logger.warning("pg_trgm is not installed, falling back to the in-process search index")
+        logger.info("Product search backend: %s", _backend)
+    return _backend
+
+
+async def _ensure_index() -> None:
+    # Rebuild if an admin changed the catalog while the snapshot was loading
+    while not product_index.ready:
+        version = catalog_cache.version
+        products = await get_products()
+        if catalog_cache.version == version:
+            product_index.build(products)
+
+
+def _like_pattern(term: str) -> str:
+    escaped = term.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+    return f"%{escaped}%"
+
+
+async def _search_postgres(terms: List[str], offset: int, limit: int) -> Tuple[List[dict], bool]:
+    conditions = [
+        or_(
+            Product.name.ilike(_like_pattern(term), escape="\\"),
+            Product.description.ilike(_like_pattern(term), escape="\\")
+        )
+        for term in terms
+    ]
+    query = (
+        select(Product.id, Product.name, Product.description, Product.price, Product.category_id)
+        .where(and_(*conditions))
+        .order_by(func.similarity(Product.name, " ".join(terms)).desc(), Product.id)
+        .offset(offset)
+        .limit(limit + 1)
+    )
+    async with async_session() as session:
+        result = await session.execute(query)
+        rows = [dict(row) for row in result.mappings()]
+    return rows[:limit], len(rows) > limit
+
+
+async def search_products(query: str, offset: int = 0, limit: int = SEARCH_PAGE_SIZE) -> Tuple[List[dict], bool]:
+    """Search products by name and description
+
+    Returns a page of product dicts (id, name, description, price,
+    category_id) and whether more results follow.
+    """
+    global _results_version
+    normalized = normalize_query(query)
+    if not normalized:
+        return [], False
+
+    backend = await _resolve_backend()
+    await catalog_cache.refresh()
+    version = catalog_cache.version
+    if version != _results_version:
+        _results.clear()
+        _results_version = version
+
+    key = (backend, normalized, offset, limit)
+    cached = _results.get(key)
+    if cached is not None:
+        _results.move_to_end(key)
+        return cached
+
+    if backend == "postgres":
+        page = await _search_postgres(normalized.split(), offset, limit)
+    else:
+        await _ensure_index()
+        page = product_index.search(normalized, offset, limit)
+
+    # Skip pages computed from data that was replaced while we were awaiting it
+    if version != catalog_cache.version or version != _results_version:
+        return page
+    _results[key] = page
+    if len(_results) > _RESULTS_CACHE_SIZE:
+        _results.popitem(last=False)
+    return page
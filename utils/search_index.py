@@ -0,0 +1,132 @@
+"""
+In-process inverted index over product names and descriptions.
+
+Products are tokenized into lowercase words; each word maps to the products
+containing it, and a trigram index over the vocabulary turns substring
+queries ("жидк" -> "жидкость") into a handful of set intersections. The
+index is built lazily from the catalog and then updated incrementally by the
+write helpers in utils.database.
+"""
+import heapq
+import re
+from collections import defaultdict
+from typing import Dict, Iterable, List, Set, Tuple
+
+_TOKEN_RE = re.compile(r"\w+")
+
+
+def tokenize(text: str) -> List[str]:
+    """Split text into normalized search tokens"""
+    return _TOKEN_RE.findall(text.lower().replace("ё", "е"))
+
+
+def _trigrams(token: str) -> Set[str]:
+    return {token[i:i + 3] for i in range(len(token) - 2)}
+
+
+class ProductSearchIndex:
+    """Word index with trigram lookup over the vocabulary"""
+
+    def __init__(self):
+        self.ready = False
+        self._products: Dict[int, dict] = {}
+        self._tokens: Dict[int, Set[str]] = {}
+        self._name_tokens: Dict[int, Set[str]] = {}
+        self._postings: Dict[str, Set[int]] = defaultdict(set)
+        self._vocabulary_trigrams: Dict[str, Set[str]] = defaultdict(set)
+
+    def __len__(self) -> int:
+        return len(self._products)
+
+    def build(self, products: Iterable[dict]) -> None:
+        """Replace the index contents with products"""
+        self.reset()
+        for product in products:
+            self._add(product)
+        self.ready = True
+
+    def reset(self) -> None:
+        """Drop everything; the next search rebuilds the index"""
+        self.ready = False
+        self._products.clear()
+        self._tokens.clear()
+        self._name_tokens.clear()
+        self._postings.clear()
+        self._vocabulary_trigrams.clear()
+
+    def add(self, product: dict) -> None:
+        """Index a new or changed product"""
+        if self.ready:
+            self.remove(product["id"])
+            self._add(product)
+
+    def remove(self, product_id: int) -> None:
+        """Remove a product from the index"""
+        if not self.ready or product_id not in self._products:
+            return
+        del self._products[product_id]
+        del self._name_tokens[product_id]
+        for token in self._tokens.pop(product_id):
+            postings = self._postings[token]
+            postings.discard(product_id)
+            if not postings:
+                del self._postings[token]
+                for trigram in _trigrams(token):
+                    self._vocabulary_trigrams[trigram].discard(token)
+
+    def _add(self, product: dict) -> None:
+        product_id = product["id"]
+        name_tokens = set(tokenize(product["name"]))
+        tokens = name_tokens | set(tokenize(product.get("description") or ""))
+        self._products[product_id] = {
+            "id": product_id,
+            "name": product["name"],
+            "description": product.get("description"),
+            "price": product["price"],
+            "category_id": product.get("category_id")
+        }
+        self._name_tokens[product_id] = name_tokens
+        self._tokens[product_id] = tokens
+        for token in tokens:
+            if token not in self._postings:
+                for trigram in _trigrams(token):
+                    self._vocabulary_trigrams[trigram].add(token)
+            self._postings[token].add(product_id)
+
+    def _matching_tokens(self, term: str) -> Set[str]:
+        """Vocabulary tokens containing term (prefix match for very short terms)"""
+        if len(term) < 3:
+            return {token for token in self._postings if token.startswith(term)}
+        candidate_sets = sorted(
+            (self._vocabulary_trigrams.get(trigram, set()) for trigram in _trigrams(term)),
+            key=len
+        )
+        candidates = set(candidate_sets[0]).intersection(*candidate_sets[1:])
+        return {token for token in candidates if term in token}
+
+    def search(self, query: str, offset: int = 0, limit: int = 10) -> Tuple[List[dict], bool]:
+        """Find products matching every query word, name matches first
+
+        Returns a page of product dicts and whether more results follow.
+        """
+        scores: Dict[int, int] = {}
+        for position, term in enumerate(tokenize(query)):
+            matched = self._matching_tokens(term)
+            product_ids = set().union(*(self._postings[token] for token in matched)) if matched else set()
+            if position == 0:
+                scores = dict.fromkeys(product_ids, 0)
+            else:
+                scores = {product_id: score for product_id, score in scores.items() if product_id in product_ids}
+            for product_id in scores:
+                if not self._name_tokens[product_id].isdisjoint(matched):
+                    scores[product_id] += 1
+            if not scores:
+                break
+
+        # Only the requested page (plus one to detect more results) has to be ordered
+        ranked = heapq.nsmallest(offset + limit + 1, scores, key=lambda product_id: (-scores[product_id], product_id))
+        page = ranked[offset:offset + limit]
+        return [dict(self._products[product_id]) for product_id in page], len(ranked) > offset + limit
+
+
+product_index = ProductSearchIndex()
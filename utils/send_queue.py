@@ -0,0 +1,206 @@
+"""
+Outbound Bot API rate limiting.
+
+Telegram allows a bot about 30 messages per second overall and roughly one
+per second per chat, and answers faster senders with 429 Too Many Requests
+(TelegramRetryAfter). Every request that targets a chat waits in
+SendScheduler until both a global and a per-chat token bucket have a token.
+Waiting requests are granted by priority: interactive replies to the update
+being handled go before bulk traffic such as broadcasts, which sets
+send_priority to Priority.BULK. A chat that is out of tokens does not hold
+up other chats behind it.
+
+When Telegram still answers 429, the chat is paused for retry_after seconds
+and bulk traffic is paused globally for the same time; the request is then
+retried (see middlewares.send_queue). Requests without a chat, such as
+callback answers and getUpdates, are not queued at all.
+"""
+import asyncio
+import time
+from collections import deque
+from contextvars import ContextVar
+from enum import IntEnum
+from typing import Deque, Dict, Optional, Tuple, Union
+
+from utils.metrics import SEND_QUEUE_DEPTH, SEND_QUEUE_WAIT
+
+ChatId = Union[int, str]
+
+class Priority(IntEnum):
+    INTERACTIVE = 0
+    BULK = 1
+
+# Priority of requests made in the current context
+send_priority: ContextVar[Priority] = ContextVar("send_priority", default=Priority.INTERACTIVE)
+
+class TokenBucket:
+    """Token bucket refilled at rate tokens per second up to capacity; rate <= 0 never limits"""
+
+    __slots__ = ("rate", "capacity", "tokens", "updated", "blocked_until")
+
+    def __init__(self, rate: float, capacity: float, now: Optional[float] = None):
+        self.rate = rate
+        self.capacity = max(capacity, 1.0)
+        self.tokens = self.capacity
+        self.updated = time.monotonic() if now is None else now
+        self.blocked_until = 0.0
+
+    def _refill(self, now: float) -> None:
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def delay(self, now: float) -> float:
+        """Seconds until a token is available"""
+        blocked = max(self.blocked_until - now, 0.0)
+        if self.rate <= 0:
+            return blocked
+        self._refill(now)
+        if self.tokens >= 1:
+            return blocked
+        return max(blocked, (1 - self.tokens) / self.rate)
+
+    def take(self, now: float) -> None:
+        if self.rate > 0:
+            self._refill(now)
+            self.tokens -= 1
+
+    def block(self, until: float) -> None:
+        """Hand out no tokens before until"""
+        self.blocked_until = max(self.blocked_until, until)
+
+    def idle(self, now: float) -> bool:
+        """Whether the bucket is back in its initial state and can be forgotten"""
+        if self.blocked_until > now:
+            return False
+        if self.rate > 0:
+            self._refill(now)
+        return self.tokens >= self.capacity
+
+class SendScheduler:
+    """Grant Bot API requests under global and per-chat rate limits, by priority"""
+
+    def __init__(self, global_rate: float, chat_rate: float, chat_burst: float, prune_interval: float = 60.0):
+        # No global bursts: a full bucket would let a second's worth go out at once
+        self._global = TokenBucket(global_rate, 1)
+        self._chat_rate = chat_rate
+        self._chat_burst = chat_burst
+        self._chats: Dict[ChatId, TokenBucket] = {}
+        self._bulk_blocked_until = 0.0
+        self._waiters: Tuple[Deque, ...] = tuple(deque() for _ in Priority)
+        self._wakeup = asyncio.Event()
+        self._worker: Optional[asyncio.Task] = None
+        self._prune_interval = prune_interval
+        self._pruned = time.monotonic()
+
+    def depth(self, priority: Optional[Priority] = None) -> int:
+        """Requests waiting for a token"""
+        if priority is None:
+            return sum(len(waiters) for waiters in self._waiters)
+        return len(self._waiters[priority])
+
+    def _chat(self, chat_id: ChatId, now: float) -> TokenBucket:
+        bucket = self._chats.get(chat_id)
+        if bucket is None:
+            bucket = self._chats[chat_id] = TokenBucket(self._chat_rate, self._chat_burst, now)
+        return bucket
+
+    def _global_delay(self, priority: Priority, now: float) -> float:
+        delay = self._global.delay(now)
+        if priority == Priority.BULK:
+            delay = max(delay, self._bulk_blocked_until - now)
+        return delay
+
+    def _grant(self, chat_id: ChatId, now: float) -> None:
+        self._global.take(now)
+        self._chat(chat_id, now).take(now)
+
+    def _update_depth(self, priority: Priority) -> None:
+        SEND_QUEUE_DEPTH.set(len(self._waiters[priority]), priority=priority.name.lower())
+
+    async def acquire(self, chat_id: ChatId, priority: Priority = Priority.INTERACTIVE) -> None:
+        """Wait until a request to chat_id may be sent"""
+        now = time.monotonic()
+        ahead = any(self._waiters[level] for level in Priority if level <= priority)
+        if not ahead and self._global_delay(priority, now) <= 0 and self._chat(chat_id, now).delay(now) <= 0:
+            self._grant(chat_id, now)
+            self._prune(now)
+            SEND_QUEUE_WAIT.observe(0.0, priority=priority.name.lower())
+            return
+
+        future = asyncio.get_running_loop().create_future()
+        waiter = (chat_id, future)
+        self._waiters[priority].append(waiter)
+        self._update_depth(priority)
+        if self._worker is None or self._worker.done():
+            self._worker = asyncio.create_task(self._run())
+        self._wakeup.set()
+        try:
+            await future
+        except asyncio.CancelledError:
+            if waiter in self._waiters[priority]:
+                self._waiters[priority].remove(waiter)
+                self._update_depth(priority)
+            raise
+        SEND_QUEUE_WAIT.observe(time.monotonic() - now, priority=priority.name.lower())
+
+    def retry_after(self, chat_id: Optional[ChatId], seconds: float) -> None:
+        """Telegram asked to wait: pause the chat, and bulk traffic everywhere"""
+        until = time.monotonic() + seconds
+        if chat_id is not None:
+            self._chat(chat_id, time.monotonic()).block(until)
+        self._bulk_blocked_until = max(self._bulk_blocked_until, until)
+        self._wakeup.set()
+
+    def _dispatch(self, now: float) -> Optional[float]:
+        """Grant every request that may go now, return seconds until the next one could"""
+        next_delay = None
+        for priority in Priority:
+            waiters = self._waiters[priority]
+            global_delay = self._global_delay(priority, now)
+            for waiter in list(waiters):
+                chat_id, future = waiter
+                if future.done():
+                    waiters.remove(waiter)
+                    continue
+                delay = max(global_delay, self._chat(chat_id, now).delay(now))
+                if delay <= 0:
+                    waiters.remove(waiter)
+                    self._grant(chat_id, now)
+                    future.set_result(None)
+                    global_delay = self._global_delay(priority, now)
+                    continue
+                next_delay = delay if next_delay is None else min(next_delay, delay)
+            self._update_depth(priority)
+            if waiters and global_delay > 0:
+                # Lower priorities only get global tokens this one cannot use; look again once there is one
+                next_delay = global_delay if next_delay is None else min(next_delay, global_delay)
+                break
+        return next_delay
+
+    def _prune(self, now: float) -> None:
+        if now - self._pruned < self._prune_interval:
+            return
+        self._pruned = now
+        for chat_id in [chat_id for chat_id, bucket in self._chats.items() if bucket.idle(now)]:
+            del self._chats[chat_id]
+
+    async def _run(self) -> None:
+        while True:
+            self._wakeup.clear()
+            now = time.monotonic()
+            next_delay = self._dispatch(now)
+            self._prune(now)
+            if not self.depth():
+                return
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=next_delay)
+            except asyncio.TimeoutError:
+                pass
+
+    async def close(self) -> None:
+        if self._worker is not None:
+            self._worker.cancel()
+            try:
+                await self._worker
+            except asyncio.CancelledError:
+                pass
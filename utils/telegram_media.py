@@ -0,0 +1,132 @@
+import asyncio
+import logging
+from typing import AsyncIterator, Awaitable, Callable, Optional, Union
+
+from aiogram import Bot
+from aiogram.exceptions import TelegramBadRequest
+from aiogram.types import Document, FSInputFile, InlineKeyboardMarkup, InputMediaPhoto, Message, PhotoSize
+
+from config import IMAGE_MAX_SIZE
+from utils.database import product_photo_path, set_image_file_id
+from utils.image_storage import ImageTooLarge, StoredImage, image_store
+
+logger = logging.getLogger(__name__)
+
+async def _with_product_photo(product: dict, send: Callable[[Union[str, FSInputFile]], Awaitable[Message]]) -> Message:
+    """Call send with the cached file_id of the product photo, or upload it once and cache its file_id
+
+    The display variant is sent when it was rendered, the original otherwise.
+    """
+    file_id = product.get("image_file_id")
+    if file_id:
+        try:
+            return await send(file_id)
+        except TelegramBadRequest as e:
+            logger.warning("Cached file_id for %s was rejected, re-uploading: %s", product["image_path"], e)
+
+    photo_path = product_photo_path(product)
+    if not await image_store.exists(photo_path):
+        photo_path = product["image_path"]
+    sent = await send(FSInputFile(photo_path))
+    if isinstance(sent, Message) and sent.photo:
+        await set_image_file_id(photo_path, sent.photo[-1].file_id)
+    return sent
+
+async def answer_product_photo(
+    message: Message,
+    product: dict,
+    caption: str,
+    reply_markup: Optional[InlineKeyboardMarkup] = None,
+    parse_mode: Optional[str] = "HTML"
+) -> Message:
+    """Send product photo by cached file_id, uploading it from disk only once"""
+    return await _with_product_photo(
+        product,
+        lambda photo: message.answer_photo(photo=photo, caption=caption, reply_markup=reply_markup, parse_mode=parse_mode)
+    )
+
+async def edit_product_photo(
+    message: Message,
+    product: dict,
+    caption: str,
+    reply_markup: Optional[InlineKeyboardMarkup] = None,
+    parse_mode: Optional[str] = "HTML"
+) -> Message:
+    """Replace the media of message with the product photo, like answer_product_photo"""
+    return await _with_product_photo(
+        product,
+        lambda photo: message.edit_media(
+            InputMediaPhoto(media=photo, caption=caption, parse_mode=parse_mode),
+            reply_markup=reply_markup
+        )
+    )
+
+async def _read_local_file(path: str, chunk_size: int) -> AsyncIterator[bytes]:
+    f = await asyncio.to_thread(open, path, "rb")
+    try:
+        while chunk := await asyncio.to_thread(f.read, chunk_size):
+            yield chunk
+    finally:
+        f.close()
+
+def _file_chunks(bot: Bot, file_path: str, chunk_size: int, timeout: int) -> AsyncIterator[bytes]:
+    api = bot.session.api
+    if api.is_local:
+        return _read_local_file(api.wrap_local_file.to_local(file_path), chunk_size)
+    return bot.session.stream_content(
+        url=api.file_url(bot.token, file_path),
+        timeout=timeout,
+        chunk_size=chunk_size,
+        raise_for_status=True
+    )
+
+async def download_photo(
+    bot: Bot,
+    photo: PhotoSize,
+    max_size: int = IMAGE_MAX_SIZE,
+    chunk_size: int = 65536,
+    timeout: int = 60
+) -> StoredImage:
+    """Stream a photo from Telegram into the image store chunk by chunk"""
+    if photo.file_size and photo.file_size > max_size:
+        raise ImageTooLarge(max_size)
+
+    file_info = await bot.get_file(photo.file_id)
+    chunks = _file_chunks(bot, file_info.file_path, chunk_size, timeout)
+    try:
+        return await image_store.save_stream(chunks, ".jpg", max_size=max_size)
+    finally:
+        await chunks.aclose()
+
+class DocumentTooLarge(ValueError):
+    """Raised when a streamed document exceeds the size limit"""
+
+    def __init__(self, max_size: int):
+        super().__init__(f"Document is larger than {max_size} bytes")
+        self.max_size = max_size
+
+async def download_document(
+    bot: Bot,
+    document: Document,
+    path: str,
+    max_size: int,
+    chunk_size: int = 65536,
+    timeout: int = 60
+) -> None:
+    """Stream a document from Telegram into the file at path"""
+    if document.file_size and document.file_size > max_size:
+        raise DocumentTooLarge(max_size)
+
+    file_info = await bot.get_file(document.file_id)
+    chunks = _file_chunks(bot, file_info.file_path, chunk_size, timeout)
+    f = await asyncio.to_thread(open, path, "wb")
+    try:
+        size = 0
+        async for chunk in chunks:
+            size += len(chunk)
+            if size > max_size:
+                raise DocumentTooLarge(max_size)
+            await asyncio.to_thread(f.write, chunk)
+    finally:
+        await asyncio.to_thread(f.close)
+        await chunks.aclose()
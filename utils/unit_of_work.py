@@ -0,0 +1,128 @@
+"""
+Request-scoped database sessions.
+
+While an update is handled, middlewares.database.UnitOfWorkMiddleware makes a
+UnitOfWork current. Database helpers then share its session, which is opened
+on first use, instead of checking out a pool connection each. Their writes
+are only flushed, and the whole update is committed (or rolled back) once at
+the end.
+
+Side effects that must only happen once data is committed, such as cache
+invalidation and file cleanup, are registered with after_commit() and run by
+commit_session() or UnitOfWork.commit().
+
+Write handlers commit the unit of work themselves before reporting success
+(see middlewares/database.py); helpers called after that use sessions of
+their own.
+"""
+import inspect
+from contextlib import asynccontextmanager
+from contextvars import ContextVar
+from typing import AsyncIterator, Callable, List, Optional
+
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+
+# session.info keys
+AFTER_COMMIT = "after_commit"
+OWNS_TRANSACTION = "owns_transaction"
+
+def after_commit(session: AsyncSession, callback: Callable) -> None:
+    """Run callback (sync or async, no arguments) once session commits; duplicates run once"""
+    callbacks: List[Callable] = session.info.setdefault(AFTER_COMMIT, [])
+    if callback not in callbacks:
+        callbacks.append(callback)
+
+def pending_after_commit(session: Optional[AsyncSession], callback: Callable) -> bool:
+    """Whether callback is registered to run when session commits"""
+    return session is not None and callback in session.info.get(AFTER_COMMIT, ())
+
+async def _run_after_commit(session: AsyncSession) -> None:
+    for callback in session.info.pop(AFTER_COMMIT, []):
+        result = callback()
+        if inspect.isawaitable(result):
+            await result
+
+async def commit_session(session: AsyncSession) -> None:
+    """Commit session, then run the callbacks registered with after_commit"""
+    await session.commit()
+    await _run_after_commit(session)
+
+class UnitOfWork:
+    """Lazily opened session shared by all database helpers called for one update"""
+
+    def __init__(self, session_factory: async_sessionmaker):
+        self._session_factory = session_factory
+        self._session: Optional[AsyncSession] = None
+        self.active = True
+
+    @property
+    def opened_session(self) -> Optional[AsyncSession]:
+        """The session if a helper has used it, without opening it"""
+        return self._session
+
+    def session(self) -> AsyncSession:
+        """The shared session, opened on first call"""
+        if self._session is None:
+            self._session = self._session_factory()
+        return self._session
+
+    async def commit(self) -> None:
+        """Commit everything the update wrote and run the after-commit callbacks; later calls do nothing"""
+        if not self.active:
+            return
+        if self._session is None:
+            self.active = False
+            return
+        await self._session.commit()
+        # Callbacks may use the database themselves; give them sessions of their own
+        self.active = False
+        await _run_after_commit(self._session)
+
+    async def rollback(self) -> None:
+        self.active = False
+        if self._session is not None:
+            self._session.info.pop(AFTER_COMMIT, None)
+            await self._session.rollback()
+
+    async def close(self) -> None:
+        self.active = False
+        if self._session is not None:
+            await self._session.close()
+
+current_unit_of_work: ContextVar[Optional[UnitOfWork]] = ContextVar("current_unit_of_work", default=None)
+
+def current_session() -> Optional[AsyncSession]:
+    """Session of the active unit of work if one has been opened"""
+    unit_of_work = current_unit_of_work.get()
+    if unit_of_work is None or not unit_of_work.active:
+        return None
+    return unit_of_work.opened_session
+
+@asynccontextmanager
+async def session_scope(
+    session_factory: async_sessionmaker,
+    session: Optional[AsyncSession] = None
+) -> AsyncIterator[AsyncSession]:
+    """Session for one helper call
+
+    Yields session if given, else the active unit of work's session, else a new
+    session that the helper commits itself (see finish()).
+    """
+    if session is None:
+        unit_of_work = current_unit_of_work.get()
+        if unit_of_work is not None and unit_of_work.active:
+            session = unit_of_work.session()
+    if session is not None:
+        yield session
+        return
+
+    async with session_factory() as session:
+        session.info[OWNS_TRANSACTION] = True
+        yield session
+
+async def finish(session: AsyncSession) -> None:
+    """End a helper's writes: commit a session it owns, only flush a shared one"""
+    if session.info.get(OWNS_TRANSACTION):
+        await commit_session(session)
+    else:
+        await session.flush()
@@ -0,0 +1,96 @@
+"""
+Registry of users who started the bot, the recipients of broadcasts.
+
+start_command only adds the user id to an in-memory buffer. Buffered ids are
+written in one INSERT ... ON CONFLICT statement every USER_REGISTRY_FLUSH_INTERVAL
+seconds, or as soon as USER_REGISTRY_BATCH_SIZE are waiting, so a wave of
+/start commands costs a few statements instead of one transaction each. Ids
+already written are remembered and not written again; a user found to have
+blocked the bot is forgotten, so their next /start clears the flag.
+"""
+import asyncio
+import contextvars
+import logging
+from typing import Optional, Set
+
+from config import USER_REGISTRY_BATCH_SIZE, USER_REGISTRY_FLUSH_INTERVAL
+from utils.database import BotUser, async_session, dialect_insert
+
+logger = logging.getLogger(__name__)
+
+class UserRegistry:
+    """Record bot users with batched, deduplicated writes"""
+
+    def __init__(self, flush_interval: float, batch_size: int, max_known: int = 100000):
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        # Bounds memory only: forgetting known ids costs a redundant no-op write
+        self.max_known = max_known
+        self._known: Set[int] = set()
+        self._pending: Set[int] = set()
+        self._full = asyncio.Event()
+        self._flush_task: Optional[asyncio.Task] = None
+        self._lock = asyncio.Lock()
+
+    def remember(self, user_id: int) -> None:
+        """Record user_id with the next batch unless it is already recorded"""
+        if user_id in self._known or user_id in self._pending:
+            return
+        self._pending.add(user_id)
+        if len(self._pending) >= self.batch_size:
+            self._full.set()
+        if self._flush_task is None or self._flush_task.done():
+            # Not part of the update that happened to schedule it (session, metrics)
+            self._flush_task = asyncio.create_task(self._flush_later(), context=contextvars.Context())
+
+    def forget(self, user_id: int) -> None:
+        """Write user_id again on their next /start, e.g. after they blocked the bot"""
+        self._known.discard(user_id)
+
+    async def _flush_later(self) -> None:
+        try:
+            await asyncio.wait_for(self._full.wait(), timeout=self.flush_interval)
+        except asyncio.TimeoutError:
+            pass
+        self._full.clear()
+        await self.flush()
+
+    async def flush(self) -> None:
+        """Write buffered users in batches"""
+        async with self._lock:
+            while self._pending:
+                batch, self._pending = self._pending, set()
+                try:
+                    await self._write(batch)
+                except Exception:
+                    logger.exception("Failed to record %d users", len(batch))
+                    # Keep them for the next flush
+                    self._pending |= batch
+                    return
+                if len(self._known) + len(batch) > self.max_known:
+                    self._known.clear()
+                self._known |= batch
+
+    async def _write(self, user_ids: Set[int]) -> None:
+        async with async_session() as session:
+            stmt = dialect_insert(session, BotUser.__table__)
+            # New users are added, known ones left alone unless they had blocked the bot
+            stmt = stmt.on_conflict_do_update(
+                index_elements=[BotUser.user_id],
+                set_={"blocked": False},
+                where=BotUser.blocked
+            )
+            ids = sorted(user_ids)
+            for start in range(0, len(ids), self.batch_size):
+                await session.execute(stmt, [{"user_id": user_id} for user_id in ids[start:start + self.batch_size]])
+            await session.commit()
+
+    async def close(self) -> None:
+        """Write what is still buffered"""
+        if self._flush_task is not None and not self._flush_task.done():
+            # Not cancelled: that could interrupt a write in progress
+            self._full.set()
+            await self._flush_task
+        await self.flush()
+
+user_registry = UserRegistry(USER_REGISTRY_FLUSH_INTERVAL, USER_REGISTRY_BATCH_SIZE)
@@ -0,0 +1,103 @@
+"""
+Webhook update receiver.
+
+Telegram (or any stand-in client) POSTs updates to the configured path; each
+update is validated against the secret token and handed to dp.feed_update in a
+background task. A semaphore bounds the number of updates processed at once:
+when it is exhausted the request waits, which pushes back on the sender instead
+of piling up tasks. On shutdown new updates are refused and in-flight handlers
+are given a grace period to finish.
+"""
+import asyncio
+import hmac
+import logging
+from typing import Any, Optional, Set
+
+from aiohttp import web
+from aiogram import Bot, Dispatcher
+from aiogram.types import Update
+
+logger = logging.getLogger(__name__)
+
+SECRET_TOKEN_HEADER = "X-Telegram-Bot-Api-Secret-Token"
+
+
+class WebhookUpdateHandler:
+    """aiohttp handler that feeds webhook updates into the dispatcher"""
+
+    def __init__(
+        self,
+        dispatcher: Dispatcher,
+        bot: Bot,
+        secret_token: Optional[str] = None,
+        max_concurrent_updates: int = 100,
+        drain_timeout: float = 10.0,
+        **data: Any
+    ):
+        self.dispatcher = dispatcher
+        self.bot = bot
+        self.secret_token = secret_token
+        self.drain_timeout = drain_timeout
+        self.data = data
+        self._semaphore = asyncio.Semaphore(max_concurrent_updates)
+        self._tasks: Set[asyncio.Task] = set()
+        self._closing = False
+
+    @property
+    def in_flight(self) -> int:
+        """Number of updates currently being processed"""
+        return len(self._tasks)
+
+    def register(self, app: web.Application, path: str) -> None:
+        """Mount the handler on app and drain it when the app shuts down"""
+        app.router.add_post(path, self.handle)
+        app.on_shutdown.append(self._on_shutdown)
+
+    def _verify_secret(self, request: web.Request) -> bool:
+        if not self.secret_token:
+            return True
+        received = request.headers.get(SECRET_TOKEN_HEADER, "")
+        return hmac.compare_digest(received, self.secret_token)
+
+    async def handle(self, request: web.Request) -> web.Response:
+        if not self._verify_secret(request):
+            return web.Response(status=401, text="Unauthorized")
+        if self._closing:
+            return web.Response(status=503, text="Shutting down")
+
+        try:
+            update = Update.model_validate(await request.json(), context={"bot": self.bot})
+        except Exception as e:
+            logger.warning("Rejected malformed webhook update: %s", e)
+            return web.Response(status=400, text="Bad update")
+
+        await self._semaphore.acquire()
+        task = asyncio.create_task(self._process(update))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return web.Response()
+
+    async def _process(self, update: Update) -> None:
+        try:
+            await self.dispatcher.feed_update(self.bot, update, **self.data)
+        except Exception:
+            logger.exception("Failed to process update %s", update.update_id)
+        finally:
+            self._semaphore.release()
+
+    async def drain(self) -> None:
+        """Stop accepting updates and wait for in-flight handlers to finish"""
+        self._closing = True
+        if not self._tasks:
+            return
+
+        logger.info("Draining %d in-flight updates...", len(self._tasks))
+        done, pending = await asyncio.wait(set(self._tasks), timeout=self.drain_timeout)
+        if pending:
+            logger.warning("Cancelling %d updates still running after %.1fs", len(pending), self.drain_timeout)
+            for task in pending:
+                task.cancel()
+            await asyncio.gather(*pending, return_exceptions=True)
+
+    async def _on_shutdown(self, app: web.Application) -> None:
+        await self.drain()